@@ -1,2 +1,3 @@
 from .supervised import Supervised
-from .superpixel import Superpixels
\ No newline at end of file
+from .superpixel import Superpixels
+from .unsupervised import Unsupervised
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from typing import List
+
+
+class Accuracy:
+    """ Accuracy measures of a classification from its confusion matrix with shape (observed, predicted) """
+    def __init__(self, confusion_matrix: np.ndarray, classes: List):
+
+        self.confusion_matrix = confusion_matrix
+        self.classes = classes
+
+    def __repr__(self) -> str:
+
+        return f'Accuracy - Overall: {self.overall:.3f} | Kappa: {self.kappa:.3f} | Samples: {self.total}'
+
+    @classmethod
+    def from_labels(cls, truth: np.ndarray, predicted: np.ndarray, classes: List) -> "Accuracy":
+        """ Count (truth, predicted) pairs with a single bincount, ignoring pixels outside 0 <= value < len(classes) """
+
+        class_count = len(classes)
+        valid = (truth >= 0) & (truth < class_count) & (predicted >= 0) & (predicted < class_count)
+        codes = truth[valid].astype(np.int64) * class_count + predicted[valid].astype(np.int64)
+
+        return cls(np.bincount(codes, minlength=class_count ** 2).reshape(class_count, class_count), classes)
+
+    def __add__(self, other: "Accuracy") -> "Accuracy":
+
+        return Accuracy(self.confusion_matrix + other.confusion_matrix, self.classes)
+
+    @property
+    def total(self) -> int:
+
+        return int(self.confusion_matrix.sum())
+
+    @property
+    def overall(self) -> float:
+
+        return np.trace(self.confusion_matrix) / self.total if self.total else np.nan
+
+    @property
+    def producers_accuracy(self) -> np.ndarray:
+        """ Per-class recall: correctly predicted over observed """
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self.confusion_matrix) / self.confusion_matrix.sum(axis=1)
+
+    @property
+    def users_accuracy(self) -> np.ndarray:
+        """ Per-class precision: correctly predicted over predicted """
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self.confusion_matrix) / self.confusion_matrix.sum(axis=0)
+
+    @property
+    def kappa(self) -> float:
+        """ Cohen's kappa """
+
+        if not self.total:
+            return np.nan
+        expected = (self.confusion_matrix.sum(axis=0) * self.confusion_matrix.sum(axis=1)).sum() / self.total ** 2
+
+        return (self.overall - expected) / (1 - expected) if expected != 1 else np.nan
+
+    @property
+    def per_class(self) -> pd.DataFrame:
+
+        return pd.DataFrame({
+            'observed': self.confusion_matrix.sum(axis=1),
+            'predicted': self.confusion_matrix.sum(axis=0),
+            'producers_accuracy': self.producers_accuracy,
+            'users_accuracy': self.users_accuracy
+        }, index=self.classes)
@@ -1,21 +1,31 @@
 import numpy as np
-from geopandas import GeoDataFrame
+import geopandas as gpd
+import pandas as pd
+from geopandas import GeoDataFrame, GeoSeries
 from skimage.segmentation import slic
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
 from eopy.tools import gis
-from eopy.geometry import GeoPolygon
 from eopy.image import Geotransform, Image
 
 
 class Superpixels:
-    """ A class to segment an image into superpixels for classification """
-    def __init__(self, gdf: GeoDataFrame, geo_transform: Geotransform, epsg: int, number_of_features: int):
+    """ A class to segment an image into superpixels for classification
+    The SLIC label raster is the primary representation, polygons are only built when they are needed
+    """
+    def __init__(self, segments: np.ndarray, table: pd.DataFrame, geo_transform: Geotransform, epsg: int, number_of_features: int):
 
-        self.gdf = gdf
+        self.segments = segments
+        self.table = table
         self.geo_transform = geo_transform
         self.epsg = epsg
         self.number_of_features = number_of_features
+        self._geographic = False
+        self._polygons = None
+
+    def __repr__(self) -> str:
+
+        return f'Superpixels - Segments: {len(self.table)} | Features: {self.number_of_features}'
 
     @classmethod
     def segment_image(
@@ -27,8 +37,7 @@ class Superpixels:
             sigma: int = 0,
             enforce_connectivity: bool = True) -> "Superpixels":
 
-        pixels = image.pixels
-        pixels[np.isnan(pixels)] = 0.
+        pixels = np.nan_to_num(image.pixels.astype(float))
 
         if image.band_count == 1:
             pixels = np.dstack((pixels, pixels, pixels))
@@ -36,35 +45,80 @@ class Superpixels:
         segments = slic(pixels, n_segments=n_segments, compactness=compactness, sigma=sigma,
                         enforce_connectivity=enforce_connectivity, start_label=1)
 
-        superpixel_list = []
-        for i in range(1, segments.max() + 1):
-            segment = segments == i
-            superpixel_list.append(gis.vectorise_image(segment, levels=[0.9, 1.1]).iloc[0].geom)
+        table = pd.DataFrame(index=pd.RangeIndex(1, segments.max() + 1, name='segment'))
+        if extract_values:
+            means = cls.segment_means(segments, image.pixels)
+            table['features'] = list(means[:, 0]) if image.band_count == 1 else list(means)
 
-        gdf = GeoDataFrame(geometry=superpixel_list)
+        return Superpixels(segments, table, image.geotransform, image.epsg, number_of_features=image.band_count)
 
-        image.pixels = np.copy(image.pixels).astype(float)
-        if extract_values:
-            if image.band_count == 1:
-                gdf['features'] = gdf.geometry.apply(lambda x: np.nanmean(image.clip_with(GeoPolygon(x, epsg=image.epsg)).pixels))
-            else:
-                gdf['features'] = gdf.geometry.apply(lambda x: np.nanmean(image.clip_with(GeoPolygon(x, epsg=image.epsg)).pixels, axis=(0, 1)))
+    @staticmethod
+    def segment_means(segments: np.ndarray, pixels: np.ndarray) -> np.ndarray:
+        """ NaN-aware mean of every band for each label in one pass, shape (labels, bands) """
+
+        labels = segments.ravel()
+        values = pixels.reshape(labels.size, -1).astype(float)
+        valid = ~np.isnan(values)
+        length = segments.max() + 1
+
+        sums = np.stack([np.bincount(labels, weights=np.where(valid[:, b], values[:, b], 0.), minlength=length)
+                         for b in range(values.shape[1])], axis=1)
+        counts = np.stack([np.bincount(labels, weights=valid[:, b], minlength=length)
+                           for b in range(values.shape[1])], axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (sums / counts)[1:]
+
+    @property
+    def gdf(self) -> GeoDataFrame:
+        """ Segment table with polygons, which are traced from the label raster on first access """
+
+        if self._polygons is None:
+            geo_transform = self.geo_transform if self._geographic else None
+            polygons = gis.polygonise(self.segments, geo_transform, self.epsg if self._geographic else None)
+            self._polygons = GeoSeries(polygons.geometry.values, index=polygons['value'].values, crs=polygons.crs)
 
-        return Superpixels(gdf, image.geotransform, image.epsg, number_of_features=image.band_count)
+        return GeoDataFrame(self.table, geometry=self._polygons.reindex(self.table.index))
 
-    def cluster(self, n_clusters: int = 2):
+    def cluster(self, n_clusters: int = 2, mini_batch_threshold: int = 10000):
+        """ K-means clustering of the segment features, mini-batch once there are more than mini_batch_threshold segments """
 
-        if self.number_of_features == 1:
-            features = [[feature] for feature in self.gdf.features.tolist()]
+        features = np.vstack(self.table.features.tolist()).reshape(len(self.table), -1)
+        features = np.nan_to_num(features)
+
+        if len(features) > mini_batch_threshold:
+            model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=3)
         else:
-            features = self.gdf.features.tolist()
-        self.gdf['cluster'] = KMeans(n_clusters=n_clusters).fit_predict(features)
+            model = KMeans(n_clusters=n_clusters)
+        self.table['cluster'] = model.fit_predict(features)
 
     def save(self, filename: str, driver: str = 'GeoJSON'):
+        """ Write the segment polygons with one float32 column per feature band, driver='Parquet' writes GeoParquet """
+
+        if driver == 'Parquet':
+            gis.write_parquet(self.gdf, filename)
+        else:
+            gis.expand_features(self.gdf).to_file(filename, driver=driver)
+
+    @staticmethod
+    def read_table(filename: str) -> GeoDataFrame:
+        """ Read a saved segment table, with the band columns gathered back into a features column """
+
+        if filename.endswith('.parquet'):
+            return gis.read_parquet(filename)
 
-        gdf = self.gdf.drop('geometry', axis=1)
-        gdf.to_file(filename, driver=driver)
+        return gis.collapse_features(gpd.read_file(filename))
 
     def project_to_geographic(self):
-        self.gdf['geographic'] = self.gdf.geometry.apply(lambda x: x.to_world(self.geo_transform))
-        self.gdf = self.gdf.set_geometry('geographic')
+
+        if not self._geographic:
+            self._geographic = True
+            self._polygons = None
+
+    def to_image(self, column: str = 'cluster') -> Image:
+        """ Paint a table column back onto the label raster """
+
+        lookup = np.zeros(self.segments.max() + 1, dtype=self.table[column].dtype)
+        lookup[self.table.index.values] = self.table[column].values
+
+        return Image(lookup[self.segments], self.geo_transform, self.epsg)
@@ -1,99 +1,340 @@
+import hashlib
+import os
+import zipfile
 import geopandas as gpd
+import joblib
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image as PILImage
-from PIL import ImageDraw
-from sklearn import metrics
-from typing import List
+import pandas as pd
+from shapely.affinity import translate
+from shapely.geometry import box
+from typing import List, Optional, Tuple
 from sklearn.ensemble import RandomForestClassifier
 
+from eopy.classify.accuracy import Accuracy
+from eopy.classify.tiles import classify_tiles, NO_DATA_CLASS
 from eopy.image import Image
 from eopy.geometry import GeoPolygon
+from eopy.tools import gis
+
+SHAPEFILE_SIDECARS = ('.shx', '.dbf', '.prj', '.cpg')
 
 
 class Supervised:
 
     def __init__(
             self,
-            image: Image,
+            image: Optional[Image],
             epsg: int,
-            vector_filepath: str,
+            vector_filepath: Optional[str],
             label_name: str = 'class',
             model=RandomForestClassifier,
-            estimators: int = 100):
+            estimators: int = 100,
+            max_samples_per_class: Optional[int] = None,
+            sampling: str = 'random',
+            random_state: Optional[int] = None,
+            cache_directory: Optional[str] = None):
+        """ Training vectors are read and features extracted lazily, on first use
+        With a cache_directory extracted features are stored on disk and reused for the same image, vectors and sampling
+        """
 
         self.image = image
-        self.vectors = self._gather_data(vector_filepath, epsg)
+        self.epsg = epsg
+        self.vector_filepath = vector_filepath
         self.label_name = label_name
         self.model = model(estimators)
+        self.cache_directory = cache_directory
+        self.band_count = image.band_count if image is not None else None
         self.trained = False
+        self._sampling = (max_samples_per_class, sampling, random_state)
+        self._vectors = None
+        self._classes = None
+        self._training_data = None
 
-    def _gather_data(self, vector_filepath: str, epsg: int) -> gpd.GeoDataFrame:
+    @classmethod
+    def load_model(cls, file_path: str) -> "Supervised":
+        """ Load a model saved with save_model, ready for apply_model """
 
-        gdf = gpd.read_file(vector_filepath)
-        gdf['pixel_polygon'] = gdf.geometry.apply(lambda x: GeoPolygon(x, epsg).to_pixel(self.image.geotransform))
-        gdf['features'] = gdf.pixel_polygon.apply(lambda x: self._extract_features(x))
-        gdf = gdf.set_geometry('pixel_polygon')
+        state = joblib.load(file_path)
 
-        return gdf
+        supervised = cls(image=None, epsg=state['epsg'], vector_filepath=None, label_name=state['label_name'])
+        supervised.model = state['model']
+        supervised.band_count = state['band_count']
+        supervised._classes = state['classes']
+        supervised.trained = True
 
-    def _extract_features(self, polygon: GeoPolygon) -> np.ndarray:
+        return supervised
 
-        clipped_image = self.image.clip_with(polygon)
-        features = clipped_image.pixels.reshape((clipped_image.width * clipped_image.height, clipped_image.band_count))
-        clean_features = np.array([feature for feature in features if not np.isnan(feature.min())])
+    def save_model(self, file_path: str):
+        """ Save the fitted estimator with its class mapping and band metadata """
 
-        return clean_features
+        if not self.trained:
+            raise UserWarning("Model needs to be trained before it can be saved.")
 
-    def train_model(self):
-        """ Train the model """
-        labels, features = [], []
+        joblib.dump({
+            'model': self.model,
+            'classes': self.classes,
+            'label_name': self.label_name,
+            'band_count': self.band_count,
+            'epsg': self.epsg
+        }, file_path)
+
+    @property
+    def vectors(self) -> gpd.GeoDataFrame:
+
+        if self._vectors is None:
+            if not self.vector_filepath or self.image is None:
+                raise UserWarning("An image and training vectors are needed to extract training data.")
+            self._vectors = self._gather_data(self.vector_filepath, self.epsg)
+
+        return self._vectors
+
+    @property
+    def classes(self) -> List:
+
+        if self._classes is None:
+            self._classes = self.vectors[self.label_name].unique().tolist()
+
+        return self._classes
+
+    @property
+    def features(self) -> np.ndarray:
+
+        return self._load_training_data()[0]
+
+    @property
+    def labels(self) -> np.ndarray:
+
+        return self._load_training_data()[1]
+
+    def _load_training_data(self) -> Tuple[np.ndarray, np.ndarray]:
+
+        if self._training_data is None:
+            cache_path = self._cache_path() if self.cache_directory else None
+
+            cached = self._read_cache(cache_path) if cache_path else None
+            if cached is not None:
+                features, labels, self._classes = cached
+                self._training_data = features, labels
+            else:
+                self._training_data = self._extract_features(*self._sampling)
+                if cache_path:
+                    # written to a temporary file and renamed, so an interrupted run never leaves a partial cache file
+                    os.makedirs(self.cache_directory, exist_ok=True)
+                    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+                    with open(temporary_path, 'wb') as cache_file:
+                        np.savez(cache_file, features=self._training_data[0], labels=self._training_data[1],
+                                 classes=np.array(self.classes, dtype=object))
+                    os.replace(temporary_path, cache_path)
+
+        return self._training_data
+
+    @staticmethod
+    def _read_cache(cache_path: str) -> Optional[Tuple[np.ndarray, np.ndarray, list]]:
+        """ Features, labels and classes of a cache file, None if it is missing or unreadable """
+
+        try:
+            with np.load(cache_path, allow_pickle=True) as cached:
+                return cached['features'], cached['labels'], cached['classes'].tolist()
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def _cache_path(self) -> str:
+        """ Cache file keyed by image identity, vector file contents, label column and sampling """
+
+        key = hashlib.sha1()
+        key.update(self.image.checksum().encode())
+        for file_path in self._vector_files(self.vector_filepath):
+            with open(file_path, 'rb') as vector_file:
+                for chunk in iter(lambda: vector_file.read(1 << 20), b''):
+                    key.update(chunk)
+        key.update(repr((self.label_name, self.epsg, self._sampling)).encode())
+
+        return os.path.join(self.cache_directory, f'features_{key.hexdigest()}.npz')
+
+    @staticmethod
+    def _vector_files(vector_filepath: str) -> List[str]:
+        """ The vector file and, for a shapefile, those of its sidecar files which exist """
+
+        stem, extension = os.path.splitext(vector_filepath)
+        if extension.lower() != '.shp':
+            return [vector_filepath]
+
+        return [vector_filepath] + [stem + sidecar for sidecar in SHAPEFILE_SIDECARS if os.path.exists(stem + sidecar)]
 
-        for c in self.vectors[self.label_name].unique():
-            all_features = np.vstack(self.vectors.loc[self.vectors[self.label_name] == c].features.tolist())
+    def save_vectors(self, file_path: str):
+        """ Write the training vectors as GeoParquet with their world geometry and CRS, pixel polygons are rebuilt on load """
 
-            features.extend(all_features)
-            class_value = self.vectors[self.label_name].unique().tolist().index(c)
-            labels.extend([class_value] * len(all_features))
+        world = self.vectors.set_geometry('geometry').drop(columns='pixel_polygon')
+        gis.write_parquet(world, file_path)
 
-        self.model.fit(features, labels)
+    def save_training_data(self, file_path: str):
+        """ Write the extracted training samples as Parquet, one float32 column per band and a label column """
+
+        table = pd.DataFrame({self.label_name: np.array(self.classes, dtype=object)[self.labels]})
+        table['features'] = list(self.features)
+
+        gis.write_parquet(table, file_path)
+
+    def load_training_data(self, file_path: str):
+        """ Use training samples written by save_training_data instead of extracting them from the image """
+
+        table = gis.read_parquet(file_path)
+        labels = table[self.label_name].to_numpy()
+
+        self._classes = list(dict.fromkeys(labels.tolist()))
+        self._training_data = np.stack(table['features'].to_numpy()), np.array([self._classes.index(c) for c in labels])
+        self.band_count = self._training_data[0].shape[1]
+
+    def _gather_data(self, vector_filepath: str, epsg: int) -> gpd.GeoDataFrame:
+        """ Read training vectors, keeping the world geometry as 'geometry' and adding their pixel polygons as the active geometry """
+
+        gdf = gpd.read_parquet(vector_filepath) if vector_filepath.endswith('.parquet') else gpd.read_file(vector_filepath)
+        if 'pixel_polygon' in gdf.columns:
+            gdf = gdf.set_geometry('geometry').drop(columns='pixel_polygon')
+        gdf = gdf.rename_geometry('geometry') if gdf.geometry.name != 'geometry' else gdf
+        if gdf.crs is None:
+            gdf = gdf.set_crs(epsg=epsg)
+
+        gdf['pixel_polygon'] = gpd.GeoSeries(
+            [GeoPolygon(x, epsg).to_pixel(self.image.geotransform).polygon for x in gdf.geometry], index=gdf.index)
+
+        return gdf.set_geometry('pixel_polygon')
+
+    def _extract_features(
+            self,
+            max_samples_per_class: Optional[int] = None,
+            sampling: str = 'random',
+            random_state: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ Gather training pixels for every polygon at once from a raster of polygon ids
+        max_samples_per_class caps the samples of each class, either at random over all its pixels
+        or stratified so every polygon of the class contributes an equal share
+        """
+
+        if sampling not in ('random', 'stratified'):
+            raise UserWarning(f'Unrecognised sampling: {sampling}')
+
+        polygon_ids = gis.rasterise(self.vectors.geometry, np.arange(1, len(self.vectors) + 1), (self.image.height, self.image.width))
+        polygon_classes = np.concatenate([[-1], self.vectors[self.label_name].map(self.classes.index).values])
+
+        pixels = self.image.pixels.reshape(-1, self.image.band_count)
+        ids = polygon_ids.ravel()
+        inside = ids > 0
+        if np.issubdtype(pixels.dtype, np.floating):
+            inside &= ~np.isnan(pixels).any(axis=1)
+
+        indices = np.flatnonzero(inside)
+        labels = polygon_classes[ids[indices]]
+
+        if max_samples_per_class:
+            rng = np.random.default_rng(random_state)
+            keep = []
+            for class_value in range(len(self.classes)):
+                class_indices = np.flatnonzero(labels == class_value)
+                if sampling == 'random':
+                    keep.append(self._sample(class_indices, max_samples_per_class, rng))
+                else:
+                    class_ids = ids[indices[class_indices]]
+                    unique_ids = np.unique(class_ids)
+                    share = max(max_samples_per_class // max(len(unique_ids), 1), 1)
+                    keep.extend(self._sample(class_indices[class_ids == i], share, rng) for i in unique_ids)
+            indices = indices[np.sort(np.concatenate(keep))] if keep else indices[:0]
+            labels = polygon_classes[ids[indices]]
+
+        return pixels[indices], labels
+
+    @staticmethod
+    def _sample(indices: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+
+        if len(indices) <= count:
+            return indices
+
+        return rng.choice(indices, size=count, replace=False)
+
+    def train_model(self):
+        """ Train the model """
+
+        self.model.fit(self.features, self.labels)
         self.trained = True
 
-    def apply_model(self, image: Image) -> Image:
+    def apply_model(
+            self,
+            image: Image,
+            tile_size: int = 1024,
+            probabilities: bool = False,
+            workers: int = 1,
+            file_path: Optional[str] = None) -> Optional[Image]:
+        """ Classify an image tile by tile, predicting only pixels without NaN or no data values
+        Class indices are returned as uint8 with NO_DATA_CLASS where nothing was predicted, or with
+        probabilities=True the class probabilities scaled to uint8 with one band per class
+        With a file_path each tile is written straight to a GeoTIFF and nothing is returned
+        """
 
         if not self.trained:
             raise UserWarning("Model needs to be trained before it can be tested.")
-        features = image.pixels.reshape(image.width * image.height, image.band_count)
-        features[np.isnan(features)] = 0
+        if self.band_count and image.band_count != self.band_count:
+            raise UserWarning(f'Model was trained on {self.band_count} bands but image has {image.band_count}')
+
+        if probabilities:
+            return classify_tiles(image, self._predict_probabilities, len(self.classes), tile_size, workers, file_path, None)
+
+        return classify_tiles(image, self.model.predict, 1, tile_size, workers, file_path, NO_DATA_CLASS)
+
+    def _predict_probabilities(self, features: np.ndarray) -> np.ndarray:
+
+        probabilities = np.zeros((len(features), len(self.classes)), dtype=np.uint8)
+        probabilities[:, self.model.classes_.astype(int)] = np.round(self.model.predict_proba(features) * 255)
+
+        return probabilities
+
+    def test_model(self, output_image: Image, truth_vectors: gpd.GeoDataFrame, tile_size: Optional[int] = None) -> Accuracy:
+
+        accuracy = self.assess_accuracy(output_image, truth_vectors, tile_size)
+        self._plot_confusion_matrix(accuracy.confusion_matrix)
+
+        return accuracy
+
+    def assess_accuracy(self, output_image: Image, truth_vectors: gpd.GeoDataFrame, tile_size: Optional[int] = None) -> Accuracy:
+        """ Compare a classified image with truth polygons rasterised onto its grid, optionally tile by tile
+        truth_vectors either carry a pixel_polygon column or geometries in (or transformable to) the image EPSG
+        """
+
+        if 'pixel_polygon' in truth_vectors.columns:
+            polygons = gpd.GeoSeries([getattr(p, 'polygon', p) for p in truth_vectors['pixel_polygon']])
+        else:
+            if truth_vectors.crs is not None and output_image.epsg and truth_vectors.crs.to_epsg() != output_image.epsg:
+                truth_vectors = truth_vectors.to_crs(epsg=output_image.epsg)
+            polygons = gpd.GeoSeries([GeoPolygon(p, output_image.epsg).to_pixel(output_image.geotransform).polygon
+                                      for p in truth_vectors.geometry])
 
-        results_list = self.model.predict(features)
-        results_image = results_list.reshape(image.width, image.height)
-        results_image[np.isnan(image[0].pixels)] = 0.
+        # burn class index + 1 so the background is 0, truth classes not seen in training burn 0 and are ignored
+        values = np.array([self.classes.index(c) + 1 if c in self.classes else 0 for c in truth_vectors[self.label_name]])
 
-        return Image(results_image, self.image.geotransform, self.image.projection, self.image.no_data_value)
+        tile_size = tile_size or max(output_image.height, output_image.width)
+        accuracy = Accuracy(np.zeros((len(self.classes), len(self.classes)), dtype=np.int64), self.classes)
 
-    def test_model(self, output_image: Image, truth_vectors: gpd.GeoDataFrame):
+        for y in range(0, output_image.height, tile_size):
+            for x in range(0, output_image.width, tile_size):
+                predicted = output_image.pixels[y:y + tile_size, x:x + tile_size]
+                height, width = predicted.shape[:2]
 
-        truth_image = PILImage.new("L", (output_image.height, output_image.width), 200)
-        for i, row in truth_vectors.iterrows():
-            class_value = truth_vectors[self.label_name].unique().tolist().index(row[self.label_name])
-            polygon = list(row['pixel_polygon'].exterior.coords)
+                candidates = polygons.sindex.query(box(x, y, x + width, y + height))
+                if len(candidates) == 0:
+                    continue
 
-            ImageDraw.Draw(truth_image).polygon(polygon, class_value)
-        truth_image = np.array(truth_image).astype('float')
+                shifted = [translate(polygons.iloc[i], -x, -y) for i in candidates]
+                truth = gis.rasterise(shifted, values[candidates], (height, width))
 
-        truth = truth_image[truth_image != 200]
-        predictions = output_image.pixels[truth_image != 200]
-        confusion_matrix = metrics.confusion_matrix(truth, predictions)
+                accuracy += Accuracy.from_labels(truth - 1, predicted, self.classes)
 
-        self._plot_confusion_matrix(confusion_matrix)
+        return accuracy
 
     def plot_features(self, ylabel: str = None, xticks: List[str] = None):
         """ Plot the averages of all class features and their variance """
         plt.figure(figsize=(15, 10))
 
-        for c in self.vectors[self.label_name].unique():
-            all_features = np.vstack(self.vectors.loc[self.vectors[self.label_name] == c].features.tolist())
+        for class_value, c in enumerate(self.classes):
+            all_features = self.features[self.labels == class_value]
 
             mean_feature = np.mean(all_features, axis=0)
             variance = np.std(all_features, axis=0)
@@ -119,7 +360,7 @@ class Supervised:
         plt.figure(figsize=(15, 10))
         plt.imshow(confusion_matrix, cmap=cmap)
 
-        classes = self.vectors[self.label_name].unique().tolist()
+        classes = self.classes
         tick_marks = np.arange(len(classes))
 
         plt.xticks(tick_marks, classes, rotation=45)
@@ -0,0 +1,86 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from eopy.image import Image, ImageWriter
+
+NO_DATA_CLASS = 255
+
+
+def tile_origins(height: int, width: int, tile_size: int) -> List[Tuple[int, int]]:
+
+    return [(y, x) for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+
+def valid_pixels(features: np.ndarray, no_data_value: Optional[float]) -> np.ndarray:
+    """ Mask of (pixel, band) rows without NaN and not equal to the no data value in every band """
+
+    valid = np.ones(len(features), dtype=bool)
+    if np.issubdtype(features.dtype, np.floating):
+        valid &= ~np.isnan(features).any(axis=1)
+    if no_data_value is not None:
+        valid &= ~(features == no_data_value).all(axis=1)
+
+    return valid
+
+
+def iterate_valid_features(image: Image, tile_size: int) -> Iterator[np.ndarray]:
+    """ Valid pixels of each tile as (pixels, bands) """
+
+    for y, x in tile_origins(image.height, image.width, tile_size):
+        tile = image.pixels[y:y + tile_size, x:x + tile_size]
+        features = tile.reshape(tile.shape[0] * tile.shape[1], -1)
+
+        yield features[valid_pixels(features, image.no_data_value)]
+
+
+def classify_tiles(
+        image: Image,
+        predict: Callable[[np.ndarray], np.ndarray],
+        band_count: int = 1,
+        tile_size: int = 1024,
+        workers: int = 1,
+        file_path: Optional[str] = None,
+        no_data_value: Optional[int] = NO_DATA_CLASS) -> Optional[Image]:
+    """ Apply predict to the valid (pixels, bands) features of each tile concurrently, producing a uint8 image
+    predict returns one value per pixel, or band_count values per pixel
+    With a file_path each tile is written straight to a GeoTIFF and nothing is returned
+    """
+
+    fill = no_data_value if no_data_value is not None else 0
+    tiles = tile_origins(image.height, image.width, tile_size)
+
+    if file_path:
+        writer = ImageWriter(file_path, image.width, image.height, band_count, 'uint8',
+                             image.geotransform, image.epsg, no_data_value)
+    else:
+        writer = None
+        shape = (image.height, image.width, band_count) if band_count > 1 else (image.height, image.width)
+        results = np.full(shape, fill, dtype=np.uint8)
+
+    def classify_tile(origin: Tuple[int, int]) -> np.ndarray:
+
+        y, x = origin
+        pixels = image.pixels[y:y + tile_size, x:x + tile_size]
+        height, width = pixels.shape[:2]
+        features = pixels.reshape(height * width, -1)
+        valid = valid_pixels(features, image.no_data_value)
+
+        tile = np.full((height * width, band_count), fill, dtype=np.uint8)
+        if valid.any():
+            tile[valid] = np.asarray(predict(features[valid])).reshape(int(valid.sum()), band_count)
+
+        return tile.reshape(height, width, band_count) if band_count > 1 else tile.reshape(height, width)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (y, x), tile in zip(tiles, executor.map(classify_tile, tiles)):
+            if writer:
+                writer.write(tile, x, y)
+            else:
+                results[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+
+    if writer:
+        writer.close()
+        return None
+
+    return Image(results, image.geotransform, image.epsg, no_data_value)
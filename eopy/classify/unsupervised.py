@@ -0,0 +1,83 @@
+import numpy as np
+from typing import Callable, Iterable, Optional, Union
+from sklearn.cluster import MiniBatchKMeans
+
+from eopy.classify.tiles import classify_tiles, iterate_valid_features, NO_DATA_CLASS
+from eopy.image import Image
+
+
+class Unsupervised:
+    """ Pixel level clustering with mini-batch k-means trained on samples streamed from image tiles """
+    def __init__(
+            self,
+            n_clusters: int = 8,
+            batch_size: int = 4096,
+            tile_size: int = 1024,
+            samples_per_tile: int = 10000,
+            random_state: Optional[int] = None):
+
+        if n_clusters >= NO_DATA_CLASS:
+            raise UserWarning(f'At most {NO_DATA_CLASS - 1} clusters are supported')
+
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.tile_size = tile_size
+        self.samples_per_tile = samples_per_tile
+        self.model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state, n_init=3)
+        self.band_count = None
+        self.trained = False
+        self._rng = np.random.default_rng(random_state)
+
+    def train_model(self, images: Union[Image, Iterable[Image], Callable[[], Iterable[Image]]], epochs: int = 1):
+        """ Fit on a random sample of the valid pixels of every tile, one batch at a time
+        images can be a single Image, a list of them or, to stream many scenes, a function returning a new iterable
+        (e.g. a generator) for each epoch; a generator itself can only be passed for a single epoch
+        """
+
+        if isinstance(images, Image):
+            images = [images]
+        if epochs > 1 and not callable(images) and iter(images) is images:
+            raise UserWarning('An iterator is exhausted after one epoch, pass a list or a function returning a new iterable')
+
+        for _ in range(epochs):
+            buffer, buffered = [], 0
+            for image in images() if callable(images) else images:
+                if self.band_count is None:
+                    self.band_count = image.band_count
+                elif image.band_count != self.band_count:
+                    raise UserWarning(f'Expected {self.band_count} bands but image has {image.band_count}')
+
+                for features in iterate_valid_features(image, self.tile_size):
+                    if len(features) > self.samples_per_tile:
+                        features = features[self._rng.choice(len(features), self.samples_per_tile, replace=False)]
+                    buffer.append(features.astype(np.float32))
+                    buffered += len(features)
+
+                    # the first batch also needs at least one sample per cluster
+                    if buffered >= self.batch_size and (buffered >= self.n_clusters or self._fitted):
+                        self.model.partial_fit(np.vstack(buffer))
+                        buffer, buffered = [], 0
+
+            if buffered and (buffered >= self.n_clusters or self._fitted):
+                self.model.partial_fit(np.vstack(buffer))
+
+            self.trained = self._fitted
+
+        if not self.trained:
+            raise UserWarning('Not enough valid pixels to fit the clusters.')
+
+    @property
+    def _fitted(self) -> bool:
+
+        return hasattr(self.model, 'cluster_centers_')
+
+    def apply_model(self, image: Image, workers: int = 1, file_path: Optional[str] = None) -> Optional[Image]:
+        """ Label every valid pixel with its cluster tile by tile, NO_DATA_CLASS elsewhere """
+
+        if not self.trained:
+            raise UserWarning("Model needs to be trained before it can be applied.")
+        if image.band_count != self.band_count:
+            raise UserWarning(f'Model was trained on {self.band_count} bands but image has {image.band_count}')
+
+        return classify_tiles(image, lambda features: self.model.predict(features.astype(np.float32)),
+                              tile_size=self.tile_size, workers=workers, file_path=file_path)
@@ -1,3 +1,4 @@
-from .calibration import Calibrator
+from .calibration import Calibrator, LandsatMetadata
 from .downloader import Downloader
 from .searcher import Searcher, Satellite
+from .catalog import SceneCatalog
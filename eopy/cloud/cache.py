@@ -0,0 +1,294 @@
+import hashlib
+import os
+import threading
+import uuid
+import requests
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from eopy.cloud.session import create_session
+
+
+class BlockCache:
+    """ On-disk least recently used cache of fixed size byte blocks of remote files, keyed by URL and block index
+    Blocks are written atomically so several processes can share one directory, and the least recently read
+    blocks are evicted once the directory grows past max_bytes
+    """
+    def __init__(
+            self,
+            directory: str,
+            max_bytes: int = 1 << 30,
+            block_size: int = 1 << 18,
+            session: Optional[requests.Session] = None,
+            timeout: float = 60):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._session = session or create_session()
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._written_since_eviction = max_bytes
+        self._sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_fetched = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+
+        return f'BlockCache - Hits: {self.hits} | Misses: {self.misses} | Hit rate: {self.hit_rate:.0%}'
+
+    @property
+    def hit_rate(self) -> float:
+
+        requests_made = self.hits + self.misses
+        return self.hits / requests_made if requests_made else 0.
+
+    @property
+    def stats(self) -> Dict[str, int]:
+
+        return {'hits': self.hits, 'misses': self.misses, 'bytes_served': self.bytes_served, 'bytes_fetched': self.bytes_fetched}
+
+    def size(self, url: str) -> int:
+        """ Size of the remote file, remembered on disk alongside its blocks """
+
+        if url in self._sizes:
+            return self._sizes[url]
+
+        size_path = self._path(url, 'size')
+        try:
+            with open(size_path) as size_file:
+                size = int(size_file.read())
+        except (FileNotFoundError, ValueError):
+            response = self._session.head(url, allow_redirects=True, timeout=self._timeout)
+            response.raise_for_status()
+            size = int(response.headers['Content-Length'])
+            self._write(size_path, str(size).encode())
+
+        self._sizes[url] = size
+        return size
+
+    def read(self, url: str, start: int, length: int) -> bytes:
+        """ Bytes start to start + length of the remote file, from cached blocks where possible """
+
+        stop = min(start + length, self.size(url))
+        if stop <= start:
+            return b''
+
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        data = b''.join(self._block(url, index) for index in range(first, last + 1))
+        offset = start - first * self.block_size
+
+        with self._lock:
+            self.bytes_served += stop - start
+        return data[offset:offset + stop - start]
+
+    def _block(self, url: str, index: int) -> bytes:
+
+        path = self._path(url, str(index))
+        try:
+            with open(path, 'rb') as block_file:
+                block = block_file.read()
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return block
+        except FileNotFoundError:
+            pass
+
+        start = index * self.block_size
+        stop = min(start + self.block_size, self.size(url)) - 1
+        response = self._session.get(url, headers={'Range': f'bytes={start}-{stop}'}, timeout=self._timeout)
+        response.raise_for_status()
+        block = response.content if response.status_code == HTTPStatus.PARTIAL_CONTENT else response.content[start:stop + 1]
+
+        self._write(path, block)
+        with self._lock:
+            self.misses += 1
+            self.bytes_fetched += len(block)
+            self._written_since_eviction += len(block)
+            evict = self._written_since_eviction > self.max_bytes // 10
+            if evict:
+                self._written_since_eviction = 0
+        if evict:
+            self.evict()
+
+        return block
+
+    def evict(self):
+        """ Delete the least recently read blocks until the cache is under 90 % of max_bytes """
+
+        entries = []
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                try:
+                    os.remove(os.path.join(root, file_name))
+                except FileNotFoundError:
+                    pass
+        self._sizes = {}
+
+    def _path(self, url: str, name: str) -> str:
+
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f'{key}_{name}')
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        """ Write to a temporary file and rename it so other readers never see a partial block """
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as temporary_file:
+            temporary_file.write(data)
+        os.replace(temporary_path, path)
+
+
+class CacheServer:
+    """ A local HTTP server answering range requests from a BlockCache, so GDAL /vsicurl/ reads go through the cache """
+    def __init__(self, cache: BlockCache):
+
+        self.cache = cache
+        self._server = None
+
+    def __enter__(self) -> "CacheServer":
+
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+
+        return self._server is not None
+
+    def start(self):
+
+        if self._server is None:
+            self._server = ThreadingHTTPServer(('127.0.0.1', 0), _cache_handler(self.cache))
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def url_for(self, url: str) -> str:
+
+        if self._server is None:
+            raise UserWarning('Cache server is not running')
+
+        return f'http://127.0.0.1:{self._server.server_port}/{quote(url, safe="")}'
+
+
+def _cache_handler(cache: BlockCache):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_HEAD(self):
+
+            self._respond(body=False)
+
+        def do_GET(self):
+
+            self._respond(body=True)
+
+        def _respond(self, body: bool):
+
+            url = unquote(self.path.lstrip('/'))
+            try:
+                size = cache.size(url)
+            except requests.RequestException as e:
+                self.send_error(HTTPStatus.BAD_GATEWAY, str(e))
+                return
+
+            byte_range = self.headers.get('Range')
+            partial = bool(byte_range) and byte_range.startswith('bytes=')
+            ranges = _parse_ranges(byte_range[6:], size) if partial else [(0, size - 1)]
+            if not ranges:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if len(ranges) == 1:
+                (start, stop), = ranges
+                content_type, parts = 'application/octet-stream', [(start, stop)]
+            else:
+                # GDAL_HTTP_MULTIRANGE asks for several ranges in one request, answered as one multipart/byteranges body
+                boundary = uuid.uuid4().hex
+                content_type, parts = f'multipart/byteranges; boundary={boundary}', []
+                for start, stop in ranges:
+                    parts += [f'--{boundary}\r\nContent-Type: application/octet-stream\r\n'
+                              f'Content-Range: bytes {start}-{stop}/{size}\r\n\r\n'.encode(), (start, stop), b'\r\n']
+                parts.append(f'--{boundary}--\r\n'.encode())
+
+            self.send_response(HTTPStatus.PARTIAL_CONTENT if partial else HTTPStatus.OK)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(sum(len(part) if isinstance(part, bytes) else part[1] - part[0] + 1
+                                                       for part in parts)))
+            if partial and len(ranges) == 1:
+                self.send_header('Content-Range', f'bytes {start}-{stop}/{size}')
+            self.end_headers()
+
+            if body:
+                for part in parts:
+                    self.wfile.write(part if isinstance(part, bytes) else cache.read(url, part[0], part[1] - part[0] + 1))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _parse_ranges(byte_ranges: str, size: int) -> List[Tuple[int, int]]:
+    """ Inclusive (start, stop) byte ranges of a Range header value without its 'bytes=' prefix
+    Suffix ranges count from the end of the file and ranges starting past it are dropped
+    """
+
+    ranges = []
+    for byte_range in byte_ranges.split(','):
+        first, _, last = byte_range.strip().partition('-')
+        if first:
+            start, stop = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, stop = max(size - int(last), 0), size - 1
+        if start < size:
+            ranges.append((start, stop))
+
+    return ranges
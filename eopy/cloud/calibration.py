@@ -1,56 +1,144 @@
-from typing import List, Dict
+import functools
+import os
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Optional, Tuple
 from urllib.request import urlopen
 
 import numpy as np
-from eopy.image import Image
+from eopy.image import Image, LazyImage
 
 
-class Calibrator:
+class LandsatMetadata:
+    """ Calibration coefficients and solar geometry parsed from a Landsat MTL file """
+    def __init__(self, values: Mapping[str, str]):
 
-    def calibrate_landsat(self, image: Image, metadata_url: str, band_list: List[int]) -> Image:
+        self.values = values
 
-        metadata = self._get_metadata(metadata_url)
+    def __repr__(self) -> str:
 
-        if len(band_list) != image.band_count:
-            raise UserWarning(f'{len(band_list)} bands provided but image has {image.band_count} bands')
+        return f"LandsatMetadata - {self.values.get('LANDSAT_PRODUCT_ID', self.values.get('LANDSAT_SCENE_ID'))}"
 
-        if image.band_count == 1:
-            return self._calibrate_landsat_band(image, metadata, band_list[0])
-        else:
-            calibrated_bands = []
-            for i, band_number in enumerate(band_list):
-                calibrated_bands.append(self._calibrate_landsat_band(image[:, :, i], metadata, band_number))
+    def __getitem__(self, key: str) -> str:
 
-            return image.stack(calibrated_bands)
+        return self.values[key]
 
-    def _calibrate_landsat_band(self, band: Image, metadata: Dict[str, str], band_number: int) -> Image:
+    @classmethod
+    def load(cls, source: str) -> "LandsatMetadata":
+        """ Parse an MTL file from a path or URL, each source is only read and parsed once
+        A local file is read again once it has been modified, the values are shared so they are read-only
+        """
 
-        gain = float(metadata[f'REFLECTANCE_MULT_BAND_{band_number}'])
-        bias = float(metadata[f'REFLECTANCE_ADD_BAND_{band_number}'])
-        sun_elevation_degrees = float(metadata['SUN_ELEVATION'])
+        return cls(_read_metadata(source))
 
-        sun_elevation_radians = np.deg2rad(sun_elevation_degrees)
+    @staticmethod
+    def parse(lines: List[str]) -> Dict[str, str]:
 
-        return band.apply(lambda x: self._calculate_landsat_toa_reflectance(x, gain, bias, sun_elevation_radians))
+        values = {}
+        for line in lines:
+            key, separator, value = line.strip().partition(' = ')
+            if separator:
+                values[key] = value.strip('"')
 
-    @staticmethod
-    def _get_metadata(url: str) -> Dict[str, str]:
+        return values
+
+    @property
+    def sun_elevation(self) -> float:
+        """ Sun elevation in radians """
+
+        return np.deg2rad(float(self.values['SUN_ELEVATION']))
+
+    def coefficients(self, band_list: List[int], quantity: str = 'reflectance') -> Tuple[np.ndarray, np.ndarray]:
+        """ Gain and bias of each band, for TOA reflectance these include the sun elevation correction """
+
+        if quantity not in ('reflectance', 'radiance'):
+            raise UserWarning(f'Unrecognised quantity: {quantity}')
+
+        prefix = quantity.upper()
+        try:
+            gains = np.array([float(self.values[f'{prefix}_MULT_BAND_{band}']) for band in band_list])
+            biases = np.array([float(self.values[f'{prefix}_ADD_BAND_{band}']) for band in band_list])
+        except KeyError as e:
+            raise UserWarning(f'No {quantity} calibration for {e.args[0]}')
+
+        if quantity == 'reflectance':
+            gains, biases = gains / np.sin(self.sun_elevation), biases / np.sin(self.sun_elevation)
+
+        return gains.astype(np.float32), biases.astype(np.float32)
+
+
+def _read_metadata(source: str) -> Mapping[str, str]:
+
+    modified = None if source.startswith(('http://', 'https://', 'ftp://')) else os.path.getmtime(source)
+
+    return _parse_metadata(source, modified)
 
-        metadata = {}
-        for l in urlopen(url):
 
-            try:
-                key, value = str(l).strip("b'").strip(' ').strip('\\n').split(' = ')
-                metadata[key] = value
-            except ValueError:
-                continue
+@functools.lru_cache(maxsize=64)
+def _parse_metadata(source: str, modified: Optional[float]) -> Mapping[str, str]:
+    """ Cached on the modification time too, so an edited local file is not served from the cache """
 
-        return metadata
+    if modified is None:
+        with urlopen(source) as response:
+            lines = [line.decode('utf-8') for line in response]
+    else:
+        with open(source) as metadata_file:
+            lines = metadata_file.readlines()
+
+    return MappingProxyType(LandsatMetadata.parse(lines))
+
+
+class Calibrator:
+
+    def calibrate_landsat(
+            self,
+            image: Image,
+            metadata_url: str,
+            band_list: List[int],
+            dtype: type = np.float32,
+            scale: float = 10000.,
+            quantity: str = 'reflectance',
+            tile_size: Optional[int] = None) -> Image:
+        """ Calibrate all bands of a Landsat image at once, pixels with DN 0 stay 0
+        dtype float32 gives TOA reflectance directly, an integer dtype such as uint16 stores it multiplied by scale
+        tile_size calibrates blocks of rows at a time to bound the memory of temporaries
+        A LazyImage is calibrated lazily, tile by tile when it is saved or computed
+        """
+
+        metadata = LandsatMetadata.load(metadata_url)
+
+        if len(band_list) != image.band_count:
+            raise UserWarning(f'{len(band_list)} bands provided but image has {image.band_count} bands')
+
+        gains, biases = metadata.coefficients(band_list, quantity)
+
+        if isinstance(image, LazyImage):
+            return image.map(lambda block: self._calibrate_block(block, gains, biases, scale, np.empty(block.shape, dtype=dtype)))
+
+        pixels = image.pixels.reshape(image.height, image.width, image.band_count)
+        output = np.empty(pixels.shape, dtype=dtype)
+
+        rows = tile_size or image.height
+        for y in range(0, image.height, rows):
+            self._calibrate_block(pixels[y:y + rows], gains, biases, scale, output[y:y + rows])
+
+        if image.band_count == 1:
+            output = output[:, :, 0]
+
+        return Image(output, image.geotransform, image.epsg, image.no_data_value)
 
     @staticmethod
-    def _calculate_landsat_toa_reflectance(dn: np.ndarray, gain: float, bias: float, sun_elevation: float) -> np.ndarray:
-        """ Calculate Top of Atmosphere reflectance taking into account solar geometry"""
+    def _calibrate_block(dn: np.ndarray, gains: np.ndarray, biases: np.ndarray, scale: float, output: np.ndarray) -> np.ndarray:
+        """ gain * DN + bias for every band by broadcasting over the band axis, written into output """
+
+        calibrated = dn.astype(np.float32)
+        calibrated *= gains
+        calibrated += biases
+        calibrated[dn <= 0] = 0
+
+        if np.issubdtype(output.dtype, np.integer):
+            calibrated *= scale
+            np.clip(np.rint(calibrated, out=calibrated), 0, np.iinfo(output.dtype).max, out=calibrated)
 
-        rho = np.where(dn > 0, (gain*dn + bias) / np.sin(sun_elevation), 0)
+        output[:] = calibrated
 
-        return rho
+        return output
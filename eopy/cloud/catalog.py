@@ -0,0 +1,185 @@
+import json
+import re
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from datetime import datetime
+from shapely.geometry import Polygon
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from eopy.cloud.scene import Scene
+from eopy.geometry import GeoPolygon
+from eopy.tools import gis
+
+COLUMNS = ['identity', 'satellite_name', 'cloud_coverage', 'area_coverage', 'date', 'thumbnail', 'links', 'epsg', 'tile']
+LANDSAT_PATH_ROW = re.compile(r'^L[COTEM]\d{1,2}(?:_\w{4}_)?(\d{3})(\d{3})')
+SENTINEL_TILE = re.compile(r'_(\d{2}[C-X][A-Z]{2})_')
+
+
+class SceneCatalog:
+    """ Scenes held column by column in a GeoDataFrame of WGS84 footprints, queried through its STRtree spatial index
+    A catalog saved to disk can be updated with new search results instead of searching again
+    """
+    def __init__(self, table: Optional[gpd.GeoDataFrame] = None):
+
+        if table is None:
+            table = gpd.GeoDataFrame({column: [] for column in COLUMNS}, geometry=[], crs=f'epsg:{gis.WGS84_EPSG}')
+        self.table = table.reset_index(drop=True)
+
+    def __repr__(self) -> str:
+
+        return f'SceneCatalog - Scenes: {len(self)} | Tiles: {self.table.tile.nunique()}'
+
+    def __len__(self) -> int:
+
+        return len(self.table)
+
+    def __iter__(self) -> Iterator[Scene]:
+
+        return (self._to_scene(row) for row in self.table.itertuples(index=False))
+
+    @classmethod
+    def from_scenes(cls, scenes: Iterable[Scene]) -> "SceneCatalog":
+
+        catalog = cls()
+        catalog.add(scenes)
+
+        return catalog
+
+    @classmethod
+    def load(cls, file_path: str) -> "SceneCatalog":
+
+        return cls(gpd.read_parquet(file_path))
+
+    def save(self, file_path: str):
+
+        self.table.to_parquet(file_path)
+
+    @property
+    def scenes(self) -> List[Scene]:
+
+        return list(self)
+
+    def add(self, scenes: Iterable[Scene]) -> int:
+        """ Add scenes, e.g. straight from Searcher.search, replacing any already catalogued with the same identity
+        Returns the number of new scenes
+        """
+
+        scenes = list(scenes)
+        if not scenes:
+            return 0
+
+        footprints = [scene.polygon.wgs84.polygon for scene in scenes]
+        new = gpd.GeoDataFrame({
+            'identity': [scene.identity for scene in scenes],
+            'satellite_name': [scene.satellite_name for scene in scenes],
+            'cloud_coverage': np.array([scene.cloud_coverage for scene in scenes], dtype=float),
+            'area_coverage': np.array([scene.area_coverage for scene in scenes], dtype=float),
+            'date': pd.to_datetime([scene.date for scene in scenes]),
+            'thumbnail': [scene._thumbnail for scene in scenes],
+            'links': [json.dumps(scene.links) for scene in scenes],
+            'epsg': pd.array([scene.epsg for scene in scenes], dtype='Int64'),
+            'tile': self._tile_codes([scene.identity for scene in scenes], footprints)
+        }, geometry=footprints, crs=f'epsg:{gis.WGS84_EPSG}')
+
+        added = len(set(new.identity) - set(self.table.identity))
+        table = new if len(self.table) == 0 else pd.concat([self.table, new], ignore_index=True)
+        self.table = table.drop_duplicates('identity', keep='last').reset_index(drop=True)
+
+        return added
+
+    def query(
+            self,
+            boundary: Optional[GeoPolygon] = None,
+            start: Optional[datetime] = None,
+            end: Optional[datetime] = None,
+            cloud_min: float = 0,
+            cloud_max: float = 100,
+            satellite_name: Optional[str] = None,
+            min_coverage: float = 0) -> "SceneCatalog":
+        """ Scenes intersecting the boundary within the dates and cloud range, covering at least min_coverage % of it """
+
+        table = self.table
+        if boundary is not None:
+            polygon = boundary.wgs84.polygon
+            table = table.iloc[np.sort(table.sindex.query(polygon, predicate='intersects'))]
+            table = table.assign(area_coverage=self._coverage(table.geometry, polygon))
+
+        keep = (table.cloud_coverage >= cloud_min) & (table.cloud_coverage <= cloud_max) & (table.area_coverage >= min_coverage)
+        if start:
+            keep &= table.date >= pd.Timestamp(start)
+        if end:
+            keep &= table.date <= pd.Timestamp(end)
+        if satellite_name:
+            keep &= table.satellite_name == satellite_name
+
+        return SceneCatalog(table[keep.to_numpy()])
+
+    def deduplicate(self, boundary: Optional[GeoPolygon] = None, min_gain: float = 1.) -> "SceneCatalog":
+        """ Drop scenes of the same satellite and day whose footprint adds less than min_gain % of the boundary
+        (or of their own footprint) to the clearer, better covering scenes already kept
+        """
+
+        polygon = boundary.wgs84.polygon if boundary is not None else None
+        keep = []
+
+        for _, group in self.table.groupby([self.table.satellite_name.fillna(''), self.table.date.dt.date], sort=False):
+            group = group.sort_values(['cloud_coverage', 'area_coverage'], ascending=[True, False])
+            covered = None
+            for index, footprint in zip(group.index, group.geometry):
+                area = footprint if polygon is None else footprint.intersection(polygon)
+                reference = footprint.area if polygon is None else polygon.area
+                gain = area.area if covered is None else area.difference(covered).area
+
+                if reference > 0 and gain / reference * 100 >= min_gain:
+                    keep.append(index)
+                    covered = area if covered is None else covered.union(area)
+
+        return SceneCatalog(self.table.loc[sorted(keep)])
+
+    def group_by_tile(self) -> Dict[str, "SceneCatalog"]:
+        """ Catalogs per MGRS tile (Sentinel-2 and others) or path/row (Landsat) """
+
+        return {tile: SceneCatalog(group) for tile, group in self.table.groupby('tile', sort=True)}
+
+    @staticmethod
+    def _coverage(footprints: gpd.GeoSeries, polygon: Polygon) -> np.ndarray:
+        """ Percentage of the polygon covered by each footprint, as a ratio of areas in degrees like Searcher """
+
+        if polygon.area == 0:
+            return np.zeros(len(footprints))
+        intersections = gpd.GeoSeries(footprints.intersection(polygon).values, crs=None)
+
+        return intersections.area.to_numpy() / polygon.area * 100
+
+    @staticmethod
+    def _tile_codes(identities: List[str], footprints: List[Polygon]) -> List[str]:
+        """ Tile of every scene from its identity where possible, otherwise the MGRS tile of its centroid in one batch """
+
+        codes = []
+        for identity in identities:
+            landsat, sentinel = LANDSAT_PATH_ROW.match(identity or ''), SENTINEL_TILE.search(identity or '')
+            codes.append(f'{landsat.group(1)}/{landsat.group(2)}' if landsat else sentinel.group(1) if sentinel else None)
+
+        missing = [i for i, code in enumerate(codes) if code is None]
+        if missing:
+            centroids = [footprints[i].centroid for i in missing]
+            for i, code in zip(missing, gis.mgrs_tiles([c.x for c in centroids], [c.y for c in centroids])):
+                codes[i] = code
+
+        return codes
+
+    @staticmethod
+    def _to_scene(row) -> Scene:
+
+        return Scene(
+            identity=row.identity,
+            satellite_name=row.satellite_name,
+            cloud_coverage=row.cloud_coverage,
+            area_coverage=row.area_coverage,
+            date=row.date.to_pydatetime(),
+            thumbnail=row.thumbnail,
+            links=json.loads(row.links),
+            polygon=GeoPolygon(row.geometry, epsg=gis.WGS84_EPSG),
+            epsg=None if pd.isna(row.epsg) else int(row.epsg)
+        )
@@ -1,68 +1,337 @@
-import gdal
+import hashlib
+import os
+import time
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from osgeo import gdal, gdal_array
 from pyproj import CRS
 from pyproj.exceptions import CRSError
-from urllib.request import urlretrieve
 from http import HTTPStatus
-from typing import List
+from tqdm import tqdm
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 from eopy.geometry import GeoPolygon
+from eopy.cloud.cache import BlockCache, CacheServer
 from eopy.cloud.scene import Scene
-from eopy.image import Image, Loader
+from eopy.cloud.session import create_session
+from eopy.image import Geotransform, Image, Loader
+
+# block caching and merged range requests so a window costs a few large reads rather than many small ones
+STREAM_OPTIONS = {
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+    'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.TIF,.tiff,.jp2,.ovr',
+    'CPL_VSIL_CURL_CACHE_SIZE': str(256 << 20),
+    'VSI_CACHE': 'TRUE',
+    'VSI_CACHE_SIZE': str(64 << 20),
+    'GDAL_HTTP_MULTIRANGE': 'YES',
+    'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+    'GDAL_HTTP_MULTIPLEX': 'YES',
+    'GDAL_HTTP_VERSION': '2',
+    'GDAL_HTTP_MAX_RETRY': '3',
+}
+
+
+class Download:
+    """ The outcome of downloading one file """
+    def __init__(self, url: str, file_path: str, size: int, transferred: int, seconds: float):
+
+        self.url = url
+        self.file_path = file_path
+        self.size = size
+        self.transferred = transferred
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+
+        return f'Download - {os.path.basename(self.file_path)} | {self.size / 1e6:.1f} MB | {self.throughput:.1f} MB/s'
+
+    @property
+    def throughput(self) -> float:
+        """ MB per second actually transferred, excluding any part resumed from a previous attempt """
+
+        return self.transferred / 1e6 / self.seconds if self.seconds > 0 else 0.
 
 
 class Downloader:
 
-    def __init__(self, download_directory: str = ''):
+    def __init__(
+            self,
+            download_directory: str = '',
+            workers: int = 4,
+            chunk_size: int = 1 << 20,
+            retries: int = 3,
+            timeout: float = 60,
+            session: Optional[requests.Session] = None,
+            stream_options: Optional[Dict[str, str]] = None,
+            cache: Optional[BlockCache] = None):
+        """ Bands are downloaded or streamed by up to `workers` threads, downloads share one pooled session
+        Interrupted downloads are kept as .part files and resumed with HTTP range requests
+        stream_options override the GDAL configuration options used while streaming
+        With a BlockCache, streamed reads go through a local server backed by the cache so repeat reads stay on disk
+        """
 
         self._image_loader = Loader()
         self._download_directory = download_directory
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._retries = retries
+        self._timeout = timeout
+        self._session = session or create_session(retries, pool_size=workers)
+        self._stream_config = {**STREAM_OPTIONS, **(stream_options or {})}
+        self._cache_server = CacheServer(cache) if cache else None
 
-    def download(self, scene: Scene, bands: List[str]):
+    def download(self, scene: Scene, bands: List[str]) -> List[Download]:
 
-        for band in bands:
+        return self.download_scenes([scene], bands)
+
+    def download_scenes(self, scenes: List[Scene], bands: List[str]) -> List[Download]:
+        """ Download the bands of every scene concurrently to {identity}_{band}{extension} """
+
+        tasks = []
+        for scene in scenes:
+            for band in bands:
+                try:
+                    url = self._get_url(scene, band)
+                except UserWarning as e:
+                    print(e)
+                    continue
+                extension = os.path.splitext(urlparse(url).path)[1] or '.tif'
+                file_path = os.path.join(self._download_directory, f'{scene.identity}_{band}{extension}')
+                tasks.append((url, file_path, self._get_checksum(scene, band)))
+
+        if self._download_directory:
+            os.makedirs(self._download_directory, exist_ok=True)
+
+        downloads = []
+        start = time.time()
+        with tqdm(total=0, unit='B', unit_scale=True) as progress, ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {executor.submit(self._download_file, url, file_path, checksum, progress): url
+                       for url, file_path, checksum in tasks}
+            for future in as_completed(futures):
+                try:
+                    downloads.append(future.result())
+                except (requests.RequestException, UserWarning) as e:
+                    print(f'Unable to download {futures[future]}: {e}')
+
+        seconds = time.time() - start
+        transferred = sum(download.transferred for download in downloads)
+        if downloads and seconds > 0:
+            print(f'Downloaded {len(downloads)} files, {transferred / 1e6:.1f} MB in {seconds:.1f} s '
+                  f'({transferred / 1e6 / seconds:.1f} MB/s)')
+
+        return downloads
+
+    def _download_file(self, url: str, file_path: str, checksum: Optional[str], progress: tqdm) -> Download:
+        """ Download to a .part file, resuming it if present, and move it into place once complete and verified """
+
+        part_path = file_path + '.part'
+        start = time.time()
+        transferred = 0
+        size = None
+
+        if os.path.exists(file_path) and not os.path.exists(part_path):
+            if checksum is None or self._sha256(file_path) == checksum:
+                return Download(url, file_path, os.path.getsize(file_path), 0, 0.)
+
+        for attempt in range(self._retries + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
 
             try:
-                url = self._get_url(scene, band)
-            except UserWarning as e:
-                print(e)
-                continue
+                with self._session.get(url, headers=headers, stream=True, timeout=self._timeout) as response:
+                    if response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                        # the part file is complete if it is as long as the file, or failing that matches its checksum
+                        content_range = response.headers.get('Content-Range', '')
+                        size = self._total_size(response, offset) if '/' in content_range else None
+                        if size == offset or (size is None and checksum and self._sha256(part_path) == checksum):
+                            break
+                        size = None
+                        os.remove(part_path)
+                        continue
+
+                    response.raise_for_status()
+                    if response.status_code != HTTPStatus.PARTIAL_CONTENT:
+                        offset = 0
+                    size = self._total_size(response, offset)
+                    if size is not None:
+                        progress.total += size - offset
+                        progress.refresh()
+
+                    with open(part_path, 'ab' if offset else 'wb') as part_file:
+                        for chunk in response.iter_content(self._chunk_size):
+                            part_file.write(chunk)
+                            transferred += len(chunk)
+                            progress.update(len(chunk))
+
+                # a connection closed early leaves a short part file which the next attempt resumes
+                if size is None or os.path.getsize(part_path) >= size:
+                    break
+
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self._retries:
+                    raise
+        else:
+            raise UserWarning(f'Incomplete download of {url} after {self._retries + 1} attempts')
+
+        actual_size = os.path.getsize(part_path)
+        if size is not None and actual_size != size:
+            raise UserWarning(f'Incomplete download: {actual_size} of {size} bytes')
+        if checksum and self._sha256(part_path) != checksum:
+            os.remove(part_path)
+            raise UserWarning(f'Checksum mismatch for {file_path}')
+
+        os.replace(part_path, file_path)
 
-            response = requests.head(url)
-            if response.status_code != HTTPStatus.OK:
-                print(f'Unable to download {band}: {response.status_code} {response.reason}')
-                continue
+        return Download(url, file_path, actual_size, transferred, time.time() - start)
+
+    @staticmethod
+    def _total_size(response: requests.Response, offset: int) -> Optional[int]:
+
+        content_range = response.headers.get('Content-Range', '')
+        if '/' in content_range and not content_range.endswith('/*'):
+            return int(content_range.split('/')[-1])
+        if 'Content-Length' in response.headers:
+            return int(response.headers['Content-Length']) + offset
+
+        return None
+
+    @staticmethod
+    def _get_checksum(scene: Scene, band: str) -> Optional[str]:
+        """ SHA-256 hex digest from a STAC file:checksum multihash, if the asset has one """
 
-            self._download_from_url(url, file_name=scene.identity)
+        checksum = scene.links.get(band, {}).get('file:checksum')
+        if checksum and checksum.startswith('1220'):
+            return checksum[4:].lower()
 
-    def stream(self, scene: Scene, bands: List[str], boundary: GeoPolygon = None) -> Image:
+        return None
 
-        band_stack = []
+    @staticmethod
+    def _sha256(file_path: str) -> str:
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def stream(self, scene: Scene, bands: List[str], boundary: GeoPolygon = None, resampling: str = 'bilinear') -> Image:
+        """ Read the bands of a scene over /vsicurl/ concurrently into one preallocated stack
+        The pixel window is worked out once, on the grid of the finest band, and coarser bands or bands on
+        another grid are resampled onto it as they are read
+        """
+
+        urls = []
         for band in bands:
             try:
-                url = self._get_url(scene, band)
+                urls.append(self._get_url(scene, band))
             except UserWarning as e:
                 print(e)
-                continue
 
-            image_dataset = gdal.Open('/vsicurl/' + url)
-            if not image_dataset:
-                raise UserWarning(f'Unable to stream band: {band} {url}')
+        if not urls:
+            raise UserWarning(f'None of the bands {bands} can be streamed')
+
+        if self._cache_server:
+            self._cache_server.start()
+            urls = [self._cache_server.url_for(url) for url in urls]
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+
+            def open_remote(url: str) -> gdal.Dataset:
+
+                with self._stream_options():
+                    return self._open_remote(url)
+
+            datasets = list(executor.map(open_remote, urls))
+
+            # the finest band defines the output grid
+            target = min(datasets, key=lambda dataset: abs(dataset.GetGeoTransform()[1]))
+            geo_transform = Geotransform.from_tuple(target.GetGeoTransform())
+            try:
+                epsg = CRS.from_wkt(target.GetProjection()).to_epsg()
+            except CRSError:
+                epsg = None
+
             if boundary:
-                try:
-                    crs = CRS(image_dataset.GetProjection())
-                    boundary = boundary.transform(crs.to_epsg())
-                except CRSError:
-                    continue
-                band = self._image_loader.load_from_dataset_and_clip(image_dataset, boundary)
+                if boundary.epsg != epsg:
+                    boundary = boundary.transform(epsg)
+                x_min, y_min, x_max, y_max = [int(bound) for bound in boundary.to_pixel(geo_transform).polygon.bounds]
+                x_min, y_min = max(x_min, 0), max(y_min, 0)
+                x_max, y_max = min(x_max, target.RasterXSize), min(y_max, target.RasterYSize)
+                if x_max <= x_min or y_max <= y_min:
+                    raise UserWarning(f'Boundary does not overlap the scene {scene.identity}')
             else:
-                band = self._image_loader.load_from_dataset(image_dataset)
-            band_stack.append(band)
+                x_min, y_min, x_max, y_max = 0, 0, target.RasterXSize, target.RasterYSize
 
-        if len(band_stack) > 1:
-            return Image.stack(band_stack)
-        else:
-            return band_stack[0]
+            window = (x_min, y_min, x_max - x_min, y_max - y_min)
+            subset_geo_transform = geo_transform.subset(x=x_min, y=y_min)
+            dtype = np.result_type(*[gdal_array.GDALTypeCodeToNumericTypeCode(dataset.GetRasterBand(1).DataType)
+                                     for dataset in datasets])
+            stack = np.empty((len(datasets), window[3], window[2]), dtype=dtype)
+
+            def read(index: int):
+
+                with self._stream_options():
+                    self._read_window(datasets[index], target, window, subset_geo_transform, resampling, stack[index])
+
+            list(executor.map(read, range(len(datasets))))
+
+        pixels = stack[0] if len(datasets) == 1 else stack.transpose(1, 2, 0)
+        image = Image(pixels, subset_geo_transform, epsg, target.GetRasterBand(1).GetNoDataValue())
+
+        if boundary:
+            image = image.clip_with(boundary.to_pixel(subset_geo_transform), mask_value=0, copy=False)
+
+        return image
+
+    @staticmethod
+    def _read_window(
+            dataset: gdal.Dataset,
+            target: gdal.Dataset,
+            window: Tuple[int, int, int, int],
+            geo_transform: Geotransform,
+            resampling: str,
+            output: np.ndarray):
+        """ Read a window of the target grid from dataset into output, resampling if dataset is on another grid """
+
+        if dataset.GetGeoTransform() == target.GetGeoTransform() and dataset.GetProjection() == target.GetProjection():
+            dataset.GetRasterBand(1).ReadAsArray(*window, buf_obj=output)
+            return
+
+        x_min, y_max = geo_transform.upper_left_x, geo_transform.upper_left_y
+        x_max = x_min + window[2] * geo_transform.pixel_width
+        y_min = y_max - window[3] * geo_transform.pixel_height
+
+        warped = gdal.Warp('', dataset, format='MEM', outputBounds=(x_min, y_min, x_max, y_max),
+                           width=window[2], height=window[3], dstSRS=target.GetProjection(), resampleAlg=resampling)
+        output[:] = warped.GetRasterBand(1).ReadAsArray()
+
+    @staticmethod
+    def _open_remote(url: str) -> gdal.Dataset:
+
+        dataset = gdal.Open('/vsicurl/' + url)
+        if not dataset:
+            raise UserWarning(f'Unable to stream: {url}')
+
+        return dataset
+
+    @contextmanager
+    def _stream_options(self):
+        """ Apply the GDAL network options to the calling thread only, restoring its previous values afterwards
+        Thread-local options leave other threads of the process, including concurrent streams, untouched
+        """
+
+        previous = {key: gdal.GetThreadLocalConfigOption(key) for key in self._stream_config}
+        for key, value in self._stream_config.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+        try:
+            yield
+        finally:
+            for key, value in previous.items():
+                gdal.SetThreadLocalConfigOption(key, value)
 
     @staticmethod
     def _get_url(scene: Scene, band: str) -> str:
@@ -71,7 +340,3 @@ class Downloader:
             return scene.links[band]['href']
         except KeyError:
             raise UserWarning(f'Band {band} does not exist {scene.links}')
-
-    def _download_from_url(self, url: str, file_name: str):
-
-        urlretrieve(url, f'{self._download_directory}/{file_name}.tif')
@@ -1,15 +1,22 @@
-import requests
+import hashlib
 import json
+import os
+import time
+import requests
 from enum import Enum
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterator, Optional, Tuple
 from shapely.geometry import shape, Polygon
 
 from eopy.cloud.scene import Scene
+from eopy.cloud.session import create_session
 from eopy.geometry import GeoPolygon
 from eopy.tools import gis
 
 
+DEFAULT_API_URL = 'https://sat-api.developmentseed.org/stac/search'
+
+
 class Satellite(Enum):
 
     Sentinel2 = 'sentinel-2-l1c'
@@ -17,9 +24,32 @@ class Satellite(Enum):
 
 
 class Searcher:
+    """ Search a STAC API for scenes, following pagination and caching responses on disk """
+    def __init__(
+            self,
+            api_url: str = DEFAULT_API_URL,
+            cache_directory: Optional[str] = None,
+            cache_ttl: float = 24 * 60 * 60,
+            page_size: int = 500,
+            timeout: float = 30,
+            retries: int = 3,
+            session: Optional[requests.Session] = None):
+        """ cache_ttl is the age in seconds after which a cached response is requested again """
+
+        self._api_url = api_url
+        self._cache_directory = cache_directory
+        self._cache_ttl = cache_ttl
+        self._page_size = page_size
+        self._timeout = timeout
+        self._session = session or self._create_session(retries)
+
+    @staticmethod
+    def _create_session(retries: int) -> requests.Session:
+
+        session = create_session(retries)
+        session.headers.update({'Content-Type': 'application/json'})
 
-    def __init__(self):
-        self._api_url = 'https://sat-api.developmentseed.org/stac/search'
+        return session
 
     def search(
             self,
@@ -27,11 +57,12 @@ class Searcher:
             satellite: Satellite = None,
             start: datetime = None, end: datetime = None,
             cloud_min: float = 0, cloud_max: float = 100,
-            limit: int = 1000) -> List[Scene]:
+            limit: Optional[int] = None) -> Iterator[Scene]:
+        """ Yield the matching scenes page by page, up to limit scenes (all of them by default) """
 
         params = {
             'bbox': list(boundary.polygon.exterior.bounds),
-            'limit': limit,
+            'limit': min(self._page_size, limit) if limit else self._page_size,
             'query': {
                 'eo:cloud_cover': {
                     'lt': cloud_max,
@@ -57,44 +88,113 @@ class Searcher:
                 time_query += f"/{end.strftime('%Y-%m-%dT%H:%M:%SZ')}"
             params['time'] = time_query
 
-        response = requests.post(self._api_url, data=json.dumps(params), headers={'Content-Type': 'application/json'})
-        response_json = response.json()
+        count = 0
+        for page in self._pages(params):
+            for result in page.get('features', []):
+                if limit and count >= limit:
+                    return
+                count += 1
+                yield self._to_scene(result, boundary)
 
-        if len(response_json['features']) == 0:
+        if count == 0:
             raise NoSearchResultsFound()
 
-        scene_list = []
-        for result in response_json['features']:
-            polygon = shape(result.get('geometry'))
-            area_coverage = self._calculate_area_coverage(boundary.polygon, polygon)
-            properties = result.get('properties', {})
-
-            scene_list.append(
-                Scene(
-                    identity=result.get('id'),
-                    satellite_name=properties.get('eo:platform'),
-                    cloud_coverage=properties.get('eo:cloud_cover'),
-                    area_coverage=area_coverage,
-                    date=datetime.strptime(properties.get('datetime').split('.')[0], '%Y-%m-%dT%H:%M:%S'),
-                    thumbnail=result.get('assets', {}).get('thumbnail', {}).get('href'),
-                    links=result.get('assets', {}),
-                    polygon=GeoPolygon(polygon, epsg=gis.WGS84_EPSG),
-                    epsg=properties.get('eo:epsg')
-                )
-            )
-
-        return scene_list
+    def _pages(self, params: Dict) -> Iterator[Dict]:
+        """ Follow STAC next links, or the page counter of older sat-api responses, until the results run out """
+
+        request = ('POST', self._api_url, params)
+        while request:
+            method, url, body = request
+            page = self._request(method, url, body)
+            yield page
+
+            request = self._next_request(page, url, body)
 
     @staticmethod
-    def _calculate_area_coverage(search_boundary: Polygon, scene_boundary: Polygon) -> float:
+    def _next_request(page: Dict, url: str, body: Optional[Dict]) -> Optional[Tuple[str, str, Optional[Dict]]]:
+
+        if not page.get('features'):
+            return None
+
+        for link in page.get('links', []):
+            if link.get('rel') == 'next':
+                method = link.get('method', 'GET').upper()
+                next_body = link.get('body')
+                if method == 'POST' and link.get('merge', False):
+                    next_body = {**(body or {}), **(next_body or {})}
+                return method, link['href'], next_body if method == 'POST' else None
+
+        meta = page.get('meta', {})
+        if body is not None and 'found' in meta and 'page' in meta and 'limit' in meta \
+                and meta['page'] * meta['limit'] < meta['found']:
+            return 'POST', url, {**body, 'page': meta['page'] + 1}
+
+        return None
+
+    def _request(self, method: str, url: str, body: Optional[Dict]) -> Dict:
 
-        intersection_area = scene_boundary.intersection(search_boundary).area
+        cache_path = self._cache_path(method, url, body) if self._cache_directory else None
+        if cache_path and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < self._cache_ttl:
+            with open(cache_path) as cache_file:
+                return json.load(cache_file)
 
-        if intersection_area != 0.:
-            return (search_boundary.area / intersection_area) * 100
+        if method == 'POST':
+            response = self._session.post(url, data=json.dumps(body), timeout=self._timeout)
         else:
+            response = self._session.get(url, timeout=self._timeout)
+        response.raise_for_status()
+        page = response.json()
+
+        if cache_path:
+            os.makedirs(self._cache_directory, exist_ok=True)
+            temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w') as cache_file:
+                json.dump(page, cache_file)
+            os.replace(temporary_path, cache_path)
+
+        return page
+
+    def _cache_path(self, method: str, url: str, body: Optional[Dict]) -> str:
+
+        key = hashlib.sha1(json.dumps([method, url, body], sort_keys=True).encode()).hexdigest()
+
+        return os.path.join(self._cache_directory, f'search_{key}.json')
+
+    def clear_cache(self):
+
+        if self._cache_directory and os.path.isdir(self._cache_directory):
+            for file_name in os.listdir(self._cache_directory):
+                if file_name.startswith('search_') and file_name.endswith('.json'):
+                    os.remove(os.path.join(self._cache_directory, file_name))
+
+    def _to_scene(self, result: Dict, boundary: GeoPolygon) -> Scene:
+
+        polygon = shape(result.get('geometry'))
+        area_coverage = self._calculate_area_coverage(boundary.polygon, polygon)
+        properties = result.get('properties', {})
+
+        return Scene(
+            identity=result.get('id'),
+            satellite_name=properties.get('eo:platform'),
+            cloud_coverage=properties.get('eo:cloud_cover'),
+            area_coverage=area_coverage,
+            date=datetime.strptime(properties.get('datetime').split('.')[0].rstrip('Z'), '%Y-%m-%dT%H:%M:%S'),
+            thumbnail=result.get('assets', {}).get('thumbnail', {}).get('href'),
+            links=result.get('assets', {}),
+            polygon=GeoPolygon(polygon, epsg=gis.WGS84_EPSG),
+            epsg=properties.get('eo:epsg')
+        )
+
+    @staticmethod
+    def _calculate_area_coverage(search_boundary: Polygon, scene_boundary: Polygon) -> float:
+
+        """ Percentage of the search boundary covered by the scene """
+
+        if search_boundary.area == 0. or not scene_boundary.intersects(search_boundary):
             return 0.
 
+        return scene_boundary.intersection(search_boundary).area / search_boundary.area * 100
+
 
 class NoSearchResultsFound(Exception):
     pass
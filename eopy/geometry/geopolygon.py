@@ -71,7 +71,7 @@ class GeoPolygon:
                 return GeoPolygon(Polygon(exterior), self.epsg)
         elif self.polygon.geom_type == 'MultiPolygon':
 
-            multi_polygon = MultiPolygon([GeoPolygon(sub_polygon, self.epsg).to_pixel(geo_transform).polygon for sub_polygon in self.polygon])
+            multi_polygon = MultiPolygon([GeoPolygon(sub_polygon, self.epsg).to_pixel(geo_transform).polygon for sub_polygon in self.polygon.geoms])
             return GeoPolygon(multi_polygon, self.epsg)
         else:
             raise UserWarning("polygon has an unexpected type.")
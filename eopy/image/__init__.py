@@ -1,3 +1,6 @@
 from eopy.image.geotransform import Geotransform
-from eopy.image.image import Image
+from eopy.image.image import Image, ImageWriter
 from eopy.image.loader import Loader
+from eopy.image.lazy import LazyImage
+from eopy.image.shared import SharedImage
+from eopy.image.cache import ImageCache
@@ -0,0 +1,187 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+import numpy as np
+from typing import Any, Callable, Optional
+
+from eopy.image.geotransform import Geotransform
+from eopy.image.image import Image, is_chunked
+
+
+class ImageCache:
+    """ On-disk cache of Images returned by eopy operations, keyed on the operation, its inputs and its parameters
+    Image inputs are identified by their checksum and file or directory paths by the size and modification time of
+    their files, so a changed input is a miss. Pixels are stored as .npy next to a small JSON of the georeferencing,
+    and the least recently read entries are evicted once the directory grows past max_bytes
+    """
+    def __init__(self, directory: str, max_bytes: int = 1 << 32, memory_map: bool = False):
+        """ memory_map returns read-only memory-mapped pixels, so a cached scene is only read as it is used """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_map = memory_map
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+
+        return f'ImageCache - Hits: {self.hits} | Misses: {self.misses} | Directory: {self.directory}'
+
+    def memoise(self, function: Callable = None, version: str = '') -> Callable:
+        """ Decorate a function returning an Image, so calls with the same inputs return the cached Image
+        Bump version when the function changes, calls whose inputs cannot be identified are not cached
+        """
+
+        if function is None:
+            return functools.partial(self.memoise, version=version)
+
+        name = f'{getattr(function, "__module__", "")}.{getattr(function, "__qualname__", repr(function))}:{version}'
+
+        @functools.wraps(function)
+        def memoised(*args, **kwargs):
+
+            try:
+                key = self.key(name, *args, **kwargs)
+            except UserWarning:
+                return function(*args, **kwargs)
+
+            image = self.get(key)
+            if image is None:
+                image = function(*args, **kwargs)
+                if isinstance(image, Image) and not is_chunked(image.pixels):
+                    self.put(key, image)
+
+            return image
+
+        return memoised
+
+    def key(self, name: str, *args, **kwargs) -> str:
+
+        digest = hashlib.blake2b(name.encode(), digest_size=20)
+        for value in args:
+            digest.update(_token(value))
+        for keyword, value in sorted(kwargs.items()):
+            digest.update(keyword.encode() + b'=' + _token(value))
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Image]:
+
+        pixels_path, metadata_path = self._paths(key)
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+            pixels = np.load(pixels_path, mmap_mode='r' if self.memory_map else None)
+            os.utime(pixels_path)
+            os.utime(metadata_path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+
+        return Image(pixels, Geotransform.from_tuple(metadata['geotransform']), metadata['epsg'], metadata['no_data_value'])
+
+    def put(self, key: str, image: Image):
+
+        pixels_path, metadata_path = self._paths(key)
+        os.makedirs(os.path.dirname(pixels_path), exist_ok=True)
+
+        # pixels first and metadata last, each renamed into place, so an entry is only visible once complete
+        temporary_path = f'{pixels_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as temporary_file:
+            np.save(temporary_file, np.asarray(image.pixels), allow_pickle=False)
+        os.replace(temporary_path, pixels_path)
+
+        metadata = {'geotransform': image.geotransform.tuple, 'epsg': image.epsg, 'no_data_value': image.no_data_value}
+        temporary_path = f'{metadata_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w') as temporary_file:
+            json.dump(metadata, temporary_file)
+        os.replace(temporary_path, metadata_path)
+
+        self.evict()
+
+    def evict(self):
+        """ Delete the least recently read entries until the cache is under 90 % of max_bytes
+        The .npy and .json of an entry are deleted together, so no entry is left half evicted
+        """
+
+        entries = {}
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = os.path.splitext(path)[0] if file_name.endswith(('.npy', '.json')) else path
+                last_read, size, paths = entries.get(entry, (0., 0, []))
+                entries[entry] = (max(last_read, status.st_mtime), size + status.st_size, paths + [path])
+
+        total = sum(size for _, size, _ in entries.values())
+        if total <= self.max_bytes:
+            return
+
+        for _, size, paths in sorted(entries.values()):
+            if total <= 0.9 * self.max_bytes:
+                break
+            # metadata first, as in put an entry is only visible while its metadata exists
+            for path in sorted(paths, key=lambda path: not path.endswith('.json')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                try:
+                    os.remove(os.path.join(root, file_name))
+                except FileNotFoundError:
+                    pass
+
+    def _paths(self, key: str):
+
+        path = os.path.join(self.directory, key[:2], key)
+        return f'{path}.npy', f'{path}.json'
+
+
+def _token(value: Any) -> bytes:
+    """ Bytes identifying an argument: the checksum of an Image, the size and modification time of an existing file
+    or of every file in an existing directory (e.g. a .SAFE product) or the pickle of anything else
+    """
+
+    if isinstance(value, Image):
+        return value.checksum().encode()
+
+    if isinstance(value, str) and os.path.isfile(value):
+        status = os.stat(value)
+        return repr((os.path.abspath(value), status.st_size, status.st_mtime_ns)).encode()
+
+    if isinstance(value, str) and os.path.isdir(value):
+        files = []
+        for root, _, file_names in os.walk(value):
+            for file_name in file_names:
+                status = os.stat(os.path.join(root, file_name))
+                files.append((os.path.relpath(os.path.join(root, file_name), value), status.st_size, status.st_mtime_ns))
+        return repr((os.path.abspath(value), sorted(files))).encode()
+
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(repr((value.shape, str(value.dtype))).encode(), digest_size=20)
+        digest.update(memoryview(np.ascontiguousarray(value)).cast('B'))
+        return digest.digest()
+
+    try:
+        return hashlib.blake2b(pickle.dumps(value, protocol=4), digest_size=20).digest()
+    except (pickle.PicklingError, TypeError, AttributeError):
+        raise UserWarning(f'Unable to identify argument {value!r}')
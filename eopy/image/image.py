@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 from scipy import ndimage
 from typing import List, Tuple, Optional
@@ -12,11 +13,25 @@ from shapely.geometry import Polygon
 from eopy.image import Geotransform
 from eopy.geometry import GeoPolygon
 
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = da = None
+
 GTIFF_DRIVER = 'GTiff'
 
 
+def is_chunked(pixels) -> bool:
+    """ Whether pixels are a chunked dask array rather than a numpy array """
+
+    return da is not None and isinstance(pixels, da.Array)
+
+
 class Image:
-    """ A generic image object using gdal with shape (y, x, band) """
+    """ A generic image object using gdal with shape (y, x, band)
+    pixels can also be a dask array, operations then stay lazy and run chunk by chunk until compute or save
+    """
     def __init__(self, pixels: np.ndarray, geotransform: Optional[Geotransform] = Geotransform.empty(), epsg: Optional[int] = None, no_data_value: float = 0.):
 
         self.pixels = pixels
@@ -32,6 +47,13 @@ class Image:
 
         return f'Image - Shape: {self.height}x{self.width}x{self.band_count} | EPSG: {self.epsg}'
 
+    def __reduce__(self):
+        """ Pickle the pixels with the geotransform tuple, EPSG code and no data value instead of the CRS object
+        With pickle protocol 5 and a buffer_callback contiguous pixels are passed as an out-of-band buffer, without a copy
+        """
+
+        return _restore_image, (self.pixels, self.geotransform.tuple, self.epsg, self.no_data_value)
+
     def __getitem__(self, image_slice) -> "Image":
 
         geo_transform = self.geotransform
@@ -112,7 +134,22 @@ class Image:
             (self.geotransform.upper_left_x, self.geotransform.upper_left_y)
         ]), epsg=self.epsg)
 
-    def clip_with(self, polygon: GeoPolygon, mask_value: float = np.nan) -> "Image":
+    def checksum(self) -> str:
+        """ Digest identifying the pixel values, shape, dtype and georeferencing of the image """
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((self.shape, str(self.dtype), self.geotransform.tuple, self.epsg)).encode())
+        if is_chunked(self.pixels):
+            digest.update(self.pixels.name.encode())
+        else:
+            digest.update(memoryview(np.ascontiguousarray(self.pixels)).cast('B'))
+
+        return digest.hexdigest()
+
+    def clip_with(self, polygon: GeoPolygon, mask_value: float = np.nan, copy: bool = True) -> "Image":
+        """ Subset to the bounds of a pixel polygon and mask the pixels outside it
+        With copy=False the pixels are masked in place, for callers that own the array
+        """
 
         if str(polygon.epsg) != str(self.epsg):
             print(f'Image and polygon do not have the same EPSG: {self.epsg}, {polygon.epsg}')  # Todo: turn into log message
@@ -129,25 +166,42 @@ class Image:
 
         subset = self[y:y + height, x:x + width]
 
-        subset.pixels = np.copy(subset.pixels)
-        subset.pixels[mask_pixels != 0] = mask_value
+        if copy and not is_chunked(subset.pixels):
+            subset.pixels = subset.pixels.copy()
+        if is_chunked(subset.pixels):
+            mask_pixels = mask_pixels[:, :, np.newaxis] if subset.pixels.ndim > 2 else mask_pixels
+            subset.pixels = da.where(mask_pixels != 0, mask_value, subset.pixels)
+        else:
+            subset.pixels[mask_pixels != 0] = mask_value
 
         return subset
 
     def upsample(self, factor: int) -> "Image":
 
-        resampled_pixels = ndimage.zoom(self.pixels, factor, order=0)
+        if is_chunked(self.pixels):
+            resampled_pixels = self.pixels.repeat(factor, axis=0).repeat(factor, axis=1)
+        else:
+            resampled_pixels = ndimage.zoom(self.pixels, factor, order=0)
         scaled_geo_transform = self.geotransform.scale(factor)
 
         return Image(resampled_pixels, scaled_geo_transform, self.epsg, self.no_data_value)
 
     def smooth(self, sigma: int = 5) -> "Image":
 
+        if is_chunked(self.pixels):
+            # each chunk needs the neighbouring pixels within the filter radius, bands are never split across chunks
+            depth = {0: int(4 * sigma + 0.5), 1: int(4 * sigma + 0.5), 2: 0}
+            depth = {axis: value for axis, value in depth.items() if axis < self.pixels.ndim}
+            pixels = self.pixels.rechunk({2: -1}) if self.pixels.ndim > 2 else self.pixels
+            smoothed = pixels.map_overlap(gaussian_filter, depth=depth, boundary='reflect', sigma=sigma)
+
+            return Image(smoothed, self.geotransform, self.epsg, self.no_data_value)
+
         return self.apply(lambda x: gaussian_filter(x, sigma=sigma))
 
     def apply(self, function: callable) -> "Image":
 
-        modified_pixels = function(np.copy(self.pixels))
+        modified_pixels = function(self.pixels.copy())
         return Image(modified_pixels, self.geotransform, self.epsg, self.no_data_value)
 
     @staticmethod
@@ -155,6 +209,11 @@ class Image:
 
         if len(images) == 1:
             raise UserWarning("Only one image has been provided")
+        elif any(is_chunked(image.pixels) for image in images):
+            stack = da.concatenate([image.pixels if image.band_count > 1 else image.pixels[:, :, np.newaxis]
+                                    for image in images], axis=2)
+
+            return Image(stack, images[0].geotransform, images[0].epsg, images[0].no_data_value)
         else:
             stack = np.zeros((images[0].height, images[0].width, sum([image.band_count for image in images])), dtype=images[0].dtype)
 
@@ -169,32 +228,63 @@ class Image:
 
             return Image(stack, images[0].geotransform, images[0].epsg, images[0].no_data_value)
 
-    def save(self, file_path: str, dtype: Optional[str] = None, metadata: dict = None, metadata_name: str = None):
+    def lazy(self) -> "LazyImage":
+        """ A LazyImage over these pixels, so following operations are recorded and run tile by tile """
+
+        from eopy.image.lazy import LazyImage
+
+        return LazyImage.from_image(self)
+
+    def share(self) -> "SharedImage":
+        """ Copy the pixels once into shared memory, the returned handle pickles to just its name and metadata """
+
+        from eopy.image.shared import SharedImage
+
+        return SharedImage.create(self)
+
+    def save(self, file_path: str, dtype: Optional[str] = None, metadata: dict = None, metadata_name: str = None, scheduler: Optional[str] = None):
+        """ Chunked pixels are computed and written one row of chunks at a time with the given dask scheduler """
 
         if not dtype:
             dtype = str(self.dtype)
 
-        gdal_data_type = self._get_gdal_data_type(dtype)
-        out_image = gdal.GetDriverByName(GTIFF_DRIVER)\
-            .Create(file_path, self.width, self.height, self.band_count, gdal_data_type)
-        out_image.SetGeoTransform(self.geotransform.tuple)
-        if metadata:
-            out_image.SetMetadata(metadata, metadata_name)
-        if self.crs:
-            out_image.SetProjection(self.crs.to_wkt())
+        writer = ImageWriter(file_path, self.width, self.height, self.band_count, dtype,
+                             self.geotransform, self.epsg, self.no_data_value, metadata, metadata_name)
+        if is_chunked(self.pixels):
+            self._write_chunks(writer, scheduler)
+        else:
+            writer.write(self.pixels)
+        writer.close()
 
-        if self.band_count > 1:
-            for band in range(self.band_count):
-                out_image.GetRasterBand(band+1).WriteArray(self.pixels[:, :, band])
-                if self.no_data_value is not None:
-                    out_image.GetRasterBand(band+1).SetNoDataValue(float(self.no_data_value))
+    def _write_chunks(self, writer: "ImageWriter", scheduler: Optional[str]):
 
-        else:
-            out_image.GetRasterBand(1).WriteArray(self.pixels)
-            if self.no_data_value is not None:
-                out_image.GetRasterBand(1).SetNoDataValue(self.no_data_value)
+        pixels = self.pixels.rechunk({2: -1}) if self.pixels.ndim > 2 else self.pixels
+        y_offsets = np.concatenate([[0], np.cumsum(pixels.chunks[0])])
+        x_offsets = np.concatenate([[0], np.cumsum(pixels.chunks[1])])
+
+        for row in range(len(pixels.chunks[0])):
+            blocks = [pixels.blocks[row, column] for column in range(len(pixels.chunks[1]))]
+            for column, block in enumerate(dask.compute(*blocks, scheduler=scheduler)):
+                writer.write(block, int(x_offsets[column]), int(y_offsets[row]))
+
+    def compute(self, scheduler: Optional[str] = None) -> "Image":
+        """ An Image holding the computed pixels of a chunked image """
+
+        if not is_chunked(self.pixels):
+            return self
+
+        return Image(self.pixels.compute(scheduler=scheduler), self.geotransform, self.epsg, self.no_data_value)
+
+    def chunk(self, chunks: Tuple[int, int] = (1024, 1024)) -> "Image":
+        """ An Image backed by a dask array with chunks of (y, x) pixels and all bands """
+
+        if da is None:
+            raise UserWarning('dask is needed for chunked images')
+
+        pixels = self.pixels.rechunk(chunks + (-1,) * (self.pixels.ndim - 2)) if is_chunked(self.pixels) \
+            else da.from_array(self.pixels, chunks=chunks + (-1,) * (self.pixels.ndim - 2))
 
-        out_image.FlushCache()
+        return Image(pixels, self.geotransform, self.epsg, self.no_data_value)
 
     def normalise(self, output_range: Tuple[float, float] = (0, 1), current_range: Tuple[float, float] = None) -> "Image":
 
@@ -254,3 +344,51 @@ class Image:
             return gdal.GDT_Float64
         else:
             raise UserWarning("Unrecognised data type.")
+
+
+def _restore_image(pixels: np.ndarray, geotransform: Tuple, epsg: Optional[int], no_data_value: float) -> Image:
+
+    return Image(pixels, Geotransform.from_tuple(geotransform), epsg, no_data_value)
+
+
+class ImageWriter:
+    """ Write a GeoTIFF window by window so large outputs never need to be held in memory """
+    def __init__(
+            self,
+            file_path: str,
+            width: int,
+            height: int,
+            band_count: int,
+            dtype: str,
+            geotransform: Geotransform,
+            epsg: Optional[int] = None,
+            no_data_value: Optional[float] = None,
+            metadata: dict = None,
+            metadata_name: str = None):
+
+        self.file_path = file_path
+        self.band_count = band_count
+        self._dataset = gdal.GetDriverByName(GTIFF_DRIVER)\
+            .Create(file_path, width, height, band_count, Image._get_gdal_data_type(dtype))
+        self._dataset.SetGeoTransform(geotransform.tuple)
+        if metadata:
+            self._dataset.SetMetadata(metadata, metadata_name)
+        if epsg:
+            self._dataset.SetProjection(CRS.from_epsg(epsg).to_wkt())
+        if no_data_value is not None:
+            for band in range(band_count):
+                self._dataset.GetRasterBand(band + 1).SetNoDataValue(float(no_data_value))
+
+    def write(self, pixels: np.ndarray, x: int = 0, y: int = 0):
+        """ Write pixels with shape (y, x) or (y, x, band) with their upper left corner at pixel (x, y) """
+
+        if pixels.ndim > 2:
+            for band in range(pixels.shape[2]):
+                self._dataset.GetRasterBand(band + 1).WriteArray(pixels[:, :, band], x, y)
+        else:
+            self._dataset.GetRasterBand(1).WriteArray(pixels, x, y)
+
+    def close(self):
+
+        self._dataset.FlushCache()
+        self._dataset = None
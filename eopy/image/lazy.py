@@ -0,0 +1,286 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from osgeo import gdal, gdal_array
+from pyproj import CRS
+from pyproj.exceptions import CRSError
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from eopy.image.geotransform import Geotransform
+from eopy.image.image import Image, ImageWriter
+
+Window = Tuple[int, int, int, int]
+
+
+class LazyImage:
+    """ An image whose pixels are only computed, tile by tile, when it is saved or computed
+    Each LazyImage is a source that reads a window of pixels and a chain of elementwise operations recorded with
+    map, which are fused so every tile goes through the whole chain in one pass without full size intermediates
+    Pixel blocks always have shape (y, x, band)
+    """
+    def __init__(
+            self,
+            source: Callable[[int, int, int, int], np.ndarray],
+            height: int,
+            width: int,
+            geotransform: Geotransform,
+            epsg: Optional[int] = None,
+            no_data_value: float = 0.,
+            operations: Tuple[Callable[[np.ndarray], np.ndarray], ...] = (),
+            band_count: Optional[int] = None,
+            dtype: Optional[np.dtype] = None):
+
+        self._source = source
+        self._operations = operations
+        self.height = height
+        self.width = width
+        self.geotransform = geotransform
+        self.epsg = epsg
+        self.no_data_value = no_data_value
+        self._band_count = band_count
+        self._dtype = np.dtype(dtype) if dtype is not None else None
+
+    def __repr__(self) -> str:
+
+        return f'LazyImage - Shape: {self.height}x{self.width}x{self.band_count} | EPSG: {self.epsg} | ' \
+               f'Operations: {len(self._operations)}'
+
+    @classmethod
+    def open(cls, file_path: str) -> "LazyImage":
+        """ A lazy image reading windows straight from a GDAL dataset, with one dataset handle per thread """
+
+        dataset = gdal.Open(file_path)
+        if dataset is None:
+            raise UserWarning(f'Unable to open {file_path}')
+
+        handles = threading.local()
+
+        def read(x: int, y: int, width: int, height: int) -> np.ndarray:
+
+            if not hasattr(handles, 'dataset'):
+                handles.dataset = gdal.Open(file_path)
+            pixels = handles.dataset.ReadAsArray(x, y, width, height)
+
+            return pixels.transpose(1, 2, 0) if pixels.ndim > 2 else pixels[:, :, np.newaxis]
+
+        try:
+            epsg = CRS.from_wkt(dataset.GetProjection()).to_epsg()
+        except CRSError:
+            epsg = None
+
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(dataset.GetRasterBand(1).DataType)
+
+        return cls(read, dataset.RasterYSize, dataset.RasterXSize, Geotransform.from_tuple(dataset.GetGeoTransform()),
+                   epsg, dataset.GetRasterBand(1).GetNoDataValue(), band_count=dataset.RasterCount, dtype=dtype)
+
+    @classmethod
+    def from_image(cls, image: Image) -> "LazyImage":
+
+        pixels = image.pixels if image.pixels.ndim > 2 else image.pixels[:, :, np.newaxis]
+
+        def read(x: int, y: int, width: int, height: int) -> np.ndarray:
+
+            return pixels[y:y + height, x:x + width]
+
+        return cls(read, image.height, image.width, image.geotransform, image.epsg, image.no_data_value,
+                   band_count=pixels.shape[2], dtype=pixels.dtype)
+
+    @property
+    def band_count(self) -> int:
+
+        if self._band_count is None:
+            self._sample()
+        return self._band_count
+
+    @property
+    def dtype(self) -> np.dtype:
+
+        if self._dtype is None:
+            self._sample()
+        return self._dtype
+
+    def _sample(self):
+        """ Run the chain on a single pixel to learn the output bands and type, only when they are not known """
+
+        sample = self.read(0, 0, 1, 1)
+        self._band_count, self._dtype = sample.shape[2], sample.dtype
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+
+        return self.height, self.width, self.band_count
+
+    def read(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """ Pixels of a window, running the source read and every recorded operation on just that window """
+
+        block = self._source(x, y, width, height)
+        for operation in self._operations:
+            block = operation(block)
+
+        return block
+
+    def map(self, function: Callable[[np.ndarray], np.ndarray]) -> "LazyImage":
+        """ Record an elementwise function of a (y, x, band) block, it must not depend on neighbouring tiles """
+
+        return self._chain(function)
+
+    def _chain(self, function: Callable[[np.ndarray], np.ndarray], band_count: Optional[int] = None, dtype=None) -> "LazyImage":
+        """ map, for operations whose output bands or type are known without running them """
+
+        return LazyImage(self._source, self.height, self.width, self.geotransform, self.epsg, self.no_data_value,
+                         self._operations + (function,), band_count, dtype)
+
+    def combine(self, other: "LazyImage", function: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> "LazyImage":
+        """ Elementwise function of the blocks of two lazy images on the same grid """
+
+        if (self.height, self.width) != (other.height, other.width):
+            raise UserWarning(f'Images have different sizes: {self.shape} and {other.shape}')
+
+        def read(x: int, y: int, width: int, height: int) -> np.ndarray:
+
+            return function(self.read(x, y, width, height), other.read(x, y, width, height))
+
+        return LazyImage(read, self.height, self.width, self.geotransform, self.epsg, self.no_data_value)
+
+    def _arithmetic(self, other, function: Callable) -> "LazyImage":
+
+        if isinstance(other, LazyImage):
+            return self.combine(other, function)
+
+        return self.map(lambda block: function(block, other))
+
+    def __add__(self, other) -> "LazyImage":
+
+        return self._arithmetic(other, np.add)
+
+    def __sub__(self, other) -> "LazyImage":
+
+        return self._arithmetic(other, np.subtract)
+
+    def __mul__(self, other) -> "LazyImage":
+
+        return self._arithmetic(other, np.multiply)
+
+    def __truediv__(self, other) -> "LazyImage":
+
+        return self._arithmetic(other, np.true_divide)
+
+    def astype(self, dtype: Union[str, type]) -> "LazyImage":
+
+        return self._chain(lambda block: block.astype(dtype), self._band_count, dtype)
+
+    def select(self, bands: List[int]) -> "LazyImage":
+
+        return self._chain(lambda block: block[:, :, bands], len(bands), self._dtype)
+
+    def add_index(self, band_1: int, band_2: int) -> "LazyImage":
+        """ Append the normalised difference of two bands, as Image.add_index """
+
+        if self.band_count == 1:
+            raise UserWarning(f'Image only has one band')
+
+        def add_index(block: np.ndarray) -> np.ndarray:
+
+            index = (block[:, :, band_1] - block[:, :, band_2]) / (block[:, :, band_1] + block[:, :, band_2])
+            return np.dstack([block, index])
+
+        return self.map(add_index)
+
+    def normalise(self, output_range: Tuple[float, float] = (0, 1), current_range: Tuple[float, float] = None) -> "LazyImage":
+
+        if not current_range:
+            statistics = self.statistics()
+            current_range = (np.nanmin(statistics['min']), np.nanmax(statistics['max']))
+
+        delta1 = current_range[1] - current_range[0]
+        delta2 = output_range[1] - output_range[0]
+
+        return self.map(lambda x: (delta2 * (x - current_range[0]) / delta1) + output_range[0])
+
+    def windows(self, tile_size: int = 1024) -> Iterator[Window]:
+
+        for y in range(0, self.height, tile_size):
+            for x in range(0, self.width, tile_size):
+                yield x, y, min(tile_size, self.width - x), min(tile_size, self.height - y)
+
+    def _map_tiles(self, tile_size: int, workers: Optional[int]) -> Iterator[Tuple[Window, np.ndarray]]:
+        """ Computed tiles in order, with at most a few tiles per worker in flight so memory stays bounded """
+
+        windows = list(self.windows(tile_size))
+        in_flight = 2 * (workers or min(32, (os.cpu_count() or 1) + 4))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(windows), in_flight):
+                batch = windows[start:start + in_flight]
+                for window, block in zip(batch, executor.map(lambda w: self.read(*w), batch)):
+                    yield window, block
+
+    def statistics(self, tile_size: int = 1024, workers: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """ NaN-aware min, max, mean and standard deviation of every band in a single pass over the tiles """
+
+        minimum = np.full(self.band_count, np.inf)
+        maximum = np.full(self.band_count, -np.inf)
+        count, total, squares = np.zeros(self.band_count), np.zeros(self.band_count), np.zeros(self.band_count)
+
+        for _, block in self._map_tiles(tile_size, workers):
+            values = block.reshape(-1, self.band_count).astype(np.float64)
+            valid = ~np.isnan(values)
+            minimum = np.fmin(minimum, np.where(valid, values, np.inf).min(axis=0))
+            maximum = np.fmax(maximum, np.where(valid, values, -np.inf).max(axis=0))
+            count += valid.sum(axis=0)
+            total += np.where(valid, values, 0).sum(axis=0)
+            squares += np.where(valid, values ** 2, 0).sum(axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.clip(squares / count - mean ** 2, 0, None))
+
+        return {'min': minimum, 'max': maximum, 'mean': mean, 'std': std}
+
+    def percentiles(self, q: Tuple[float, ...], bins: int = 4096, tile_size: int = 1024, workers: Optional[int] = None) -> np.ndarray:
+        """ Approximate percentiles of every band, shape (len(q), bands), from histograms built tile by tile """
+
+        statistics = self.statistics(tile_size, workers)
+        histograms = np.zeros((self.band_count, bins))
+
+        for _, block in self._map_tiles(tile_size, workers):
+            values = block.reshape(-1, self.band_count)
+            for band in range(self.band_count):
+                band_values = values[:, band]
+                histograms[band] += np.histogram(band_values[~np.isnan(band_values)], bins=bins,
+                                                 range=(statistics['min'][band], statistics['max'][band]))[0]
+
+        result = np.zeros((len(q), self.band_count))
+        for band in range(self.band_count):
+            edges = np.linspace(statistics['min'][band], statistics['max'][band], bins + 1)
+            cumulative = np.cumsum(histograms[band]) / max(histograms[band].sum(), 1)
+            result[:, band] = np.interp(np.asarray(q) / 100., np.concatenate([[0], cumulative]), edges)
+
+        return result
+
+    def compute(self, tile_size: int = 1024, workers: Optional[int] = None) -> Image:
+
+        pixels = np.empty(self.shape, dtype=self.dtype)
+        for (x, y, width, height), block in self._map_tiles(tile_size, workers):
+            pixels[y:y + height, x:x + width] = block
+
+        if self.band_count == 1:
+            pixels = pixels[:, :, 0]
+
+        return Image(pixels, self.geotransform, self.epsg, self.no_data_value)
+
+    def save(
+            self,
+            file_path: str,
+            dtype: Optional[str] = None,
+            metadata: dict = None,
+            metadata_name: str = None,
+            tile_size: int = 1024,
+            workers: Optional[int] = None):
+        """ Run the whole chain tile by tile, writing each tile as soon as it is computed """
+
+        writer = ImageWriter(file_path, self.width, self.height, self.band_count, dtype or str(self.dtype),
+                             self.geotransform, self.epsg, self.no_data_value, metadata, metadata_name)
+        for (x, y, _, _), block in self._map_tiles(tile_size, workers):
+            writer.write(block, x, y)
+        writer.close()
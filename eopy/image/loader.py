@@ -1,22 +1,61 @@
 from eopy.image import Image
 from eopy.image import Geotransform
+from eopy.image.lazy import LazyImage
 from eopy.geometry import GeoPolygon
 
-from typing import Optional
+import os
+import threading
+import numpy as np
+from typing import Optional, Tuple, Union
 from pyproj import CRS
 from pyproj.exceptions import CRSError
 from osgeo import gdal
 
+from eopy.image.image import da
+
 
 class Loader:
 
-    def load(self, file_path: str, extent: GeoPolygon = None) -> Image:
+    def load(self, file_path: str, extent: GeoPolygon = None, lazy: bool = False, chunks: Optional[Tuple[int, int]] = None) -> Union[Image, LazyImage]:
+        """ lazy=True returns a LazyImage which reads windows of the file only when it is saved or computed
+        chunks=(y, x) returns an Image backed by a dask array read chunk by chunk, rounded up to whole GDAL blocks,
+        clipped to an extent like an eager load with the pixels outside it set to 0
+        """
+
+        if chunks:
+            image = self.load_chunked(file_path, chunks)
+            return image.clip_with(extent.to_pixel(image.geotransform), mask_value=0) if extent else image
+
+        if lazy:
+            if extent:
+                raise UserWarning('Clip a lazy image after computing it, extents are not supported when loading lazily')
+            return LazyImage.open(file_path)
 
         if extent:
             return self.load_from_dataset_and_clip(gdal.Open(file_path), extent)
         else:
             return self.load_from_dataset(gdal.Open(file_path))
 
+    def load_chunked(self, file_path: str, chunks: Tuple[int, int] = (1024, 1024)) -> Image:
+
+        if da is None:
+            raise UserWarning('dask is needed to load chunked images')
+
+        array = GdalArray(file_path)
+        dataset = gdal.Open(file_path)
+        block_y, block_x = dataset.GetRasterBand(1).GetBlockSize()[::-1]
+        chunks = (-(-chunks[0] // block_y) * block_y, -(-chunks[1] // block_x) * block_x) + (-1,) * (array.ndim - 2)
+
+        try:
+            epsg = CRS.from_wkt(dataset.GetProjection()).to_epsg()
+        except CRSError:
+            epsg = None
+
+        # the name identifies the dask layer, so loads of the same file with different chunks must not share it
+        pixels = da.from_array(array, chunks=chunks, name=f'gdal-{file_path}-{os.path.getmtime(file_path)}-{chunks}')
+
+        return Image(pixels, self._load_geotransform(dataset), epsg, self._get_no_data_value(dataset))
+
     def load_from_dataset_and_clip(self, image_dataset: gdal.Dataset, extent: GeoPolygon) -> Image:
 
         geo_transform = self._load_geotransform(image_dataset)
@@ -66,3 +105,47 @@ class Loader:
     def _get_no_data_value(self, image_dataset: gdal.Dataset) -> Optional[float]:
 
         return image_dataset.GetRasterBand(1).GetNoDataValue()
+
+
+class GdalArray:
+    """ Array-like view of a GDAL dataset with shape (y, x, band) or (y, x) that reads only the window it is indexed with
+    It opens one dataset handle per thread and process, so it can back dask arrays on any scheduler
+    """
+    def __init__(self, file_path: str):
+
+        self.file_path = file_path
+        dataset = gdal.Open(file_path)
+        if dataset is None:
+            raise UserWarning(f'Unable to open {file_path}')
+
+        self.shape = (dataset.RasterYSize, dataset.RasterXSize) + ((dataset.RasterCount,) if dataset.RasterCount > 1 else ())
+        self.dtype = dataset.GetRasterBand(1).ReadAsArray(0, 0, 1, 1).dtype
+        self.ndim = len(self.shape)
+        self._handles = {}
+
+    def __getstate__(self) -> dict:
+
+        return {**self.__dict__, '_handles': {}}
+
+    def __getitem__(self, key) -> np.ndarray:
+
+        key = (key if isinstance(key, tuple) else (key,)) + (slice(None),) * 3
+        windows = [k if isinstance(k, slice) else slice(k, k + 1) for k in key[:2]]
+        (y_start, y_stop, y_step), (x_start, x_stop, x_step) = [w.indices(n) for w, n in zip(windows, self.shape)]
+        height, width = max(y_stop - y_start, 0), max(x_stop - x_start, 0)
+
+        if height == 0 or width == 0:
+            pixels = np.empty((height, width) + self.shape[2:], dtype=self.dtype)
+        else:
+            handle = (os.getpid(), threading.get_ident())
+            if handle not in self._handles:
+                self._handles[handle] = gdal.Open(self.file_path)
+            pixels = self._handles[handle].ReadAsArray(x_start, y_start, width, height)
+            if pixels.ndim > 2:
+                pixels = pixels.transpose(1, 2, 0)
+
+        # steps, integer indices and the band index are applied to the window that was read
+        local = tuple(slice(None, None, step) if isinstance(k, slice) else 0
+                      for k, step in zip(key[:2], (y_step, x_step)))
+
+        return pixels[local + key[2:self.ndim]]
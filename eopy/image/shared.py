@@ -0,0 +1,86 @@
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+from eopy.image.geotransform import Geotransform
+from eopy.image.image import Image
+
+
+class SharedImage:
+    """ Handle to image pixels held in a shared memory block
+    Pickling the handle only sends the block name and the metadata, so worker processes attach to the pixels
+    with open instead of receiving a copy. The creating process unlinks the block once the workers are done
+    """
+    def __init__(
+            self,
+            name: str,
+            shape: Tuple[int, ...],
+            dtype: str,
+            geotransform: Tuple,
+            epsg: Optional[int] = None,
+            no_data_value: float = 0.):
+
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.geotransform = geotransform
+        self.epsg = epsg
+        self.no_data_value = no_data_value
+        self._memory = None
+
+    def __repr__(self) -> str:
+
+        return f'SharedImage - Name: {self.name} | Shape: {"x".join(map(str, self.shape))} | EPSG: {self.epsg}'
+
+    def __getstate__(self) -> dict:
+
+        state = self.__dict__.copy()
+        state['_memory'] = None
+        return state
+
+    def __enter__(self) -> "SharedImage":
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    @classmethod
+    def create(cls, image: Image) -> "SharedImage":
+
+        pixels = np.asarray(image.compute().pixels)
+        memory = SharedMemory(create=True, size=max(pixels.nbytes, 1))
+        np.ndarray(pixels.shape, pixels.dtype, buffer=memory.buf)[...] = pixels
+
+        shared = cls(memory.name, pixels.shape, pixels.dtype.str, image.geotransform.tuple, image.epsg, image.no_data_value)
+        shared._memory = memory
+
+        return shared
+
+    def open(self) -> Image:
+        """ An Image whose pixels are a view of the shared block, writes to it are seen by every process
+        Images from open must be released before close, as the block cannot be detached while views exist
+        """
+
+        if self._memory is None:
+            self._memory = SharedMemory(name=self.name)
+
+        pixels = np.ndarray(self.shape, np.dtype(self.dtype), buffer=self._memory.buf)
+
+        return Image(pixels, Geotransform.from_tuple(self.geotransform), self.epsg, self.no_data_value)
+
+    def close(self):
+        """ Detach this process from the block """
+
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
+
+    def unlink(self):
+        """ Free the block, called once by the process that created it """
+
+        memory = self._memory or SharedMemory(name=self.name)
+        memory.close()
+        memory.unlink()
+        self._memory = None
@@ -1,17 +1,21 @@
 import numpy as np
 
-from eopy.image import Image
+from eopy.image import Image, LazyImage
+from eopy.image.image import da, is_chunked
 
 
 def linear_stretch(image: Image, limit: float = 1, percentile: int = None, std: int = None) -> Image:
 
+    if isinstance(image, LazyImage):
+        return _lazy_linear_stretch(image, limit, percentile, std)
+
     bands = []
     for band in image:
 
         min_value, max_value = np.nanmin(band.pixels), np.nanmax(band.pixels)
 
         if percentile:
-            min_value, max_value = np.nanpercentile(band.pixels, (percentile, 100 - percentile))
+            min_value, max_value = _nanpercentile(band.pixels, (percentile, 100 - percentile))
 
         elif std:
             mean, band_std = np.nanmean(band.pixels), np.nanstd(band.pixels)
@@ -29,6 +33,40 @@ def linear_stretch(image: Image, limit: float = 1, percentile: int = None, std:
     return Image.stack(bands)
 
 
+def _nanpercentile(pixels, q, bins: int = 4096):
+    """ np.nanpercentile, or for chunked pixels an approximation from a histogram built chunk by chunk """
+
+    if is_chunked(pixels):
+        low, high = da.compute(da.nanmin(pixels), da.nanmax(pixels))
+        if np.isnan(low):
+            # an all-NaN band has no range to build a histogram over, as np.nanpercentile its percentiles are NaN
+            return np.full(np.shape(q), np.nan)
+        counts, edges = da.histogram(pixels.ravel(), bins=bins, range=(low, high))
+        counts = counts.compute()
+        cumulative = np.cumsum(counts) / max(counts.sum(), 1)
+        return np.interp(np.asarray(q) / 100., np.concatenate([[0], cumulative]), edges)
+
+    return np.nanpercentile(pixels, q)
+
+
+def _lazy_linear_stretch(image: LazyImage, limit: float, percentile: int, std: int) -> LazyImage:
+    """ linear_stretch of a LazyImage, the band ranges take a pass over the tiles and the stretch itself stays lazy """
+
+    if percentile:
+        min_values, max_values = image.percentiles((percentile, 100 - percentile))
+    else:
+        statistics = image.statistics()
+        min_values, max_values = statistics['min'], statistics['max']
+        if std:
+            min_values, max_values = statistics['mean'] - std * statistics['std'], statistics['mean'] + std * statistics['std']
+
+    def stretch(block: np.ndarray) -> np.ndarray:
+
+        return limit * (np.clip(block, min_values, max_values) - min_values) / (max_values - min_values)
+
+    return image.map(stretch)
+
+
 def bcet(image: Image, limit: float = 1, percentile: int = None, clip: float = 0., window: slice = None) -> Image:
     ''' BCET (Balanced Contrast Enhancement Technique)
     G.J. Liu (1990) Balance contrast enhancement technique and its application in image colour composition
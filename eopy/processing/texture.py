@@ -0,0 +1,199 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import ndimage
+from typing import Callable, Optional, Tuple
+
+from eopy.image import Image
+
+LOCAL_STATISTICS = ('mean', 'variance', 'range')
+GLCM_MEASURES = ('contrast', 'dissimilarity', 'homogeneity', 'entropy')
+
+
+def local_statistics(
+        image: Image,
+        window: int = 5,
+        statistics: Tuple[str, ...] = LOCAL_STATISTICS,
+        tile_size: int = 1024,
+        workers: Optional[int] = None) -> Image:
+    """ Windowed mean and variance (from integral images) and range of every band, ignoring NaN
+    Output bands are ordered band by band, then statistic
+    """
+
+    _check_window(window)
+    for statistic in statistics:
+        if statistic not in LOCAL_STATISTICS:
+            raise UserWarning(f'Unrecognised statistic: {statistic}')
+
+    def compute(pixels: np.ndarray) -> np.ndarray:
+
+        valid = ~np.isnan(pixels)
+        values = np.where(valid, pixels, 0.)
+        count = _window_sum(valid.astype(np.float64), window)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = _window_sum(values, window) / count
+            outputs = {
+                'mean': lambda: mean,
+                'variance': lambda: np.clip(_window_sum(values ** 2, window) / count - mean ** 2, 0, None),
+                'range': lambda: ndimage.maximum_filter(np.where(valid, pixels, -np.inf), window, mode='nearest')
+                - ndimage.minimum_filter(np.where(valid, pixels, np.inf), window, mode='nearest')
+            }
+            result = np.stack([outputs[statistic]() for statistic in statistics], axis=-1)
+
+        result[count == 0] = np.nan
+        return result
+
+    return _texture_image(image, compute, len(statistics), window // 2, tile_size, workers)
+
+
+def glcm(
+        image: Image,
+        levels: int = 16,
+        window: int = 7,
+        offset: Tuple[int, int] = (0, 1),
+        measures: Tuple[str, ...] = ('contrast', 'homogeneity', 'entropy'),
+        value_range: Optional[Tuple[float, float]] = None,
+        tile_size: int = 1024,
+        workers: Optional[int] = None) -> Image:
+    """ Grey level co-occurrence measures in a moving window for every band
+    Values are quantised to `levels` grey levels over value_range (default 1st to 99th percentile of each band)
+    and pixel pairs (y, x), (y + offset[0], x + offset[1]) are counted with window sums rather than per pixel loops
+    Output bands are ordered band by band, then measure
+    """
+
+    _check_window(window)
+    for measure in measures:
+        if measure not in GLCM_MEASURES:
+            raise UserWarning(f'Unrecognised GLCM measure: {measure}')
+
+    halo = window // 2 + max(abs(offset[0]), abs(offset[1]))
+
+    bands = []
+    for band in image:
+        low, high = value_range if value_range else np.nanpercentile(band.pixels, (1, 99))
+        quantised = _quantise(band.pixels.astype(np.float64), low, high, levels)
+
+        bands.append(_texture_image(
+            Image(quantised, image.geotransform, image.epsg),
+            lambda pixels: _glcm_measures(pixels, levels, window, offset, measures),
+            len(measures), halo, tile_size, workers).pixels)
+
+    return Image(np.dstack(bands) if len(bands) > 1 else bands[0], image.geotransform, image.epsg, np.nan)
+
+
+def _glcm_measures(quantised: np.ndarray, levels: int, window: int, offset: Tuple[int, int], measures: Tuple[str, ...]) -> np.ndarray:
+
+    first, second = _pairs(quantised, offset)
+    valid = (first >= 0) & (second >= 0)
+    pair_count = _window_sum(valid.astype(np.float64), window)
+    difference = np.where(valid, first - second, 0).astype(np.float64)
+
+    def window_mean(values: np.ndarray) -> np.ndarray:
+
+        return _window_sum(np.where(valid, values, 0.), window) / pair_count
+
+    def entropy() -> np.ndarray:
+
+        # entropy = log2(N) - sum(n log2 n) / N over the pair counts n of each co-occurring grey level pair
+        codes = np.where(valid, first * levels + second, -1)
+        n_log_n = np.arange(window ** 2 + 1) * np.log2(np.maximum(np.arange(window ** 2 + 1), 1))
+        total = np.zeros(quantised.shape)
+        for code in np.unique(codes[codes >= 0]):
+            total += n_log_n[_window_count(codes == code, window)]
+        return np.log2(pair_count) - total / pair_count
+
+    outputs = {
+        'contrast': lambda: window_mean(difference ** 2),
+        'dissimilarity': lambda: window_mean(np.abs(difference)),
+        'homogeneity': lambda: window_mean(1. / (1. + difference ** 2)),
+        'entropy': entropy
+    }
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = np.stack([outputs[measure]() for measure in measures], axis=-1)
+
+    result[pair_count == 0] = np.nan
+    return result
+
+
+def _pairs(quantised: np.ndarray, offset: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Grey levels of each pixel and of its neighbour at offset, -1 where the neighbour falls outside """
+
+    dy, dx = offset
+    height, width = quantised.shape
+    second = np.full(quantised.shape, -1, dtype=quantised.dtype)
+
+    second[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = \
+        quantised[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+
+    return quantised, second
+
+
+def _quantise(pixels: np.ndarray, low: float, high: float, levels: int) -> np.ndarray:
+    """ Map values to 0..levels-1 grey levels, NaN to -1 """
+
+    scale = levels / (high - low) if high > low else 0.
+    quantised = np.clip(np.floor((np.nan_to_num(pixels, nan=low) - low) * scale), 0, levels - 1).astype(np.int32)
+    quantised[np.isnan(pixels)] = -1
+
+    return quantised
+
+
+def _window_sum(array: np.ndarray, window: int) -> np.ndarray:
+    """ Sum over a square window centred on every pixel using an integral image, zero outside the array """
+
+    pad = window // 2
+    padded = np.pad(array, pad, mode='constant')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+
+    return integral[window:, window:] - integral[:-window, window:] - integral[window:, :-window] + integral[:-window, :-window]
+
+
+def _window_count(mask: np.ndarray, window: int) -> np.ndarray:
+    """ Number of True pixels in a square window centred on every pixel, with separable box filters """
+
+    counts = ndimage.uniform_filter1d(mask.astype(np.float32), window, axis=0, mode='constant')
+    counts = ndimage.uniform_filter1d(counts, window, axis=1, mode='constant')
+
+    return np.rint(counts * window ** 2).astype(np.int32)
+
+
+def _texture_image(
+        image: Image,
+        function: Callable[[np.ndarray], np.ndarray],
+        output_count: int,
+        halo: int,
+        tile_size: int,
+        workers: Optional[int]) -> Image:
+    """ Apply function to every band tile by tile with a halo of neighbouring pixels, in a thread pool """
+
+    output = np.full((image.height, image.width, image.band_count * output_count), np.nan, dtype=np.float32)
+    tiles = [(y, x) for y in range(0, image.height, tile_size) for x in range(0, image.width, tile_size)]
+
+    def process(task: Tuple[int, int, int]) -> Tuple[int, int, int, np.ndarray]:
+
+        band, y, x = task
+        pixels = image.pixels if image.band_count == 1 else image.pixels[:, :, band]
+        top, left = max(y - halo, 0), max(x - halo, 0)
+        padded = pixels[top:min(y + tile_size + halo, image.height), left:min(x + tile_size + halo, image.width)]
+
+        result = function(padded.astype(np.float64) if padded.dtype.kind != 'i' else padded)
+
+        return band, y, x, result[y - top:y - top + tile_size, x - left:x - left + tile_size]
+
+    tasks = [(band, y, x) for band in range(image.band_count) for y, x in tiles]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for band, y, x, result in executor.map(process, tasks):
+            output[y:y + result.shape[0], x:x + result.shape[1], band * output_count:(band + 1) * output_count] = result
+
+    if output.shape[2] == 1:
+        output = output[:, :, 0]
+
+    return Image(output, image.geotransform, image.epsg, np.nan)
+
+
+def _check_window(window: int):
+
+    if window < 1 or window % 2 == 0:
+        raise UserWarning(f'Window must be a positive odd number: {window}')
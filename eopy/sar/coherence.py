@@ -1,8 +1,13 @@
 import numpy as np
 import math
+from itertools import combinations
+from scipy import ndimage
+from typing import List, Optional, Sequence, Tuple
 
 from tqdm import tqdm
 
+from eopy.sar.reader import SarReader, COMPLEX_DTYPE
+
 
 class Coherence:
     def __init__(self, azimuth_resolution, range_resolution):
@@ -11,23 +16,23 @@ class Coherence:
 
     def estimate_coherence(self, master, slave, model_phase):
         # define starting and end point in data for sliding window
-        rw_stt = np.int(math.ceil(self.azimuth_resolution / 2.))
-        cl_stt = np.int(math.ceil(self.range_resolution / 2.))
-        rw_stp = np.int(master.shape[0] - math.floor(self.azimuth_resolution / 2.))
-        cl_stp = np.int(master.shape[1] - math.floor(self.range_resolution / 2.))
+        rw_stt = int(math.ceil(self.azimuth_resolution / 2.))
+        cl_stt = int(math.ceil(self.range_resolution / 2.))
+        rw_stp = int(master.shape[0] - math.floor(self.azimuth_resolution / 2.))
+        cl_stp = int(master.shape[1] - math.floor(self.range_resolution / 2.))
 
         # initialize array
-        coh_est = np.zeros(master.shape, dtype=np.complex)
+        coh_est = np.zeros(master.shape, dtype=np.complex128)
 
         for kk in tqdm(range(rw_stt, rw_stp + 1), total=((rw_stp + 1) - rw_stt)):
             # define extent of window
-            from_rw = np.int(kk - math.floor(self.azimuth_resolution / 2.))
-            to_rw = np.int(kk + math.floor(self.azimuth_resolution / 2.) + 1)
+            from_rw = int(kk - math.floor(self.azimuth_resolution / 2.))
+            to_rw = int(kk + math.floor(self.azimuth_resolution / 2.) + 1)
 
             for mm in range(cl_stt, cl_stp + 1):
                 # define extent of window
-                from_cl = np.int(mm - math.floor(self.range_resolution / 2.))
-                to_cl = np.int(mm + math.floor(self.range_resolution / 2.) + 1)
+                from_cl = int(mm - math.floor(self.range_resolution / 2.))
+                to_cl = int(mm + math.floor(self.range_resolution / 2.) + 1)
 
                 master_subview = master[from_rw:to_rw, from_cl:to_cl]
                 slave_subview = slave[from_rw:to_rw, from_cl:to_cl]
@@ -39,3 +44,150 @@ class Coherence:
                 coh_est[kk, mm] = numerator.sum() / denominator
 
         return coh_est
+
+    @property
+    def window(self) -> Tuple[int, int]:
+        """ Estimation window matching estimate_coherence """
+
+        return 2 * (self.azimuth_resolution // 2) + 1, 2 * (self.range_resolution // 2) + 1
+
+    def estimate_window_coherence(self, master: np.ndarray, slave: np.ndarray, model_phase: np.ndarray) -> np.ndarray:
+        """ estimate_coherence with the window sums computed by uniform filtering, edges are reflected instead of zero """
+
+        numerator = _filter_complex((master * np.conj(slave) * np.exp(-1j * model_phase)).astype(COMPLEX_DTYPE), self.window)
+        denominator = np.sqrt(ndimage.uniform_filter(np.abs(master) ** 2, self.window) *
+                              ndimage.uniform_filter(np.abs(slave) ** 2, self.window))
+
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+    def estimate_coherence_blocks(
+            self,
+            master: SarReader,
+            slave: SarReader,
+            model_phase: np.ndarray,
+            output: np.ndarray,
+            block_size: int = 1024) -> np.ndarray:
+        """ Estimate coherence in azimuth blocks, padding each block by half the estimation window """
+
+        overlap = self.window[0] // 2
+
+        for master_block, slave_block in zip(master.blocks(block_size, overlap), slave.blocks(block_size, overlap)):
+            padded_rows = slice(master_block.start - master_block.offset,
+                                master_block.start - master_block.offset + master_block.pixels.shape[0])
+
+            coherence = self.estimate_window_coherence(master_block.pixels, slave_block.pixels,
+                                                       np.asarray(model_phase[padded_rows]))
+            output[master_block.start:master_block.stop] = master_block.crop(coherence)
+
+        return output
+
+
+class CoherenceStack:
+    """ Complex coherence for every (or a baseline limited subset of) pair of N coregistered SLCs
+    The complex coherence holds the multilooked interferometric phase, so no separate interferogram cube is needed
+    """
+    def __init__(
+            self,
+            azimuth_resolution: int,
+            range_resolution: int,
+            max_temporal_baseline: Optional[int] = None,
+            perpendicular_baselines: Optional[Sequence[float]] = None,
+            max_perpendicular_baseline: Optional[float] = None,
+            pairs: Optional[List[Tuple[int, int]]] = None):
+
+        self.azimuth_resolution = azimuth_resolution
+        self.range_resolution = range_resolution
+        self.max_temporal_baseline = max_temporal_baseline
+        self.perpendicular_baselines = perpendicular_baselines
+        self.max_perpendicular_baseline = max_perpendicular_baseline
+        self._pairs = pairs
+
+    @property
+    def window(self) -> Tuple[int, int]:
+        """ Estimation window matching Coherence.estimate_coherence """
+
+        return 2 * (self.azimuth_resolution // 2) + 1, 2 * (self.range_resolution // 2) + 1
+
+    def pairs(self, image_count: int) -> List[Tuple[int, int]]:
+        """ Pairs (i, j), i < j, of images ordered by acquisition date which satisfy the baseline limits """
+
+        if self._pairs is not None:
+            return sorted(self._pairs)
+
+        pairs = []
+        for i, j in combinations(range(image_count), 2):
+            if self.max_temporal_baseline is not None and j - i > self.max_temporal_baseline:
+                continue
+            if self.max_perpendicular_baseline is not None and self.perpendicular_baselines is not None \
+                    and abs(self.perpendicular_baselines[j] - self.perpendicular_baselines[i]) > self.max_perpendicular_baseline:
+                continue
+            pairs.append((i, j))
+
+        return pairs
+
+    def estimate(
+            self,
+            images: List[SarReader],
+            output_path: str,
+            model_phases: Optional[List[np.ndarray]] = None,
+            block_size: int = 512) -> Tuple[np.ndarray, np.ndarray]:
+        """ Write the complex coherence cube with shape (pair, azimuth, range) to an .npy file block by block
+        images are SarReaders (or arrays) sharing the master grid, model_phases optional per image reference phases
+        Returns the memory-mapped cube and the (N, N) matrix of mean coherence magnitude
+        """
+
+        images = [image if isinstance(image, SarReader) else SarReader.from_array(image) for image in images]
+        if len(set(image.shape for image in images)) != 1:
+            raise UserWarning('All images must be coregistered onto the same grid')
+
+        pairs = self.pairs(len(images))
+        if not pairs:
+            raise UserWarning('No pairs satisfy the baseline limits')
+
+        lines, samples = images[0].shape
+        cube = np.lib.format.open_memmap(output_path, mode='w+', dtype=COMPLEX_DTYPE, shape=(len(pairs), lines, samples))
+        coherence_sum = np.zeros(len(pairs))
+
+        overlap = self.window[0] // 2
+        used = sorted(set(index for pair in pairs for index in pair))
+
+        for start in tqdm(range(0, lines, block_size)):
+            stop = min(start + block_size, lines)
+            padded_start, padded_stop = max(start - overlap, 0), min(stop + overlap, lines)
+            valid = slice(start - padded_start, stop - padded_start)
+
+            # each image is read, demodulated and its window power filtered once per block, then reused by every pair
+            blocks, powers = {}, {}
+            for index in used:
+                block = images[index].read(padded_start, padded_stop)
+                if model_phases is not None:
+                    block = block * np.exp(-1j * np.asarray(model_phases[index][padded_start:padded_stop])).astype(COMPLEX_DTYPE)
+                blocks[index] = block
+                powers[index] = ndimage.uniform_filter(np.abs(block) ** 2, self.window)
+
+            # one pair at a time so only a single numerator is held regardless of the number of pairs
+            for p, (i, j) in enumerate(pairs):
+                numerator = _filter_complex(blocks[i] * np.conj(blocks[j]), self.window)
+                denominator = np.sqrt(powers[i] * powers[j])
+                coherence = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)[valid]
+
+                cube[p, start:stop] = coherence
+                coherence_sum[p] += np.abs(coherence).sum()
+
+        cube.flush()
+
+        matrix = np.eye(len(images))
+        for p, (i, j) in enumerate(pairs):
+            matrix[i, j] = matrix[j, i] = coherence_sum[p] / (lines * samples)
+
+        return cube, matrix
+
+
+def _filter_complex(pixels: np.ndarray, window: Tuple[int, int]) -> np.ndarray:
+    """ Window mean over azimuth and range of a complex block """
+
+    filtered = np.empty(pixels.shape, dtype=COMPLEX_DTYPE)
+    filtered.real = ndimage.uniform_filter(pixels.real, window)
+    filtered.imag = ndimage.uniform_filter(pixels.imag, window)
+
+    return filtered
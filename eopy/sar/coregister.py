@@ -1,66 +1,143 @@
 import numpy as np
 import math
-import scipy.signal as spsig
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
+from tqdm import tqdm
 
-class Coregister:
-    def __init__(self,
-                 pos_mx: int, pos_sx: int,
-                 pos_my: int, pos_sy: int,
-                 ex_slave: int, ex_master: int,
-                 oversampling_factor: int):
-        self.pos_mx = pos_mx
-        self.pos_sx = pos_sx
-        self.pos_my = pos_my
-        self.pos_sy = pos_sy
-        self.ex_slave = ex_slave
-        self.ex_master = ex_master
-        self.oversampling_factor = oversampling_factor
-
-    def coregister(self, master, slave):
-        master_amp = self.convert_to_amplitude(master)
-        slave_amp = self.convert_to_amplitude(slave)
-
-        coarse_shift_x = self.pos_sx - self.pos_mx
-        coarse_shift_y = self.pos_sy - self.pos_my
+from eopy.sar.offsets import OffsetField
+from eopy.sar.resample import Resampler, COMPLEX_DTYPE
 
-        master_area = master_amp[
-                      self.pos_my - self.ex_master // 2: self.pos_my + self.ex_master // 2,
-                      self.pos_mx - self.ex_master // 2: self.pos_mx + self.ex_master // 2]
-        slave_area = slave_amp[
-                     self.pos_sy - self.ex_slave // 2: self.pos_sy + self.ex_slave // 2,
-                     self.pos_sx - self.ex_slave // 2: self.pos_sx + self.ex_slave // 2]
+PEAK_HALF_WIDTH = 4
 
-        master_area_spec = np.fft.fft2(master_area)
-        slave_area_spec = np.fft.fft2(slave_area)
 
-        master_area_spec_zp = self.zeropad2d(master_area_spec, self.oversampling_factor)
-        slave_area_spec_zp = self.zeropad2d(slave_area_spec, self.oversampling_factor)
+class Coregister:
+    """ Offset tracking between a master and slave SLC using normalised cross-correlation of amplitude windows """
+    def __init__(self,
+                 window_size: int = 64,
+                 search_size: int = 8,
+                 oversampling_factor: int = 16,
+                 spacing: Tuple[int, int] = (256, 256),
+                 coarse_offset: Tuple[int, int] = (0, 0),
+                 degree: int = 2,
+                 threshold: float = 0.2,
+                 workers: Optional[int] = None):
+        self.window_size = window_size
+        self.search_size = search_size
+        self.oversampling_factor = oversampling_factor
+        self.spacing = spacing
+        self.coarse_offset = coarse_offset
+        self.degree = degree
+        self.threshold = threshold
+        self.workers = workers
+
+    def coregister(
+            self,
+            master,
+            slave,
+            output: Optional[np.ndarray] = None,
+            kernel: str = 'sinc',
+            dense: bool = False,
+            block_size: int = 128) -> np.ndarray:
+        """ Estimate offsets and resample the slave onto the master grid
+        By default the offsets are modelled with a polynomial, dense=True interpolates the offset field instead
+        output can be a memmap (see sar.reader.create_output) so the result streams to disk
+        """
+
+        offsets = self.estimate_offsets(master, slave)
+        if not dense:
+            offsets = offsets.fit_polynomial(self.degree, self.threshold)
+
+        if output is None:
+            output = np.zeros(master.shape[:2], dtype=COMPLEX_DTYPE)
+
+        return Resampler(kernel=kernel, workers=self.workers).resample(slave, offsets, output, block_size)
+
+    def estimate_offsets(self, master, slave) -> OffsetField:
+        """ Track offsets on a regular grid over the master; master and slave can be arrays, memmaps or SarReaders """
+
+        half_window = self.window_size // 2
+        coarse_y, coarse_x = self.coarse_offset
+        margin_y = half_window + self.search_size + abs(coarse_y)
+        margin_x = half_window + self.search_size + abs(coarse_x)
+
+        lines = np.arange(margin_y, min(master.shape[0], slave.shape[0]) - margin_y, self.spacing[0])
+        samples = np.arange(margin_x, min(master.shape[1], slave.shape[1]) - margin_x, self.spacing[1])
+        if len(lines) == 0 or len(samples) == 0:
+            raise UserWarning(f'Images are too small for window size {self.window_size} and search size {self.search_size}')
+
+        azimuth = np.full((len(lines), len(samples)), np.nan)
+        range_ = np.full((len(lines), len(samples)), np.nan)
+        peak = np.zeros((len(lines), len(samples)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i, y in enumerate(tqdm(lines)):
+                # read one azimuth strip per grid row so only a window height of each image is in memory
+                master_strip = np.abs(master[y - half_window:y + half_window]).astype(np.float32)
+                slave_strip = np.abs(slave[
+                    y + coarse_y - half_window - self.search_size:
+                    y + coarse_y + half_window + self.search_size]).astype(np.float32)
+
+                windows = [(
+                    master_strip[:, x - half_window:x + half_window],
+                    slave_strip[:, x + coarse_x - half_window - self.search_size:
+                                x + coarse_x + half_window + self.search_size]) for x in samples]
+
+                for j, (dy, dx, correlation) in enumerate(executor.map(lambda w: self.correlate(*w), windows)):
+                    azimuth[i, j] = dy + coarse_y
+                    range_[i, j] = dx + coarse_x
+                    peak[i, j] = correlation
+
+        return OffsetField(lines, samples, azimuth, range_, peak, shape=master.shape[:2], threshold=self.threshold)
+
+    def correlate(self, master_window: np.ndarray, slave_window: np.ndarray) -> Tuple[float, float, float]:
+        """ Sub-pixel offset of master_window within the larger slave_window and its correlation peak """
+
+        ncc = self.normalised_cross_correlation(master_window, slave_window)
+        if not np.any(np.isfinite(ncc)) or np.nanmax(ncc) <= 0:
+            return np.nan, np.nan, 0.
+
+        peak_y, peak_x = np.unravel_index(np.nanargmax(ncc), ncc.shape)
+        peak = float(ncc[peak_y, peak_x])
+        dy, dx = float(peak_y), float(peak_x)
+
+        if PEAK_HALF_WIDTH <= peak_y < ncc.shape[0] - PEAK_HALF_WIDTH \
+                and PEAK_HALF_WIDTH <= peak_x < ncc.shape[1] - PEAK_HALF_WIDTH:
+            # oversample only the neighbourhood of the integer peak
+            patch = ncc[peak_y - PEAK_HALF_WIDTH:peak_y + PEAK_HALF_WIDTH, peak_x - PEAK_HALF_WIDTH:peak_x + PEAK_HALF_WIDTH]
+            oversampled = np.real(np.fft.ifft2(self.zeropad2d(np.fft.fft2(patch), self.oversampling_factor)))
+            sub_y, sub_x = np.unravel_index(np.argmax(oversampled), oversampled.shape)
+
+            dy = peak_y - PEAK_HALF_WIDTH + sub_y / float(self.oversampling_factor)
+            dx = peak_x - PEAK_HALF_WIDTH + sub_x / float(self.oversampling_factor)
+
+        return dy - self.search_size, dx - self.search_size, peak
 
-        master_area_oversampled = np.fft.ifft2(master_area_spec_zp)
-        slave_area_oversampled = np.fft.ifft2(slave_area_spec_zp)
+    @staticmethod
+    def normalised_cross_correlation(template: np.ndarray, search: np.ndarray) -> np.ndarray:
+        """ Normalised cross-correlation of template at every valid position in search, computed with FFTs """
 
-        master_area_oversampled = np.abs(master_area_oversampled)
-        slave_area_oversampled = np.abs(slave_area_oversampled)
+        template = template - template.mean()
+        rows, columns = template.shape
+        count = rows * columns
 
-        xcorr = spsig.correlate2d(master_area_oversampled, slave_area_oversampled, mode='same')
+        spectrum = np.fft.rfft2(search) * np.conj(np.fft.rfft2(template, s=search.shape))
+        correlation = np.fft.irfft2(spectrum, s=search.shape)[:search.shape[0] - rows + 1, :search.shape[1] - columns + 1]
 
-        maxcorr = xcorr.max()
-        pos_max = np.transpose(np.nonzero(np.abs(xcorr - maxcorr < 1e-10)))
-        rows, columns = xcorr.shape
+        window_sum = Coregister._window_sum(search, rows, columns)
+        window_energy = Coregister._window_sum(search.astype(np.float64) ** 2, rows, columns) - window_sum ** 2 / count
+        denominator = np.sqrt(np.clip(window_energy, 0, None) * (template ** 2).sum())
 
-        shift = np.array(
-            [(pos_max[0, 0] - rows / 2.) / float(self.oversampling_factor),
-             (pos_max[0, 1] - columns / 2.) / float(self.oversampling_factor)])
-        final_shift = shift + [coarse_shift_y, coarse_shift_x]
+        return np.divide(correlation, denominator, out=np.zeros_like(correlation), where=denominator > 0)
 
-        tra_x = final_shift[1]
-        tra_y = final_shift[0]
+    @staticmethod
+    def _window_sum(image: np.ndarray, rows: int, columns: int) -> np.ndarray:
+        """ Sum over every rows x columns window using an integral image """
 
-        slave_fine = slave[2:, :]
-        master_fine = master[: -2, :]
+        integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+        integral[1:, 1:] = np.cumsum(np.cumsum(image, axis=0), axis=1)
 
-        return slave_fine, master_fine
+        return integral[rows:, columns:] - integral[:-rows, columns:] - integral[rows:, :-columns] + integral[:-rows, :-columns]
 
     @staticmethod
     def convert_to_amplitude(image):
@@ -1,6 +1,8 @@
 import numpy as np
 import math
 
+from eopy.sar.reader import SarReader
+
 
 class Focus:
     def __init__(self, multilook: bool = True, multilook_factor: int = 5):
@@ -21,34 +23,54 @@ class Focus:
         size_azimuth = image.shape[0]
         size_range = image.shape[1]
 
+        processed = self.compress(image)
+
+        if self.multilook is True:
+            processed = self.spatial_multilook(processed, size_azimuth, size_range)
+
+        return processed
+
+    def focus_blocks(self, reader: SarReader, output: np.ndarray, block_size: int = 4096) -> np.ndarray:
+        """ Focus a SAR image in azimuth blocks, padding each block by the azimuth chirp length """
+
+        if self.multilook is True and block_size % self.multilook_factor != 0:
+            raise UserWarning(f'Block size {block_size} must be a multiple of {self.multilook_factor}')
+
+        for block in reader.blocks(block_size, overlap=self.azimuth_chirp_length):
+            processed = block.crop(self.compress(block.pixels))
+
+            if self.multilook is True:
+                processed = self.spatial_multilook(processed, *processed.shape)
+                start = block.start // self.multilook_factor
+            else:
+                start = block.start
+
+            output[start:start + processed.shape[0]] = processed
+
+        return output
+
+    @property
+    def azimuth_chirp_length(self) -> int:
+
+        return len(np.arange(-self.aperture_time / 2, self.aperture_time / 2, 1 / self.pulse_repetition_frequency))
+
+    def compress(self, image):
+        size_azimuth = image.shape[0]
+        size_range = image.shape[1]
+
         con_range_chirp = self.calculate_chirp_range(size_range)
         con_azimuth_chirp = self.calculate_chirp_azimuth(size_azimuth)
 
-        processed = np.zeros((size_azimuth, size_range), 'complex')
-
-        for k1 in range(0, size_azimuth, 1):
-            vek = image[k1, :]  # Select row in range
-            vek = np.fft.fft(vek)  # Fourier Transform
-            corr = vek * con_range_chirp  # Multiply vectors
-            if_vek = np.fft.ifft(corr)  # Inverse Fourier Transform
-            if_vek_sort = np.fft.ifftshift(if_vek)  # Sorting after FFT
-            processed[k1, :] = if_vek_sort  # Store row in matrix
+        # F.1) Range compression, all lines at once
+        processed = np.fft.ifft(np.fft.fft(image, axis=1) * con_range_chirp, axis=1)
+        processed = np.fft.ifftshift(processed, axes=1)
 
         # F.2) Azimuth compression
         # conducted in azimuth frequency - range time domain
+        processed = np.fft.ifft(np.fft.fft(processed, axis=0) * con_azimuth_chirp.T, axis=0)
+        processed = np.fft.ifftshift(processed, axes=0)
 
-        for k2 in range(0, size_range, 1):
-            vek = processed[:, k2]  # Select row in azimuth
-            vek = np.fft.fft(vek)
-            corr = vek * con_azimuth_chirp
-            if_vek = np.fft.ifft(corr)
-            if_vek_sort = np.fft.ifftshift(if_vek)
-            processed[:, k2] = if_vek_sort
-
-        if self.multilook is True:
-            processed = self.spatial_multilook(processed, size_azimuth, size_range)
-
-        return processed
+        return processed.astype(image.dtype if np.iscomplexobj(image) else 'complex')
 
     def calculate_chirp_range(self, size_range):
         range_chirp = np.zeros((1, size_range), 'complex')  # empty vector to be filled with chirp values
@@ -89,11 +111,12 @@ class Focus:
         return np.conjugate(azimuth_chirp)
 
     def spatial_multilook(self, image, size_azimuth, size_range):
-        output_image = np.zeros((math.ceil(size_azimuth / self.multilook_factor), size_range), 'complex')
+        output_image = np.zeros((math.ceil(size_azimuth / self.multilook_factor), size_range), image.dtype)
 
-        for i, value in enumerate(range(0, size_azimuth - self.multilook_factor, self.multilook_factor)):
-            vek = image[value:value + (self.multilook_factor - 1), ]  # select azimuth bins
-            m_vek = np.mean(vek, axis=0)  # average value of azimuth bins
-            output_image[i, :] = m_vek
+        full_looks = size_azimuth // self.multilook_factor
+        output_image[:full_looks] = image[:full_looks * self.multilook_factor]\
+            .reshape(full_looks, self.multilook_factor, size_range).mean(axis=1)  # average value of azimuth bins
+        if full_looks < output_image.shape[0]:
+            output_image[full_looks] = image[full_looks * self.multilook_factor:].mean(axis=0)
 
         return output_image
@@ -0,0 +1,111 @@
+import numpy as np
+from scipy import ndimage
+from typing import List, Optional, Tuple
+
+
+class OffsetPolynomial:
+    """ 2D polynomial model of azimuth and range offsets as a function of master (line, sample) """
+    def __init__(self, azimuth_coefficients: np.ndarray, range_coefficients: np.ndarray, degree: int, shape: Tuple[int, int]):
+
+        self.azimuth_coefficients = azimuth_coefficients
+        self.range_coefficients = range_coefficients
+        self.degree = degree
+        self.shape = shape
+
+    def __repr__(self) -> str:
+
+        return f'OffsetPolynomial - Degree: {self.degree} | Centre offset: {self.evaluate(self.shape[0] / 2, self.shape[1] / 2)}'
+
+    def evaluate(self, lines, samples) -> Tuple[np.ndarray, np.ndarray]:
+        """ Azimuth and range offsets at master positions, broadcasting lines against samples """
+
+        terms = self.design_terms(lines, samples, self.degree, self.shape)
+
+        azimuth = sum(coefficient * term for coefficient, term in zip(self.azimuth_coefficients, terms))
+        range_ = sum(coefficient * term for coefficient, term in zip(self.range_coefficients, terms))
+
+        return azimuth, range_
+
+    @staticmethod
+    def design_terms(lines, samples, degree: int, shape: Tuple[int, int]) -> List[np.ndarray]:
+        """ Monomials y^i x^j with i + j <= degree, using coordinates normalised to [0, 1] """
+
+        y = np.asarray(lines, dtype=np.float64) / max(shape[0], 1)
+        x = np.asarray(samples, dtype=np.float64) / max(shape[1], 1)
+
+        return [y ** i * x ** (order - i) for order in range(degree + 1) for i in range(order + 1)]
+
+
+class OffsetField:
+    """ A dense grid of azimuth and range offsets of the slave relative to the master
+    Offsets whose correlation peak is below threshold are replaced by their nearest valid neighbour when evaluated
+    """
+    def __init__(
+            self,
+            lines: np.ndarray,
+            samples: np.ndarray,
+            azimuth: np.ndarray,
+            range_: np.ndarray,
+            peak: np.ndarray,
+            shape: Tuple[int, int],
+            threshold: float = 0.2):
+
+        self.lines = lines
+        self.samples = samples
+        self.azimuth = azimuth
+        self.range = range_
+        self.peak = peak
+        self.shape = shape
+        self.threshold = threshold
+        self._filled = {}
+
+    def __repr__(self) -> str:
+
+        return f'OffsetField - Grid: {len(self.lines)}x{len(self.samples)} | Valid: {int(self.valid().sum())}'
+
+    def evaluate(self, lines, samples, threshold: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ Bilinear interpolation of the dense offsets at master positions, invalid cells take their nearest valid value """
+
+        filled_azimuth, filled_range = self.filled(self.threshold if threshold is None else threshold)
+
+        lines, samples = np.broadcast_arrays(np.asarray(lines, dtype=np.float64), np.asarray(samples, dtype=np.float64))
+        grid_y = np.interp(lines, self.lines, np.arange(len(self.lines)))
+        grid_x = np.interp(samples, self.samples, np.arange(len(self.samples)))
+
+        azimuth = ndimage.map_coordinates(filled_azimuth, [grid_y, grid_x], order=1, mode='nearest')
+        range_ = ndimage.map_coordinates(filled_range, [grid_y, grid_x], order=1, mode='nearest')
+
+        return azimuth, range_
+
+    def filled(self, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """ Azimuth and range grids with invalid cells set to their nearest valid value, computed once per threshold """
+
+        if threshold not in self._filled:
+            invalid = ~self.valid(threshold)
+            if invalid.all():
+                raise UserWarning('No valid offsets to interpolate')
+            nearest = tuple(ndimage.distance_transform_edt(invalid, return_distances=False, return_indices=True))
+            self._filled[threshold] = self.azimuth[nearest], self.range[nearest]
+
+        return self._filled[threshold]
+
+    def valid(self, threshold: float = 0.) -> np.ndarray:
+
+        return ~np.isnan(self.azimuth) & ~np.isnan(self.range) & (np.nan_to_num(self.peak) > threshold)
+
+    def fit_polynomial(self, degree: int = 2, threshold: float = 0.2) -> OffsetPolynomial:
+        """ Least squares fit of a 2D polynomial to the offsets whose correlation peak exceeds the threshold """
+
+        valid = self.valid(threshold)
+        term_count = (degree + 1) * (degree + 2) // 2
+        if valid.sum() < term_count:
+            raise UserWarning(f'Only {int(valid.sum())} valid offsets, need {term_count} for a degree {degree} polynomial')
+
+        yy, xx = np.meshgrid(self.lines, self.samples, indexing='ij')
+        design = np.stack(OffsetPolynomial.design_terms(yy[valid], xx[valid], degree, self.shape), axis=1)
+        weights = self.peak[valid]
+
+        azimuth_coefficients = np.linalg.lstsq(design * weights[:, None], self.azimuth[valid] * weights, rcond=None)[0]
+        range_coefficients = np.linalg.lstsq(design * weights[:, None], self.range[valid] * weights, rcond=None)[0]
+
+        return OffsetPolynomial(azimuth_coefficients, range_coefficients, degree, self.shape)
@@ -0,0 +1,167 @@
+import os
+import numpy as np
+from osgeo import gdal
+from typing import Iterator, Optional, Tuple
+
+COMPLEX_DTYPE = np.complex64
+
+
+class Block:
+    """ An azimuth block of a SAR image padded with overlapping lines on either side """
+    def __init__(self, pixels: np.ndarray, start: int, stop: int, offset: int):
+
+        self.pixels = pixels
+        self.start = start
+        self.stop = stop
+        self.offset = offset
+
+    def __repr__(self) -> str:
+
+        return f'Block - Lines: {self.start}:{self.stop} | Padded shape: {self.pixels.shape}'
+
+    @property
+    def valid(self) -> slice:
+        """ Slice of the padded pixels which belong to this block """
+
+        return slice(self.offset, self.offset + self.stop - self.start)
+
+    def crop(self, pixels: np.ndarray) -> np.ndarray:
+
+        return pixels[self.valid]
+
+
+class SarReader:
+    """ Memory-mapped access to SAR raw echo and SLC data with shape (azimuth, range) """
+    def __init__(self, data, samples: int, column_offset: int = 0, sample_dtype: Optional[str] = None, bias: float = 0.):
+
+        self._data = data
+        self._samples = samples
+        self._column_offset = column_offset
+        self._sample_dtype = np.dtype(sample_dtype) if sample_dtype else None
+        self._bias = bias
+
+    def __repr__(self) -> str:
+
+        return f'SarReader - Shape: {self.lines}x{self.samples}'
+
+    def __getitem__(self, item) -> np.ndarray:
+
+        if type(item) is not tuple:
+            item = (item, )
+
+        rows = item[0]
+        if type(rows) is not slice or rows.step not in (None, 1):
+            raise UserWarning('Only contiguous azimuth slices can be read')
+        start, stop, _ = rows.indices(self.lines)
+
+        return self.read(start, stop)[(slice(None), ) + item[1:]]
+
+    @classmethod
+    def from_array(cls, pixels: np.ndarray) -> "SarReader":
+
+        return cls(pixels, samples=pixels.shape[1])
+
+    @classmethod
+    def from_slc(cls, file_path: str, samples: int, dtype: str = 'complex64', header_bytes: int = 0) -> "SarReader":
+        """ Memory-map a headerless SLC binary, either native complex or interleaved I/Q integers """
+
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'c':
+            lines = (os.path.getsize(file_path) - header_bytes) // (samples * dtype.itemsize)
+            data = np.memmap(file_path, dtype=dtype, mode='r', offset=header_bytes, shape=(lines, samples))
+            return cls(data, samples)
+
+        return cls._from_interleaved(file_path, samples, dtype, header_bytes, line_header_bytes=0, bias=0.)
+
+    @classmethod
+    def from_raw(
+            cls,
+            file_path: str,
+            samples: int,
+            dtype: str = 'uint8',
+            header_bytes: int = 0,
+            line_header_bytes: int = 0,
+            bias: float = 0.) -> "SarReader":
+        """ Memory-map raw echo data stored as interleaved I/Q samples with an optional header per line
+        e.g. ERS raw data: dtype='uint8', line_header_bytes=412, bias=15.5
+        """
+
+        return cls._from_interleaved(file_path, samples, np.dtype(dtype), header_bytes, line_header_bytes, bias)
+
+    @classmethod
+    def from_gdal(cls, file_path: str, band: int = 1) -> "SarReader":
+        """ Read a complex raster (e.g. a CInt16/CFloat32 GeoTIFF) block by block through GDAL """
+
+        dataset = gdal.Open(file_path)
+        if not dataset:
+            raise UserWarning(f'Unable to open {file_path}')
+
+        return cls(dataset.GetRasterBand(band), samples=dataset.RasterXSize)
+
+    @classmethod
+    def _from_interleaved(
+            cls,
+            file_path: str,
+            samples: int,
+            dtype: np.dtype,
+            header_bytes: int,
+            line_header_bytes: int,
+            bias: float) -> "SarReader":
+
+        record_bytes = line_header_bytes + 2 * samples * dtype.itemsize
+        lines = (os.path.getsize(file_path) - header_bytes) // record_bytes
+        data = np.memmap(file_path, dtype=np.uint8, mode='r', offset=header_bytes, shape=(lines, record_bytes))
+
+        return cls(data, samples, column_offset=line_header_bytes, sample_dtype=dtype.str, bias=bias)
+
+    @property
+    def lines(self) -> int:
+
+        if isinstance(self._data, gdal.Band):
+            return self._data.YSize
+        return self._data.shape[0]
+
+    @property
+    def samples(self) -> int:
+
+        return self._samples
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+
+        return self.lines, self.samples
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """ Read azimuth lines [start, stop) as complex64 """
+
+        start, stop = max(start, 0), min(stop, self.lines)
+
+        if isinstance(self._data, gdal.Band):
+            return self._data.ReadAsArray(0, start, self.samples, stop - start).astype(COMPLEX_DTYPE)
+
+        if self._sample_dtype is None:
+            return np.asarray(self._data[start:stop], dtype=COMPLEX_DTYPE)
+
+        records = np.ascontiguousarray(self._data[start:stop, self._column_offset:])
+        values = records.view(self._sample_dtype).astype(np.float32) - self._bias
+
+        return (values[:, 0::2] + 1j * values[:, 1::2]).astype(COMPLEX_DTYPE)
+
+    def blocks(self, block_size: int, overlap: int = 0) -> Iterator[Block]:
+        """ Iterate over azimuth blocks, each padded with up to `overlap` lines from its neighbours """
+
+        if block_size < 1:
+            raise UserWarning(f'Block size must be positive: {block_size}')
+
+        for start in range(0, self.lines, block_size):
+            stop = min(start + block_size, self.lines)
+            padded_start = max(start - overlap, 0)
+            padded_stop = min(stop + overlap, self.lines)
+
+            yield Block(self.read(padded_start, padded_stop), start, stop, offset=start - padded_start)
+
+
+def create_output(file_path: str, shape: Tuple[int, int], dtype: str = 'complex64') -> np.memmap:
+    """ Create a memory-mapped binary for writing block results to disk """
+
+    return np.memmap(file_path, dtype=dtype, mode='w+', shape=shape)
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from tqdm import tqdm
+
+COMPLEX_DTYPE = np.complex64
+
+
+class Resampler:
+    """ Warp a complex slave image onto the master grid using offsets evaluated per output pixel """
+    def __init__(self, kernel: str = 'sinc', kernel_size: int = 8, subsamples: int = 64, workers: Optional[int] = None):
+
+        if kernel == 'cubic':
+            kernel_size = 4
+        elif kernel != 'sinc':
+            raise UserWarning(f'Unrecognised kernel: {kernel}')
+        if kernel_size % 2 != 0:
+            raise UserWarning(f'Kernel size must be even: {kernel_size}')
+
+        self.kernel = kernel
+        self.kernel_size = kernel_size
+        self.subsamples = subsamples
+        self.workers = workers
+        self._table = self._build_kernel_table()
+
+    def resample(self, slave, offsets, output: np.ndarray, block_size: int = 128) -> np.ndarray:
+        """ Resample slave into output (master geometry) in azimuth blocks
+        offsets is an OffsetPolynomial or OffsetField giving slave - master positions
+        slave can be an array, memmap or SarReader, only the lines needed for each block are read
+        """
+
+        lines, samples = output.shape[:2]
+        x = np.arange(samples)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in tqdm(range(0, lines, block_size)):
+                y = np.arange(start, min(start + block_size, lines))
+                azimuth, range_ = offsets.evaluate(y[:, None], x[None, :])
+
+                slave_y = np.broadcast_to(y[:, None] + azimuth, (len(y), samples))
+                slave_x = np.broadcast_to(x[None, :] + range_, (len(y), samples))
+
+                output[start:start + len(y)] = self.interpolate(slave, slave_y, slave_x, executor)
+
+        return output
+
+    def interpolate(self, slave, slave_y: np.ndarray, slave_x: np.ndarray, executor: ThreadPoolExecutor = None) -> np.ndarray:
+        """ Interpolate slave at fractional positions, reading only the lines the kernel touches """
+
+        half = self.kernel_size // 2
+        floor_y = np.floor(slave_y).astype(np.int64)
+        floor_x = np.floor(slave_x).astype(np.int64)
+
+        first = int(np.clip(floor_y.min() - half + 1, 0, slave.shape[0]))
+        last = int(np.clip(floor_y.max() + half + 1, 0, slave.shape[0]))
+        if first >= last:
+            return np.zeros(slave_y.shape, dtype=COMPLEX_DTYPE)
+
+        strip = np.asarray(slave[first:last], dtype=COMPLEX_DTYPE)
+        fraction_y = np.rint((slave_y - floor_y) * self.subsamples).astype(np.int64)
+        fraction_x = np.rint((slave_x - floor_x) * self.subsamples).astype(np.int64)
+
+        def interpolate_rows(rows: slice) -> np.ndarray:
+
+            result = np.zeros(floor_y[rows].shape, dtype=COMPLEX_DTYPE)
+            for i in range(self.kernel_size):
+                tap_y = np.clip(floor_y[rows] - half + 1 + i - first, 0, strip.shape[0] - 1)
+
+                row_sum = np.zeros_like(result)
+                for j in range(self.kernel_size):
+                    tap_x = np.clip(floor_x[rows] - half + 1 + j, 0, strip.shape[1] - 1)
+                    row_sum += self._table[fraction_x[rows], j] * strip[tap_y, tap_x]
+
+                result += self._table[fraction_y[rows], i] * row_sum
+
+            return result
+
+        chunk = max(1, -(-slave_y.shape[0] // (self.workers or os.cpu_count() or 1)))
+        row_slices = [slice(start, start + chunk) for start in range(0, slave_y.shape[0], chunk)]
+        if executor:
+            resampled = np.vstack(list(executor.map(interpolate_rows, row_slices)))
+        else:
+            resampled = np.vstack([interpolate_rows(rows) for rows in row_slices])
+
+        outside = (slave_y < 0) | (slave_y > slave.shape[0] - 1) | (slave_x < 0) | (slave_x > slave.shape[1] - 1)
+        resampled[outside] = 0
+
+        return resampled
+
+    def _build_kernel_table(self) -> np.ndarray:
+        """ Kernel weights for each quantised fractional shift, shape (subsamples + 1, kernel_size) """
+
+        fractions = np.arange(self.subsamples + 1) / self.subsamples
+        taps = np.arange(self.kernel_size) - self.kernel_size // 2 + 1
+        distance = taps[None, :] - fractions[:, None]
+
+        if self.kernel == 'cubic':
+            weights = self._cubic(distance)
+        else:
+            # Hann windowed sinc, normalised so a constant signal is preserved
+            window = 0.5 + 0.5 * np.cos(np.pi * distance / (self.kernel_size // 2))
+            weights = np.sinc(distance) * window
+            weights /= weights.sum(axis=1, keepdims=True)
+
+        return weights.astype(np.float32)
+
+    @staticmethod
+    def _cubic(distance: np.ndarray, a: float = -0.5) -> np.ndarray:
+        """ Keys cubic convolution kernel """
+
+        d = np.abs(distance)
+
+        return np.where(d <= 1, (a + 2) * d ** 3 - (a + 3) * d ** 2 + 1,
+                        np.where(d < 2, a * d ** 3 - 5 * a * d ** 2 + 8 * a * d - 4 * a, 0))
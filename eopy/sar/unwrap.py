@@ -1,52 +1,174 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import ndimage
+from typing import Optional
 
-from remotesensing.sar import tools
+from eopy.sar import tools
 
 # phase to height factor
 p2h = 167.89/2/np.pi  # [m/cycle]
 
 
 class Unwrapper:
-    def unwrap(self, part):
-        ######################################
-        ### 2D unwrapping for small area  ####
-        ######################################
+    """ Quality-guided 2D phase unwrapping, optionally in overlapping tiles unwrapped in parallel """
+    def __init__(self, tile_size: Optional[int] = None, overlap: int = 64, workers: Optional[int] = None):
+
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.workers = workers
+
+    def unwrap(self, part, quality: Optional[np.ndarray] = None):
 
         phase_2d = np.angle(part)
-        rw_all, cl_all = np.shape(part)
+        unwrapped = self.unwrap_phase(phase_2d, quality)
 
-        # phase unwrapping line wise
-        # 1. do phase unwrapping for first column to get initial values for each line
-        phase_1d = phase_2d[:, 0]
-        uw_phase_1d_dict = self.phase_unwrap_1d(0, phase_1d)
+        residues_dict = self.residues(phase_2d)
+        return residues_dict['residual_cycles'], unwrapped * p2h
 
-        cycles_1st_cl = uw_phase_1d_dict['uw_cycles']
+    def unwrap_phase(self, phase: np.ndarray, quality: Optional[np.ndarray] = None) -> np.ndarray:
+        """ Unwrap a wrapped phase array in radians, NaN pixels are left unwrapped as NaN
+        quality (e.g. coherence) decides the order pixels are unwrapped in, defaults to phase derivative variance
+        """
 
-        # 2. apply PhU for each line in interferogram, using initial values for each line
-        final_phase_2d_rw = np.zeros((rw_all, cl_all))
-        for k in range(0, rw_all):
-            phase_1d = phase_2d[k, :]
-            tmp_dict = self.phase_unwrap_1d(cycles_1st_cl[k], phase_1d)
-            final_phase_2d_rw[k, :] = tmp_dict['uw_phase']
+        phase = phase.astype(np.float32)
+        if quality is None:
+            quality = self.phase_derivative_quality(phase)
+        quality = np.asarray(quality, dtype=np.float32)
 
-        # phase unwrapping column wise
-        # 1. do phase unwrapping for first column to get initial values for each line
-        phase_1d = phase_2d[0, :]
-        uw_phase_1d_dict = self.phase_unwrap_1d(0, phase_1d)
+        if not self.tile_size or (phase.shape[0] <= self.tile_size and phase.shape[1] <= self.tile_size):
+            return self.quality_guided(phase, quality)
 
-        cycles_1st_rw = uw_phase_1d_dict['uw_cycles']
+        return self._unwrap_tiles(phase, quality)
 
-        # 2. apply PhU for each line in interferogram, using initial values for each line
-        final_phase_2d_cl = np.zeros((rw_all, cl_all))
-        for k in range(0, cl_all):
-            phase_1d = phase_2d[:, k]
-            tmp_dict = self.phase_unwrap_1d(cycles_1st_rw[k], phase_1d)
-            final_phase_2d_cl[:, k] = tmp_dict['uw_phase']
+    def _unwrap_tiles(self, phase: np.ndarray, quality: np.ndarray) -> np.ndarray:
 
-        # calculate residues
+        step = self.tile_size - self.overlap
+        if step <= 0:
+            raise UserWarning(f'Overlap {self.overlap} must be smaller than tile size {self.tile_size}')
 
-        residues_dict = self.residues(phase_2d)
-        return residues_dict['residual_cycles'], final_phase_2d_rw * p2h
+        windows = [(slice(y, min(y + self.tile_size, phase.shape[0])), slice(x, min(x + self.tile_size, phase.shape[1])))
+                   for y in range(0, max(phase.shape[0] - self.overlap, 1), step)
+                   for x in range(0, max(phase.shape[1] - self.overlap, 1), step)]
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            tiles = executor.map(Unwrapper.quality_guided, [phase[w] for w in windows], [quality[w] for w in windows])
+
+            unwrapped = np.full(phase.shape, np.nan, dtype=np.float32)
+            for window, tile in zip(windows, tiles):
+                unwrapped[window] = self._stitch(unwrapped[window], tile)
+
+        return unwrapped
+
+    @staticmethod
+    def _stitch(existing: np.ndarray, tile: np.ndarray) -> np.ndarray:
+        """ Shift tile by the whole number of cycles that best matches the already unwrapped overlap """
+
+        overlap = ~np.isnan(existing) & ~np.isnan(tile)
+        if overlap.any():
+            cycles = np.round(np.median(existing[overlap] - tile[overlap]) / (2 * np.pi))
+            tile = tile + cycles * 2 * np.pi
+
+        return np.where(np.isnan(existing), tile, existing)
+
+    @staticmethod
+    def quality_guided(phase: np.ndarray, quality: np.ndarray, levels: int = 256) -> np.ndarray:
+        """ Flood fill from the highest quality pixel of each connected region, unwrapping the best quality border next
+        Quality is quantised into levels and the border is kept as a bucket queue of flat indices, so every pixel at the
+        best level is unwrapped in one vectorised wave and memory stays a few bytes per pixel
+        """
+
+        rows, columns = phase.shape
+        wrapped = phase.ravel()
+
+        # 0 wrapped, 1 queued on the border, 2 unwrapped, 3 NaN
+        state = np.isnan(wrapped).astype(np.uint8) * 3
+        result = np.full(wrapped.shape, np.nan, dtype=np.float32)
+
+        ranking = np.array(quality, dtype=np.float32).ravel()
+        finite = np.isfinite(ranking) & (state == 0)
+        low, high = (ranking[finite].min(), ranking[finite].max()) if finite.any() else (0., 0.)
+        ranking[~finite] = low
+
+        bucket = np.zeros(wrapped.shape, dtype=np.uint8 if levels <= 256 else np.uint16)
+        if high > low:
+            bucket[:] = np.minimum((ranking - low) * (levels / (high - low)), levels - 1)
+
+        # seed every 4-connected region at its highest quality pixel
+        labels, region_count = ndimage.label(state.reshape(rows, columns) == 0)
+        labels = labels.ravel()
+        if region_count == 0:
+            return result.reshape(rows, columns)
+        best = ndimage.maximum(ranking, labels, np.arange(1, region_count + 1))
+        candidates = np.flatnonzero(labels)
+        candidates = candidates[ranking[candidates] >= best[labels[candidates] - 1]]
+        seeds = candidates[np.unique(labels[candidates], return_index=True)[1]]
+        del labels, candidates
+
+        result[seeds] = wrapped[seeds]
+        state[seeds] = 2
+
+        queue = [[] for _ in range(levels)]
+        Unwrapper._enqueue(Unwrapper._neighbours(seeds, rows, columns), state, bucket, queue, levels - 1)
+
+        two_pi = np.float32(2 * np.pi)
+        for level in range(levels - 1, -1, -1):
+            while queue[level]:
+                pixels = np.concatenate(queue[level])
+                queue[level] = []
+
+                # unwrap each border pixel relative to its best quality unwrapped neighbour
+                neighbours = Unwrapper._neighbours(pixels, rows, columns, flat=False)
+                scores = np.where((neighbours >= 0) & (state[neighbours] == 2), ranking[neighbours], -np.inf)
+                parents = neighbours[np.argmax(scores, axis=0), np.arange(len(pixels))]
+
+                difference = wrapped[pixels] - wrapped[parents]
+                result[pixels] = result[parents] + difference - two_pi * np.round(difference / two_pi)
+                state[pixels] = 2
+
+                Unwrapper._enqueue(neighbours[neighbours >= 0], state, bucket, queue, level)
+
+        return result.reshape(rows, columns)
+
+    @staticmethod
+    def _neighbours(pixels: np.ndarray, rows: int, columns: int, flat: bool = True) -> np.ndarray:
+        """ Flat indices of the 4-connected neighbours of pixels, -1 outside the image """
+
+        column = pixels % columns
+        neighbours = np.stack([
+            np.where(column > 0, pixels - 1, -1),
+            np.where(column < columns - 1, pixels + 1, -1),
+            np.where(pixels >= columns, pixels - columns, -1),
+            np.where(pixels < (rows - 1) * columns, pixels + columns, -1)])
+
+        return neighbours[neighbours >= 0] if flat else neighbours
+
+    @staticmethod
+    def _enqueue(neighbours: np.ndarray, state: np.ndarray, bucket: np.ndarray, queue: list, level: int):
+        """ Queue the still wrapped neighbours once each, in their quality bucket or the current one if better """
+
+        neighbours = np.unique(neighbours[state[neighbours] == 0])
+        state[neighbours] = 1
+
+        levels = np.minimum(bucket[neighbours], level)
+        for neighbour_level in np.unique(levels):
+            queue[neighbour_level].append(neighbours[levels == neighbour_level])
+
+    @staticmethod
+    def phase_derivative_quality(phase: np.ndarray, size: int = 3) -> np.ndarray:
+        """ Negative local variance of the wrapped phase gradients, higher is smoother """
+
+        dy = np.zeros_like(phase)
+        dx = np.zeros_like(phase)
+        dy[:-1] = tools.wrap(np.diff(phase, axis=0))
+        dx[:, :-1] = tools.wrap(np.diff(phase, axis=1))
+
+        variance = np.zeros_like(phase)
+        for gradient in (dy, dx):
+            gradient = np.nan_to_num(gradient)
+            mean = ndimage.uniform_filter(gradient, size)
+            variance += np.sqrt(np.clip(ndimage.uniform_filter(gradient ** 2, size) - mean ** 2, 0, None))
+
+        return -variance
 
     @staticmethod
     def phase_unwrap_1d(initial_cycles, phase_1d):
@@ -81,14 +203,12 @@ class Unwrapper:
 
         res_phase = np.zeros((rw, cl), dtype=np.double)
 
-        # code for calculating whole lines at once
-        for k in range(0, rw - 1):
-            d_ur_ul = tools.wrap(ifgrm[k, 1:] - ifgrm[k, 0:-1])  # diff: (0,1) - (0,0)
-            d_lr_ur = tools.wrap(ifgrm[k + 1, 1:] - ifgrm[k, 1:])  # diff: (1,1) - (0,1)
-            d_ll_lr = tools.wrap(ifgrm[k + 1, 0:-1] - ifgrm[k + 1, 1:])  # diff: (1,0) - (1,1)
-            d_ul_ll = tools.wrap(ifgrm[k, 0:-1] - ifgrm[k + 1, 0:-1])  # diff: (0,0) - (1,0)
-            # residual phase: sum up
-            res_phase[k, 0:-1] = d_ur_ul + d_lr_ur + d_ll_lr + d_ul_ll
+        # residual phase: sum of wrapped differences around every 2x2 loop at once
+        d_ur_ul = tools.wrap(ifgrm[:-1, 1:] - ifgrm[:-1, :-1])  # diff: (0,1) - (0,0)
+        d_lr_ur = tools.wrap(ifgrm[1:, 1:] - ifgrm[:-1, 1:])  # diff: (1,1) - (0,1)
+        d_ll_lr = tools.wrap(ifgrm[1:, :-1] - ifgrm[1:, 1:])  # diff: (1,0) - (1,1)
+        d_ul_ll = tools.wrap(ifgrm[:-1, :-1] - ifgrm[1:, :-1])  # diff: (0,0) - (1,0)
+        res_phase[:-1, :-1] = d_ur_ul + d_lr_ur + d_ll_lr + d_ul_ll
 
         # residual cycles
         res_cycles = np.round(res_phase / (2 * np.pi))
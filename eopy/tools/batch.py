@@ -0,0 +1,216 @@
+import json
+import os
+import time
+import traceback
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+
+class Stages:
+    """ Timer handed to a pipeline, each `with stages('name'):` block adds to the time of that stage """
+    def __init__(self):
+
+        self.seconds = {}
+
+    @contextmanager
+    def __call__(self, name: str):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.) + time.perf_counter() - start
+
+
+class BatchReport:
+    """ Outcome of a batch run: stage timings of completed items, errors of failed items and skipped items """
+    def __init__(self, timings: pd.DataFrame, failed: Dict[str, str], skipped: List[str], results: Dict[str, Any]):
+
+        self.timings = timings
+        self.failed = failed
+        self.skipped = skipped
+        self.results = results
+
+    def __repr__(self) -> str:
+
+        return f'BatchReport - Completed: {len(self.timings)} | Failed: {len(self.failed)} | Skipped: {len(self.skipped)}'
+
+    def summary(self) -> pd.DataFrame:
+        """ Total, mean and maximum seconds of every stage over the completed items """
+
+        return self.timings.agg(['sum', 'mean', 'max']).T
+
+
+class BatchRunner:
+    """ Run a pipeline over many items (file paths, Scenes, ...) in a process pool
+    The pipeline is called as pipeline(item, stages) and must be picklable, e.g. a module level function
+    Every finished item is appended to a checkpoint file so a rerun skips it and resumes where an interrupted run stopped
+    """
+    def __init__(
+            self,
+            pipeline: Callable[[Any, Stages], Any],
+            checkpoint_path: Optional[str] = None,
+            workers: Optional[int] = None,
+            max_memory: Optional[int] = None,
+            key: Optional[Callable[[Any], str]] = None):
+        """ max_memory limits the address space of each worker process in bytes, so one huge scene fails alone
+        instead of taking the machine down; key gives the checkpoint identity of an item
+        """
+
+        self.pipeline = pipeline
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.max_memory = max_memory
+        self.key = key or _item_key
+
+    def completed(self) -> Dict[str, dict]:
+        """ Checkpoint records of the items already completed """
+
+        records = {}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint:
+                for line in checkpoint:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by an interruption
+                    if record.get('status') == 'completed':
+                        records[record['key']] = record
+
+        return records
+
+    def run(self, items: Iterable[Any]) -> BatchReport:
+
+        items = list(items)
+        completed = self.completed()
+        pending = [item for item in items if self.key(item) not in completed]
+        skipped = [self.key(item) for item in items if self.key(item) in completed]
+
+        timings, failed, results = {}, {}, {}
+        progress = tqdm(total=len(pending))
+
+        def finish(item: Any, result: Any, seconds: Dict[str, float], error: Optional[str]):
+
+            key = self.key(item)
+            if error is None:
+                timings[key] = seconds
+                results[key] = result
+            else:
+                failed[key] = error
+            self._record(key, 'completed' if error is None else 'failed', seconds, error)
+            progress.update()
+
+        # a worker that dies, e.g. killed for running out of memory, breaks the pool and the items running beside it;
+        # those go back into a fresh pool at full concurrency, and an item lost twice is run on its own afterwards so
+        # only the item at fault fails
+        queue, alone = [(item, 0) for item in pending], []
+        while queue:
+            lost, unstarted = self._run_pool([item for item, _ in queue], self.workers, finish)
+            retry = [queue[index] for index in unstarted]
+            for index, _ in lost:
+                item, losses = queue[index]
+                if losses:
+                    alone.append(item)
+                else:
+                    retry.append((item, 1))
+            queue = retry
+
+        while alone:
+            lost, unstarted = self._run_pool(alone, 1, finish)
+            for index, error in lost:
+                finish(alone[index], None, {}, error)
+            alone = [alone[index] for index in unstarted]
+        progress.close()
+
+        for key in failed:
+            print(f'Failed: {key}\n{failed[key]}')
+
+        return BatchReport(pd.DataFrame.from_dict(timings, orient='index'), failed, skipped, results)
+
+    def _run_pool(self, items: List[Any], workers: Optional[int], finish: Callable) -> Tuple[List[Tuple[int, str]], List[int]]:
+        """ Run items in a new process pool with one item per worker in flight, passing each outcome to finish
+        Returns the indices of the items lost when a dying worker broke the pool, each with the traceback of the break,
+        and the indices of the items not started before it broke
+        """
+
+        workers = workers or os.cpu_count() or 1
+        lost, running, position, broken = [], {}, 0, False
+        with ProcessPoolExecutor(max_workers=workers, initializer=_limit_memory, initargs=(self.max_memory,)) as executor:
+            while running or (position < len(items) and not broken):
+                while position < len(items) and len(running) < workers and not broken:
+                    try:
+                        running[executor.submit(_run_item, self.pipeline, items[position])] = position
+                        position += 1
+                    except BrokenProcessPool:
+                        broken = True
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=running.get):
+                    index = running.pop(future)
+                    try:
+                        result, seconds, error = future.result()
+                    except BrokenProcessPool:
+                        lost.append((index, traceback.format_exc()))
+                        broken = True
+                        continue
+                    except Exception:
+                        result, seconds, error = None, {}, traceback.format_exc()
+                    finish(items[index], result, seconds, error)
+
+        return lost, list(range(position, len(items)))
+
+    def _record(self, key: str, status: str, seconds: Dict[str, float], error: Optional[str]):
+
+        if not self.checkpoint_path:
+            return
+
+        record = {'key': key, 'status': status, 'seconds': seconds, 'time': time.time()}
+        if error:
+            record['error'] = error
+
+        with open(self.checkpoint_path, 'ab+') as checkpoint:
+            # start a fresh line if an interrupted run left a partial record
+            checkpoint.seek(0, os.SEEK_END)
+            if checkpoint.tell():
+                checkpoint.seek(-1, os.SEEK_END)
+                if checkpoint.read(1) != b'\n':
+                    checkpoint.write(b'\n')
+            checkpoint.write(json.dumps(record).encode() + b'\n')
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+
+def _item_key(item: Any) -> str:
+
+    if isinstance(item, str):
+        return os.path.abspath(item)
+
+    return getattr(item, 'identity', None) or repr(item)
+
+
+def _run_item(pipeline: Callable[[Any, Stages], Any], item: Any):
+
+    stages = Stages()
+    start = time.perf_counter()
+    try:
+        result = pipeline(item, stages)
+        error = None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    stages.seconds['total'] = time.perf_counter() - start
+
+    return result, stages.seconds, error
+
+
+def _limit_memory(max_memory: Optional[int]):
+
+    if max_memory:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
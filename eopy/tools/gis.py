@@ -1,19 +1,27 @@
+from concurrent.futures import ProcessPoolExecutor
+from osgeo import gdal, ogr
 from pyproj import Proj, transform
-from shapely.geometry import Polygon, MultiPolygon
+from shapely.geometry import Polygon
 import mgrs
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import numpy as np
+import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
+from PIL import Image as PILImage
+from PIL import ImageDraw
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 WGS84_EPSG = 4326
 
+_MGRS_CONVERTER = None
+
 
 def world_to_pixel(x: float, y: float, geotransform: "Geotransform") -> Tuple[int, int]:
     """ Transform a projected coordinates to image pixel indices"""
 
-    x = np.round((x - geotransform.upper_left_x) / geotransform.pixel_width).astype(np.int)
-    y = np.round((geotransform.upper_left_y - y) / geotransform.pixel_height).astype(np.int)
+    x = np.round((x - geotransform.upper_left_x) / geotransform.pixel_width).astype(int)
+    y = np.round((geotransform.upper_left_y - y) / geotransform.pixel_height).astype(int)
 
     return x, y
 
@@ -40,10 +48,7 @@ def transform_coordinate(x: float, y: float, in_epsg: int, out_epsg: int) -> Tup
 def get_mgrs_info(wkt_polygon: Polygon) -> Tuple[str, str, str]:
 
     center = wkt_polygon.centroid
-    longitude, latitude = center.x, center.y
-
-    mgrs_converter = mgrs.MGRS()
-    mgrs_code = mgrs_converter.toMGRS(latitude, longitude).decode('utf-8')
+    mgrs_code = mgrs_tiles([center.x], [center.y])[0]
 
     utm_code = mgrs_code[0:2]
     latitude_band = mgrs_code[2:3]
@@ -52,32 +57,230 @@ def get_mgrs_info(wkt_polygon: Polygon) -> Tuple[str, str, str]:
     return utm_code, latitude_band, square
 
 
-def vectorise_image(image: np.ndarray, levels: List[float]) -> gpd.GeoDataFrame:
-    """ Converts a 2D array into a collection of polygon features"""
-    contour_collection = plt.contourf(
-        image,
-        levels=levels)
-    plt.close()
+def mgrs_tiles(longitudes: List[float], latitudes: List[float]) -> List[str]:
+    """ 100 km MGRS tile codes (e.g. 30UXC) of many WGS84 coordinates, reusing one converter """
+
+    global _MGRS_CONVERTER
+    if _MGRS_CONVERTER is None:
+        _MGRS_CONVERTER = mgrs.MGRS()
+
+    codes = [_MGRS_CONVERTER.toMGRS(latitude, longitude, MGRSPrecision=0) for longitude, latitude in zip(longitudes, latitudes)]
+
+    return [code.decode('utf-8') if isinstance(code, bytes) else code for code in codes]
+
+
+def rasterise(polygons: List[Polygon], values: List[int], shape: Tuple[int, int], fill: int = 0) -> np.ndarray:
+    """ Burn pixel coordinate (multi)polygons, including their holes, into one integer raster of shape (y, x)
+    Holes are cut out of a mask of each polygon, so whatever earlier polygons burned there shows through
+    """
+
+    canvas = PILImage.new('I', (shape[1], shape[0]), fill)
+    draw = ImageDraw.Draw(canvas)
+
+    for polygon, value in zip(polygons, values):
+        parts = polygon.geoms if polygon.geom_type == 'MultiPolygon' else [polygon]
+        for part in parts:
+            if not part.interiors:
+                draw.polygon(list(part.exterior.coords), fill=int(value))
+                continue
+
+            # the mask only covers the bounds of the part, offset by its integer origin so pixels line up
+            min_x, min_y, max_x, max_y = part.bounds
+            left, top = max(int(np.floor(min_x)) - 1, 0), max(int(np.floor(min_y)) - 1, 0)
+            right, bottom = min(int(np.ceil(max_x)) + 2, shape[1]), min(int(np.ceil(max_y)) + 2, shape[0])
+            if right <= left or bottom <= top:
+                continue
+
+            mask = PILImage.new('1', (right - left, bottom - top), 0)
+            mask_draw = ImageDraw.Draw(mask)
+            mask_draw.polygon([(x - left, y - top) for x, y in part.exterior.coords], fill=1)
+            for interior in part.interiors:
+                mask_draw.polygon([(x - left, y - top) for x, y in interior.coords], fill=0)
+            canvas.paste(int(value), (left, top, right, bottom), mask)
+
+    return np.array(canvas, dtype=np.int32)
+
+
+def vectorise_image(
+        image: np.ndarray,
+        levels: List[float] = None,
+        geotransform: "Geotransform" = None,
+        epsg: int = None,
+        no_data_value: Optional[int] = 0,
+        tile_size: int = 2048,
+        connectedness: int = 4,
+        workers: int = None) -> gpd.GeoDataFrame:
+    """ Converts a classified or labelled 2D array into one polygon per connected region with its class value
+    With levels the array is first binned, pixels outside the levels are left out and value is the bin number
+    Tiles are polygonised in parallel and polygons which continue across tile seams are merged
+    """
+
+    if levels is not None:
+        bins = np.digitize(image, levels)
+        image = np.where((bins > 0) & (bins < len(levels)), bins, 0)
+        no_data_value = 0
+    image = image.astype(np.int32)
+
+    base = geotransform.tuple if geotransform else (0., 1., 0., 0., 0., 1.)
+    tiles = [(y, x) for y in range(0, image.shape[0], tile_size) for x in range(0, image.shape[1], tile_size)]
+
+    arguments = []
+    for y, x in tiles:
+        labels = image[y:y + tile_size, x:x + tile_size]
+        mask = labels != no_data_value if no_data_value is not None else None
+        tile_transform = (base[0] + x * base[1] + y * base[2], base[1], base[2],
+                          base[3] + x * base[4] + y * base[5], base[4], base[5])
+        arguments.append((labels, mask, tile_transform, connectedness))
+
+    if len(arguments) == 1:
+        results = [_polygonise_tile(*arguments[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_polygonise_tile, *zip(*arguments)))
+
+    values, polygons, on_seam = [], [], []
+    for (y, x), (tile_values, tile_polygons) in zip(tiles, results):
+        tile_polygons = gpd.GeoSeries.from_wkb(tile_polygons)
+        values.extend(tile_values)
+        polygons.extend(tile_polygons)
+        on_seam.append(_touches_internal_edge(tile_polygons, (y, x), tile_size, image.shape, base))
+
+    on_seam = np.concatenate(on_seam) if on_seam else np.zeros(0, dtype=bool)
+    gdf = gpd.GeoDataFrame({'value': values}, geometry=polygons, crs=f'epsg:{epsg}' if epsg else None)
+
+    return _merge_across_seams(gdf, np.array(on_seam, dtype=bool), connectedness)
+
+
+def polygonise(labels: np.ndarray, geotransform: "Geotransform" = None, epsg: int = None, connectedness: int = 4) -> gpd.GeoDataFrame:
+    """ Convert a labelled 2D array into one (multi)polygon per non-zero label
+    Without a geotransform the polygons are in pixel coordinates (column, row)
+    """
+
+    gdf = vectorise_image(labels, geotransform=geotransform, epsg=epsg, no_data_value=0, connectedness=connectedness)
+
+    return gdf.dissolve(by='value', as_index=False)
+
+
+def _polygonise_tile(labels: np.ndarray, mask: Optional[np.ndarray], tile_transform: Tuple, connectedness: int) -> Tuple[List[int], List[bytes]]:
+    """ GDAL Polygonize of one tile, returning class values and WKB geometries so results pickle cheaply """
+
+    height, width = labels.shape
+    driver = gdal.GetDriverByName('MEM')
+    dataset = driver.Create('', width, height, 1, gdal.GDT_Int32)
+    dataset.SetGeoTransform(tile_transform)
+    band = dataset.GetRasterBand(1)
+    band.WriteArray(labels)
+
+    mask_band = None
+    if mask is not None:
+        mask_dataset = driver.Create('', width, height, 1, gdal.GDT_Byte)
+        mask_band = mask_dataset.GetRasterBand(1)
+        mask_band.WriteArray(mask.astype(np.uint8))
+
+    vector_dataset = ogr.GetDriverByName('Memory').CreateDataSource('')
+    layer = vector_dataset.CreateLayer('polygons')
+    layer.CreateField(ogr.FieldDefn('value', ogr.OFTInteger))
+
+    options = ['8CONNECTED=8'] if connectedness == 8 else []
+    gdal.Polygonize(band, mask_band, layer, 0, options)
+
+    values, polygons = [], []
+    for feature in layer:
+        values.append(feature.GetField(0))
+        polygons.append(bytes(feature.GetGeometryRef().ExportToWkb()))
+
+    return values, polygons
+
+
+def _touches_internal_edge(polygons: gpd.GeoSeries, origin: Tuple[int, int], tile_size: int, shape: Tuple[int, int], base: Tuple) -> np.ndarray:
+    """ Whether each polygon of a tile reaches a tile edge which is not also an edge of the image """
+
+    touches = np.zeros(len(polygons), dtype=bool)
+    if len(polygons) == 0:
+        return touches
+
+    y, x = origin
+    bottom, right = min(y + tile_size, shape[0]), min(x + tile_size, shape[1])
+    min_x, min_y, max_x, max_y = polygons.bounds.values.T
+
+    for row, internal in ((y, y > 0), (bottom, bottom < shape[0])):
+        if internal:
+            edge = base[3] + row * base[5]
+            touches |= np.isclose(min_y, edge) | np.isclose(max_y, edge)
+    for column, internal in ((x, x > 0), (right, right < shape[1])):
+        if internal:
+            edge = base[0] + column * base[1]
+            touches |= np.isclose(min_x, edge) | np.isclose(max_x, edge)
+
+    return touches
+
+
+def _merge_across_seams(gdf: gpd.GeoDataFrame, on_seam: np.ndarray, connectedness: int = 4) -> gpd.GeoDataFrame:
+    """ Union seam polygons of the same class which share an edge, or also just a corner when 8-connected """
+
+    if not on_seam.any():
+        return gdf.reset_index(drop=True)
+
+    seam = gdf[on_seam].reset_index(drop=True)
+    first, second = seam.sindex.query(seam.geometry, predicate='intersects')
+    values = seam['value'].values
+    same = (first < second) & (values[first] == values[second])
+    first, second = first[same], second[same]
+
+    if connectedness != 8:
+        shared = seam.geometry.iloc[first].reset_index(drop=True).intersection(seam.geometry.iloc[second].reset_index(drop=True))
+        first, second = first[shared.length.values > 0], second[shared.length.values > 0]
+
+    graph = coo_matrix((np.ones(len(first)), (first, second)), shape=(len(seam), len(seam)))
+    _, component = connected_components(graph, directed=False)
+    merged = seam.assign(component=component).dissolve(by='component', as_index=False).drop(columns='component')
+
+    return pd.concat([gdf[~on_seam], merged], ignore_index=True)
+
+
+def expand_features(table: pd.DataFrame, column: str = 'features', prefix: str = 'band_') -> pd.DataFrame:
+    """ Replace an object column of per row feature arrays with one float32 column per band """
+
+    if column not in table.columns:
+        return table
+
+    features = np.stack(table[column].to_numpy()).astype(np.float32).reshape(len(table), -1)
+    bands = pd.DataFrame(features, index=table.index, columns=[f'{prefix}{band}' for band in range(features.shape[1])])
+
+    return pd.concat([table.drop(column, axis=1), bands], axis=1)
+
+
+def collapse_features(table: pd.DataFrame, column: str = 'features', prefix: str = 'band_') -> pd.DataFrame:
+    """ Gather the per band columns written by expand_features back into an object column of float32 arrays """
+
+    band_columns = sorted([c for c in table.columns if c.startswith(prefix) and c[len(prefix):].isdigit()],
+                          key=lambda c: int(c[len(prefix):]))
+    if not band_columns:
+        return table
+
+    features = table[band_columns].to_numpy(dtype=np.float32)
+    table = table.drop(band_columns, axis=1)
+    table[column] = list(features)
+
+    return table
+
+
+def write_parquet(table: pd.DataFrame, file_path: str, column: str = 'features', compression: str = 'snappy'):
+    """ Write a (Geo)DataFrame as (Geo)Parquet with its feature arrays expanded into typed band columns """
+
+    table = expand_features(table, column)
+    if isinstance(table, gpd.GeoDataFrame):
+        table.to_parquet(file_path, compression=compression)
+    else:
+        table.to_parquet(file_path, compression=compression, engine='pyarrow')
 
-    contour_polygons = []
-    for i, contour in enumerate(contour_collection.collections):
-        path_polygons = []
-        for path in contour.get_paths():
-            path.should_simplify = False
-            polygon = path.to_polygons()
 
-            holes, exterior = [], []
-            if len(polygon) > 0 and len(polygon[0]) > 3:
-                exterior = polygon[0]
-                if len(polygon) > 1:
-                    holes = [h for h in polygon[1:] if len(h) > 3]
+def read_parquet(file_path: str, column: str = 'features') -> pd.DataFrame:
+    """ Read a table written by write_parquet, as a GeoDataFrame when it has GeoParquet metadata """
 
-            if len(exterior) > 3:
-                path_polygons.append(Polygon(exterior, holes))
+    import pyarrow.parquet as pq
 
-            if len(path_polygons) > 1:
-                contour_polygons.append(MultiPolygon(path_polygons))
-            elif len(path_polygons) == 1:
-                contour_polygons.append(path_polygons[0])
+    metadata = pq.read_schema(file_path).metadata or {}
+    table = gpd.read_parquet(file_path) if b'geo' in metadata else pd.read_parquet(file_path, engine='pyarrow')
 
-    return gpd.GeoDataFrame(contour_polygons, columns=['geom'], geometry='geom')
+    return collapse_features(table, column)
@@ -53,8 +53,8 @@ def show_superpixel_spectra(superpixels: Superpixels):
     """ Plot the average spectra for each superpixel cluster """
     plt.figure(figsize=(15, 10))
 
-    for cluster in superpixels.gdf.cluster.unique():
-        features = np.stack(superpixels.gdf.loc[superpixels.gdf.cluster == cluster].features.tolist())
+    for cluster in superpixels.table.cluster.unique():
+        features = np.stack(superpixels.table.loc[superpixels.table.cluster == cluster].features.tolist())
         mean = np.nanmean(features, axis=0)
         std = np.nanmean(features, axis=0)
 
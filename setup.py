@@ -22,15 +22,20 @@ setup(
         'folium',
         'gdal',
         'geopandas',
+        'joblib',
         'matplotlib',
         'mgrs',
         'numpy',
         'pandas',
         'pillow',
+        'pyarrow',
         'scipy',
         'shapely',
         'sklearn',
         'tqdm',
     ],
+    extras_require={
+        'dask': ['dask[array]'],
+    },
     namespace_packages=['eopy']
 )
@@ -0,0 +1,39 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.classify.accuracy import Accuracy
+
+
+@fixture
+def accuracy():
+
+    truth = np.array([0, 0, 0, 1, 1, 2, -1])
+    predicted = np.array([0, 0, 1, 1, 1, 255, 0])
+
+    return Accuracy.from_labels(truth, predicted, classes=['water', 'forest', 'urban'])
+
+
+def test_from_labels_ignores_unlabelled_and_no_data(accuracy):
+
+    assert accuracy.confusion_matrix.tolist() == [[2, 1, 0], [0, 2, 0], [0, 0, 0]]
+    assert accuracy.total == 5
+
+
+def test_overall_accuracy(accuracy):
+
+    assert accuracy.overall == 0.8
+
+
+def test_kappa(accuracy):
+
+    expected = (3 * 2 + 2 * 3) / 25
+
+    assert np.isclose(accuracy.kappa, (0.8 - expected) / (1 - expected))
+
+
+def test_add_accumulates_confusion_matrices(accuracy):
+
+    combined = accuracy + accuracy
+
+    assert combined.total == 10
+    assert combined.overall == accuracy.overall
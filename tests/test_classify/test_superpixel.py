@@ -0,0 +1,65 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.classify.superpixel import Superpixels
+from eopy.image import Geotransform, Image
+
+
+@fixture
+def image():
+
+    pixels = np.zeros((40, 40, 3), dtype=np.float32)
+    pixels[:, 20:] = [1., 0.5, 0.25]
+
+    return Image(pixels, Geotransform(1000, 2000, 10, 10, 0, 0), 32630)
+
+
+def test_segment_means_ignores_nan():
+
+    segments = np.array([[1, 1, 2], [1, 2, 2]])
+    pixels = np.array([[1., 3., 10.], [np.nan, 20., 30.]])
+
+    means = Superpixels.segment_means(segments, pixels)
+
+    assert means.shape == (2, 1)
+    assert np.allclose(means[:, 0], [2., 20.])
+
+
+def test_segment_image_keeps_segments_within_regions(image):
+
+    superpixels = Superpixels.segment_image(image, n_segments=8, compactness=0.1)
+
+    assert superpixels.segments.shape == (40, 40)
+    assert len(superpixels.table) == superpixels.segments.max()
+    for features in superpixels.table.features:
+        assert np.allclose(features, 0) or np.allclose(features, [1., 0.5, 0.25])
+
+
+def test_cluster_to_image_paints_clusters_onto_pixels(image):
+
+    superpixels = Superpixels.segment_image(image, n_segments=8, compactness=0.1)
+    superpixels.cluster(n_clusters=2)
+
+    clusters = superpixels.to_image('cluster')
+
+    assert clusters.shape == (40, 40)
+    assert clusters.geotransform is image.geotransform
+    assert len(np.unique(clusters.pixels[:, :20])) == 1
+    assert len(np.unique(clusters.pixels[:, 20:])) == 1
+    assert clusters.pixels[0, 0] != clusters.pixels[0, 39]
+
+
+def test_gdf_traces_one_polygon_per_segment(image):
+
+    superpixels = Superpixels.segment_image(image, n_segments=8, compactness=0.1)
+
+    gdf = superpixels.gdf
+
+    assert list(gdf.index) == list(superpixels.table.index)
+    assert np.isclose(gdf.area.sum(), 40 * 40)
+    for segment, polygon in gdf.geometry.items():
+        assert np.isclose(polygon.area, (superpixels.segments == segment).sum())
+
+    superpixels.project_to_geographic()
+    assert np.isclose(superpixels.gdf.area.sum(), 40 * 40 * 100)
+    assert superpixels.gdf.crs.to_epsg() == 32630
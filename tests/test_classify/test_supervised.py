@@ -0,0 +1,183 @@
+import numpy as np
+import geopandas as gpd
+from pytest import fixture, raises
+from shapely.geometry import box
+
+from eopy.classify.supervised import Supervised
+from eopy.image import Geotransform, Image
+
+EPSG = 32630
+
+
+@fixture
+def image():
+
+    pixels = np.zeros((20, 20, 2), dtype=np.float32)
+    pixels[:, 10:] = [1., 2.]
+    pixels[0, 0] = np.nan
+
+    return Image(pixels, Geotransform(500000, 4000000, 10, 10, 0, 0), EPSG)
+
+
+@fixture
+def vector_path(tmpdir):
+
+    # pixel boxes (0, 0, 5, 10) and (12, 5, 18, 15), rasterise burns their boundary pixels too
+    water = box(500000, 4000000 - 100, 500050, 4000000)
+    forest = box(500120, 4000000 - 150, 500180, 4000000 - 50)
+    path = str(tmpdir.join('training.geojson'))
+    gpd.GeoDataFrame({'class': ['water', 'forest']}, geometry=[water, forest], crs=f'epsg:{EPSG}').to_file(path, driver='GeoJSON')
+
+    return path
+
+
+def test_extract_features_labels_pixels_inside_polygons(image, vector_path):
+
+    supervised = Supervised(image, EPSG, vector_path)
+
+    features, labels = supervised.features, supervised.labels
+
+    assert supervised.classes == ['water', 'forest']
+    assert np.bincount(labels).tolist() == [6 * 11 - 1, 7 * 11]
+    assert np.allclose(features[labels == 0], 0) and np.allclose(features[labels == 1], [1., 2.])
+
+
+def test_extract_features_caps_samples_per_class(image, vector_path):
+
+    supervised = Supervised(image, EPSG, vector_path, max_samples_per_class=7, random_state=0)
+
+    assert np.bincount(supervised.labels).tolist() == [7, 7]
+
+
+@fixture
+def trained(image, vector_path):
+
+    supervised = Supervised(image, EPSG, vector_path, random_state=0)
+    supervised.train_model()
+
+    return supervised
+
+
+@fixture
+def scene():
+
+    pixels = np.random.default_rng(1).uniform(-0.5, 1.5, (23, 19, 2)).astype(np.float32)
+    pixels[22, 18] = np.nan
+
+    return Image(pixels, Geotransform(500000, 4000000, 10, 10, 0, 0), EPSG, no_data_value=None)
+
+
+def test_tiled_apply_model_matches_single_pass_prediction(trained, scene):
+
+    features = scene.pixels.reshape(-1, 2)
+    valid = ~np.isnan(features).any(axis=1)
+    expected = np.full(len(features), 255, dtype=np.uint8)
+    expected[valid] = trained.model.predict(features[valid])
+
+    # 23x19 in tiles of 8 leaves partial tiles along the right and bottom edges
+    classified = trained.apply_model(scene, tile_size=8, workers=2)
+
+    assert classified.pixels.dtype == np.uint8
+    assert np.array_equal(classified.pixels, expected.reshape(23, 19))
+    assert classified.pixels[22, 18] == 255
+
+
+def test_tiled_apply_model_writes_windows_to_file(trained, scene, tmpdir):
+
+    from eopy.image import Loader
+
+    file_path = str(tmpdir.join('classified.tif'))
+    expected = trained.apply_model(scene, tile_size=64)
+
+    assert trained.apply_model(scene, tile_size=8, file_path=file_path) is None
+
+    written = Loader().load(file_path)
+    assert np.array_equal(written.pixels, expected.pixels)
+    assert written.geotransform.tuple == scene.geotransform.tuple
+
+
+def test_tiled_apply_model_probabilities_have_a_band_per_class(trained, scene):
+
+    probabilities = trained.apply_model(scene, tile_size=8, probabilities=True)
+
+    assert probabilities.shape == (23, 19, 2)
+    assert np.all(np.abs(probabilities.pixels[:22].astype(int).sum(axis=2) - 255) <= 1)
+
+
+def test_save_and_load_model_predicts_the_same(trained, scene, tmpdir):
+
+    file_path = str(tmpdir.join('model.joblib'))
+    trained.save_model(file_path)
+
+    loaded = Supervised.load_model(file_path)
+
+    assert loaded.trained and loaded.classes == trained.classes and loaded.band_count == 2
+    assert np.array_equal(loaded.apply_model(scene, tile_size=8).pixels, trained.apply_model(scene, tile_size=8).pixels)
+
+
+def test_feature_cache_hits_for_same_inputs_and_misses_when_vectors_change(image, vector_path, tmpdir, monkeypatch):
+
+    cache_directory = str(tmpdir.join('cache'))
+    first = Supervised(image, EPSG, vector_path, cache_directory=cache_directory)
+    expected = first.features
+
+    # an unrelated sibling file does not change the key
+    with open(vector_path[:-len('.geojson')] + '.csv', 'w') as sibling:
+        sibling.write('unrelated')
+
+    def fail(*args):
+        raise AssertionError('features should come from the cache')
+
+    monkeypatch.setattr(Supervised, '_extract_features', fail)
+    second = Supervised(image, EPSG, vector_path, cache_directory=cache_directory)
+    assert np.array_equal(second.features, expected)
+    assert second.classes == first.classes
+
+    gpd.read_file(vector_path).iloc[:1].to_file(vector_path, driver='GeoJSON')
+    with raises(AssertionError):
+        _ = Supervised(image, EPSG, vector_path, cache_directory=cache_directory).features
+
+
+def test_truncated_feature_cache_is_a_miss_and_rewritten(image, vector_path, tmpdir):
+
+    cache_directory = str(tmpdir.join('cache'))
+    expected = Supervised(image, EPSG, vector_path, cache_directory=cache_directory).features
+    cache_path = tmpdir.join('cache').listdir()[0]
+    cache_path.write_binary(cache_path.read_binary()[:100])  # as left by an interrupted write
+
+    assert np.array_equal(Supervised(image, EPSG, vector_path, cache_directory=cache_directory).features, expected)
+    assert [path.basename for path in tmpdir.join('cache').listdir()] == [cache_path.basename]
+    assert np.array_equal(Supervised(image, EPSG, vector_path, cache_directory=cache_directory).features, expected)
+
+
+def test_vector_files_are_the_shapefile_and_its_sidecars(tmpdir):
+
+    directory = tmpdir.mkdir('train[1]')
+    for extension in ('.shp', '.shx', '.dbf', '.prj', '.csv'):
+        directory.join('train' + extension).write('')
+    directory.join('train.shp.bak').write('')
+
+    files = Supervised._vector_files(str(directory.join('train.shp')))
+
+    assert [f[len(str(directory)) + 1:] for f in files] == ['train.shp', 'train.shx', 'train.dbf', 'train.prj']
+    assert Supervised._vector_files('train.geojson') == ['train.geojson']
+
+
+def test_saved_vectors_reload_in_world_coordinates_and_train(image, vector_path, tmpdir):
+
+    original = Supervised(image, EPSG, vector_path)
+    file_path = str(tmpdir.join('training.parquet'))
+    original.save_vectors(file_path)
+
+    saved = gpd.read_parquet(file_path)
+    assert saved.geometry.name == 'geometry'
+    assert saved.crs.to_epsg() == EPSG
+    assert 'pixel_polygon' not in saved.columns
+
+    reloaded = Supervised(image, EPSG, file_path)
+    assert reloaded.classes == original.classes
+    assert np.array_equal(reloaded.labels, original.labels)
+    assert np.array_equal(reloaded.features, original.features)
+
+    reloaded.train_model()
+    assert reloaded.trained
@@ -0,0 +1,44 @@
+import numpy as np
+
+from eopy.classify.tiles import NO_DATA_CLASS, classify_tiles, iterate_valid_features
+from eopy.image import Geotransform, Image
+
+
+def _image() -> Image:
+
+    pixels = np.arange(13 * 11 * 2, dtype=np.float32).reshape(13, 11, 2)
+    pixels[12, 10] = np.nan
+    pixels[0, 0] = -1.
+
+    return Image(pixels, Geotransform(0, 0, 1, 1, 0, 0), no_data_value=-1.)
+
+
+def test_classify_tiles_matches_whole_image_prediction_over_partial_tiles():
+
+    image = _image()
+
+    def predict(features: np.ndarray) -> np.ndarray:
+        return (features[:, 0] % 7).astype(np.uint8)
+
+    classified = classify_tiles(image, predict, tile_size=4, workers=3)
+
+    expected = (image.pixels[:, :, 0] % 7)
+    assert classified.pixels[0, 0] == classified.pixels[12, 10] == NO_DATA_CLASS
+    assert np.array_equal(classified.pixels[1:12], expected[1:12].astype(np.uint8))
+    assert classified.no_data_value == NO_DATA_CLASS
+
+
+def test_classify_tiles_writes_several_bands():
+
+    image = _image()
+
+    classified = classify_tiles(image, lambda features: np.ones((len(features), 3)), band_count=3, tile_size=5, no_data_value=None)
+
+    assert classified.shape == (13, 11, 3)
+    assert classified.pixels[0, 0].tolist() == [0, 0, 0]
+    assert classified.pixels[5, 5].tolist() == [1, 1, 1]
+
+
+def test_iterate_valid_features_skips_nan_and_no_data():
+
+    assert sum(len(features) for features in iterate_valid_features(_image(), tile_size=4)) == 13 * 11 - 2
@@ -0,0 +1,62 @@
+import numpy as np
+from pytest import fixture, raises
+
+from eopy.classify.unsupervised import Unsupervised
+from eopy.image import Image
+
+
+@fixture
+def image():
+
+    pixels = np.zeros((20, 20, 2), dtype=np.float32)
+    pixels[:, 10:] = [5., 5.]
+    pixels[0, 0] = np.nan
+
+    return Image(pixels, no_data_value=None)
+
+
+def test_train_and_apply_separates_clusters(image):
+
+    unsupervised = Unsupervised(n_clusters=2, batch_size=64, tile_size=8, random_state=0)
+    unsupervised.train_model(image)
+
+    clusters = unsupervised.apply_model(image)
+
+    assert clusters.pixels[0, 0] == 255
+    assert len(np.unique(clusters.pixels[1:, :10])) == len(np.unique(clusters.pixels[:, 10:])) == 1
+    assert clusters.pixels[1, 0] != clusters.pixels[1, 19]
+
+
+def test_generator_cannot_be_trained_for_several_epochs(image):
+
+    with raises(UserWarning):
+        Unsupervised(n_clusters=2).train_model((i for i in [image]), epochs=2)
+
+
+def test_image_factory_is_called_every_epoch(image):
+
+    calls = []
+
+    def images():
+        calls.append(1)
+        yield image
+
+    Unsupervised(n_clusters=2, random_state=0).train_model(images, epochs=3)
+
+    assert len(calls) == 3
+
+
+def test_trailing_samples_fewer_than_clusters_are_fitted_once_the_model_has_centres(monkeypatch):
+
+    pixels = np.full((10, 20, 2), np.nan, dtype=np.float32)
+    pixels[:, :10] = np.random.default_rng(0).random((10, 10, 2))
+    pixels[0, 10:13] = 1.
+
+    unsupervised = Unsupervised(n_clusters=4, batch_size=100, tile_size=10, random_state=0)
+    sizes = []
+    partial_fit = unsupervised.model.partial_fit
+    monkeypatch.setattr(unsupervised.model, 'partial_fit', lambda features: sizes.append(len(features)) or partial_fit(features))
+
+    unsupervised.train_model(Image(pixels, no_data_value=None))
+
+    assert sizes == [100, 3]
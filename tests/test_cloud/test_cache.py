@@ -0,0 +1,105 @@
+import os
+import threading
+import requests
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pytest import fixture
+
+from eopy.cloud.cache import BlockCache, CacheServer
+
+CONTENT = os.urandom(10000)
+
+
+@fixture
+def origin():
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_HEAD(self):
+
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(CONTENT)))
+            self.end_headers()
+
+        def do_GET(self):
+
+            self.server.requests.append(self.headers.get('Range'))
+            start, stop = [int(value) for value in self.headers['Range'][6:].split('-')]
+            body = CONTENT[start:stop + 1]
+
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{stop}/{len(CONTENT)}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.url = f'http://127.0.0.1:{server.server_port}/scene/B04.tif'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_repeat_reads_are_served_from_disk(origin, tmpdir):
+
+    cache = BlockCache(str(tmpdir), block_size=1024)
+
+    assert cache.read(origin.url, 1000, 2000) == CONTENT[1000:3000]
+    assert cache.misses == 3 and cache.hits == 0
+
+    assert BlockCache(str(tmpdir), block_size=1024).read(origin.url, 1500, 100) == CONTENT[1500:1600]
+    assert len(origin.requests) == 3
+
+
+def test_cache_evicts_least_recently_used_blocks(origin, tmpdir):
+
+    cache = BlockCache(str(tmpdir), max_bytes=4096, block_size=1024)
+    for start in range(0, len(CONTENT), 1024):
+        cache.read(origin.url, start, 1024)
+    cache.evict()
+
+    cached = sum(os.path.getsize(path) for path in tmpdir.visit() if path.isfile())
+    assert cached <= 4096
+    assert cache.read(origin.url, len(CONTENT) - 10, 10) == CONTENT[-10:]
+    assert cache.hits == 1
+
+
+def test_cache_server_answers_range_requests(origin, tmpdir):
+
+    cache = BlockCache(str(tmpdir), block_size=1024)
+    with CacheServer(cache) as server:
+        response = requests.get(server.url_for(origin.url), headers={'Range': 'bytes=5000-5999'})
+        repeat = requests.get(server.url_for(origin.url), headers={'Range': 'bytes=4200-4299'})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[5000:6000]
+    assert repeat.content == CONTENT[4200:4300]
+    assert cache.stats['misses'] == 2 and cache.stats['hits'] == 1
+
+
+def test_cache_server_answers_multiple_ranges_with_multipart_body(origin, tmpdir):
+
+    with CacheServer(BlockCache(str(tmpdir), block_size=1024)) as server:
+        response = requests.get(server.url_for(origin.url), headers={'Range': 'bytes=10-19, 5000-5099, -5'})
+
+    message = message_from_bytes(f'Content-Type: {response.headers["Content-Type"]}\r\n\r\n'.encode() + response.content)
+    parts = message.get_payload()
+
+    assert response.status_code == 206
+    assert response.headers['Content-Type'].startswith('multipart/byteranges')
+    assert [part['Content-Range'] for part in parts] == \
+        ['bytes 10-19/10000', 'bytes 5000-5099/10000', 'bytes 9995-9999/10000']
+    assert [part.get_payload(decode=True) for part in parts] == [CONTENT[10:20], CONTENT[5000:5100], CONTENT[-5:]]
+
+
+def test_cache_server_rejects_ranges_past_the_end(origin, tmpdir):
+
+    with CacheServer(BlockCache(str(tmpdir), block_size=1024)) as server:
+        response = requests.get(server.url_for(origin.url), headers={'Range': 'bytes=20000-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */10000'
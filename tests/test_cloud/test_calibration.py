@@ -0,0 +1,81 @@
+import os
+import numpy as np
+from pytest import fixture, raises
+
+from eopy.cloud.calibration import Calibrator, LandsatMetadata
+from eopy.image import Image
+
+MTL = '''GROUP = L1_METADATA_FILE
+  GROUP = IMAGE_ATTRIBUTES
+    SUN_ELEVATION = 30.00000000
+  END_GROUP = IMAGE_ATTRIBUTES
+  GROUP = RADIOMETRIC_RESCALING
+    REFLECTANCE_MULT_BAND_1 = 2.0000E-05
+    REFLECTANCE_MULT_BAND_2 = 4.0000E-05
+    REFLECTANCE_ADD_BAND_1 = -0.100000
+    REFLECTANCE_ADD_BAND_2 = -0.200000
+  END_GROUP = RADIOMETRIC_RESCALING
+END_GROUP = L1_METADATA_FILE
+END
+'''
+
+
+@fixture
+def metadata_path(tmpdir):
+
+    path = tmpdir.join('LC08_MTL.txt')
+    path.write(MTL)
+    return str(path)
+
+
+@fixture
+def image():
+
+    pixels = np.full((4, 6, 2), 20000, dtype=np.uint16)
+    pixels[0, 0] = 0
+    return Image(pixels)
+
+
+def test_calibrate_landsat_toa_reflectance(metadata_path, image):
+
+    calibrated = Calibrator().calibrate_landsat(image, metadata_path, [1, 2], tile_size=3)
+
+    assert calibrated.pixels.dtype == np.float32
+    assert np.allclose(calibrated.pixels[1, 1], [(0.4 - 0.1) / 0.5, (0.8 - 0.2) / 0.5])
+    assert np.all(calibrated.pixels[0, 0] == 0)
+
+
+def test_calibrate_landsat_scaled_uint16(metadata_path, image):
+
+    calibrated = Calibrator().calibrate_landsat(image, metadata_path, [1, 2], dtype=np.uint16)
+
+    assert calibrated.pixels.dtype == np.uint16
+    assert np.array_equal(calibrated.pixels[1, 1], [6000, 12000])
+
+
+def test_metadata_is_parsed_once(metadata_path):
+
+    first = LandsatMetadata.load(metadata_path)
+    second = LandsatMetadata.load(metadata_path)
+
+    assert first.values is second.values
+    assert first['SUN_ELEVATION'] == '30.00000000'
+
+
+def test_metadata_is_read_again_once_modified(metadata_path):
+
+    first = LandsatMetadata.load(metadata_path)
+    with open(metadata_path, 'w') as metadata_file:
+        metadata_file.write(MTL.replace('30.00000000', '45.00000000'))
+    os.utime(metadata_path, (0, os.path.getmtime(metadata_path) + 10))
+
+    assert LandsatMetadata.load(metadata_path)['SUN_ELEVATION'] == '45.00000000'
+    assert first['SUN_ELEVATION'] == '30.00000000'
+
+
+def test_metadata_values_are_read_only(metadata_path):
+
+    metadata = LandsatMetadata.load(metadata_path)
+
+    with raises(TypeError):
+        metadata.values['SUN_ELEVATION'] = '0'
@@ -0,0 +1,67 @@
+from datetime import datetime
+from pytest import fixture
+from shapely.geometry import box
+
+from eopy.cloud.catalog import SceneCatalog
+from eopy.cloud.scene import Scene
+from eopy.geometry import GeoPolygon
+
+
+def _scene(identity: str, footprint, cloud: float, date: datetime) -> Scene:
+
+    return Scene(identity=identity, satellite_name='sentinel-2a', cloud_coverage=cloud, area_coverage=0.,
+                 date=date, thumbnail=None, polygon=GeoPolygon(footprint, epsg=4326),
+                 links={'B04': {'href': f'http://example.com/{identity}/B04.tif'}}, epsg=32630)
+
+
+@fixture
+def catalog():
+
+    return SceneCatalog.from_scenes([
+        _scene('S2A_30UXC_20190101_0', box(0, 51, 1, 52), 10., datetime(2019, 1, 1)),
+        _scene('S2A_30UYC_20190101_0', box(0.5, 51, 1.5, 52), 20., datetime(2019, 1, 1)),
+        _scene('S2A_30UXC_20190111_0', box(0, 51, 1, 52), 80., datetime(2019, 1, 11)),
+        _scene('S2A_31UCT_20190111_0', box(5, 51, 6, 52), 5., datetime(2019, 1, 11)),
+    ])
+
+
+def test_query_filters_by_boundary_date_and_cloud(catalog):
+
+    boundary = GeoPolygon(box(0.2, 51.2, 0.4, 51.4), epsg=4326)
+    result = catalog.query(boundary, start=datetime(2019, 1, 1), end=datetime(2019, 1, 5), cloud_max=50)
+
+    assert result.table.identity.tolist() == ['S2A_30UXC_20190101_0']
+    coverage = result.table.area_coverage.iloc[0]
+    assert abs(coverage - 100) < 1e-6
+
+
+def test_deduplicate_drops_redundant_overlapping_tiles(catalog):
+
+    boundary = GeoPolygon(box(0.2, 51.2, 0.8, 51.8), epsg=4326)
+    result = catalog.query(boundary).deduplicate(boundary)
+
+    assert sorted(result.table.identity) == ['S2A_30UXC_20190101_0', 'S2A_30UXC_20190111_0']
+
+
+def test_group_by_tile(catalog):
+
+    groups = catalog.group_by_tile()
+
+    assert sorted(groups) == ['30UXC', '30UYC', '31UCT']
+    assert len(groups['30UXC']) == 2
+
+
+def test_add_is_incremental_and_persists(catalog, tmpdir):
+
+    file_path = str(tmpdir.join('catalog.parquet'))
+    catalog.save(file_path)
+    loaded = SceneCatalog.load(file_path)
+
+    added = loaded.add([_scene('S2A_30UXC_20190101_0', box(0, 51, 1, 52), 10., datetime(2019, 1, 1)),
+                        _scene('LC08_L1TP_202024_20190105_20190105_01_RT', box(0, 51, 1, 52), 1., datetime(2019, 1, 5))])
+    scene = loaded.query(cloud_max=2).scenes[0]
+
+    assert added == 1
+    assert len(loaded) == 5
+    assert loaded.table.tile.iloc[-1] == '202/024'
+    assert scene.links['B04']['href'].endswith('B04.tif') and scene.epsg == 32630
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import threading
+import numpy as np
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from osgeo import gdal
+from pytest import fixture, raises
+from shapely.geometry import box
+from tqdm import tqdm
+
+from eopy.cloud.downloader import Downloader, STREAM_OPTIONS
+from eopy.cloud.scene import Scene
+from eopy.geometry import GeoPolygon
+from eopy.image import Geotransform, Image
+
+CONTENT = os.urandom(300000)
+
+
+@fixture
+def server():
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+
+            self.server.ranges.append(self.headers.get('Range'))
+            if self.headers.get('Range') and self.server.unsatisfiable:
+                self.send_response(416)
+                if self.server.content_range:
+                    self.send_header('Content-Range', self.server.content_range)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start = int(self.headers['Range'][6:-1]) if self.headers.get('Range') else 0
+            body = CONTENT[start:]
+
+            self.send_response(206 if start else 200)
+            if start:
+                self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    http_server.ranges = []
+    http_server.unsatisfiable, http_server.content_range = False, None
+    http_server.url = f'http://127.0.0.1:{http_server.server_port}'
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    yield http_server
+    http_server.shutdown()
+
+
+@fixture
+def tif_server(tmpdir):
+
+    red = np.arange(400, dtype=np.uint16).reshape(20, 20)
+    Image(red, Geotransform(500000, 4000000, 10, 10, 0, 0), 32630, no_data_value=0).save(str(tmpdir.join('B04.tif')))
+    nir = np.arange(100, dtype=np.uint16).reshape(10, 10) + 1
+    Image(nir, Geotransform(500000, 4000000, 20, 20, 0, 0), 32630, no_data_value=0).save(str(tmpdir.join('B08.tif')))
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _content(self) -> bytes:
+
+            with open(str(tmpdir.join(os.path.basename(self.path))), 'rb') as file:
+                return file.read()
+
+        def do_HEAD(self):
+
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(self._content())))
+            self.end_headers()
+
+        def do_GET(self):
+
+            content = self._content()
+            if self.headers.get('Range'):
+                start, stop = [int(value) for value in self.headers['Range'][6:].split('-')]
+                stop = min(stop, len(content) - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{stop}/{len(content)}')
+            else:
+                start, stop = 0, len(content) - 1
+                self.send_response(200)
+            self.send_header('Content-Length', str(stop + 1 - start))
+            self.end_headers()
+            self.wfile.write(content[start:stop + 1])
+
+        def log_message(self, *args):
+            pass
+
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    http_server.url = f'http://127.0.0.1:{http_server.server_port}'
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    yield http_server
+    http_server.shutdown()
+
+
+def _scene(url: str) -> Scene:
+
+    checksum = '1220' + hashlib.sha256(CONTENT).hexdigest()
+    return Scene(identity='S2A_30UXC_20190101_0', satellite_name='sentinel-2a', cloud_coverage=0., area_coverage=100.,
+                 date=datetime(2019, 1, 1), thumbnail=None, polygon=GeoPolygon(box(0, 0, 1, 1), epsg=4326),
+                 links={'B04': {'href': f'{url}/B04.jp2', 'file:checksum': checksum}, 'B08': {'href': f'{url}/B08.jp2'}},
+                 epsg=32630)
+
+
+def test_download_writes_one_file_per_band(server, tmpdir):
+
+    downloads = Downloader(str(tmpdir), workers=2).download(_scene(server.url), ['B04', 'B08'])
+
+    assert sorted(os.path.basename(d.file_path) for d in downloads) == \
+        ['S2A_30UXC_20190101_0_B04.jp2', 'S2A_30UXC_20190101_0_B08.jp2']
+    for download in downloads:
+        with open(download.file_path, 'rb') as file:
+            assert file.read() == CONTENT
+    assert not tmpdir.listdir(lambda path: path.ext == '.part')
+
+
+def test_download_resumes_partial_file(server, tmpdir):
+
+    tmpdir.join('S2A_30UXC_20190101_0_B04.jp2.part').write_binary(CONTENT[:1000])
+
+    download = Downloader(str(tmpdir)).download(_scene(server.url), ['B04'])[0]
+
+    assert server.ranges == ['bytes=1000-']
+    assert download.transferred == len(CONTENT) - 1000
+    assert tmpdir.join('S2A_30UXC_20190101_0_B04.jp2').read_binary() == CONTENT
+
+
+def test_download_skips_complete_files(server, tmpdir):
+
+    downloader = Downloader(str(tmpdir))
+    downloader.download(_scene(server.url), ['B04'])
+    downloader.download(_scene(server.url), ['B04'])
+
+    assert len(server.ranges) == 1
+
+
+def test_download_raises_when_retries_end_on_unsatisfiable_range(server, tmpdir):
+
+    server.unsatisfiable, server.content_range = True, f'bytes */{len(CONTENT)}'
+    tmpdir.join('S2A_30UXC_20190101_0_B08.jp2.part').write_binary(CONTENT[:1000])
+
+    file_path = str(tmpdir.join('S2A_30UXC_20190101_0_B08.jp2'))
+    with raises(UserWarning):
+        Downloader(str(tmpdir), retries=0)._download_file(f'{server.url}/B08.jp2', file_path, None, tqdm(disable=True))
+
+    assert server.ranges == ['bytes=1000-']
+    assert not tmpdir.listdir()
+
+
+def test_download_accepts_sizeless_unsatisfiable_range_only_with_matching_checksum(server, tmpdir):
+
+    server.unsatisfiable = True
+    tmpdir.join('S2A_30UXC_20190101_0_B04.jp2.part').write_binary(CONTENT)
+    tmpdir.join('S2A_30UXC_20190101_0_B08.jp2.part').write_binary(os.urandom(len(CONTENT)))
+
+    downloads = Downloader(str(tmpdir)).download(_scene(server.url), ['B04', 'B08'])
+
+    assert len(downloads) == 2
+    assert sorted(server.ranges, key=str) == [None, f'bytes={len(CONTENT)}-', f'bytes={len(CONTENT)}-']
+    for download in downloads:
+        with open(download.file_path, 'rb') as file:
+            assert file.read() == CONTENT
+
+
+def _tif_scene(url: str) -> Scene:
+
+    return Scene(identity='S2A_30UXC_20190101_0', satellite_name='sentinel-2a', cloud_coverage=0., area_coverage=100.,
+                 date=datetime(2019, 1, 1), thumbnail=None, polygon=GeoPolygon(box(0, 0, 1, 1), epsg=4326),
+                 links={'B04': {'href': f'{url}/B04.tif'}, 'B08': {'href': f'{url}/B08.tif'}}, epsg=32630)
+
+
+def test_stream_resamples_bands_onto_the_finest_grid(tif_server):
+
+    image = Downloader(workers=2).stream(_tif_scene(tif_server.url), ['B04', 'B08'], resampling='near')
+
+    assert image.shape == (20, 20, 2)
+    assert image.geotransform.pixel_width == 10
+    assert image.no_data_value == 0
+    assert (image.pixels[:, :, 0] == np.arange(400).reshape(20, 20)).all()
+    assert (image.pixels[:, :, 1] == np.repeat(np.repeat(np.arange(100).reshape(10, 10) + 1, 2, 0), 2, 1)).all()
+
+
+def test_stream_clips_to_boundary(tif_server):
+
+    boundary = GeoPolygon(box(500050, 3999850, 500150, 3999950), epsg=32630)
+
+    image = Downloader().stream(_tif_scene(tif_server.url), ['B04'], boundary=boundary)
+
+    assert image.shape == (10, 10)
+    assert image.geotransform.upper_left_x == 500050 and image.geotransform.upper_left_y == 3999950
+    assert (image.pixels == np.arange(400).reshape(20, 20)[5:15, 5:15]).all()
+
+
+def test_stream_options_are_not_set_process_wide(tif_server, monkeypatch):
+
+    process_wide, set_config_option = [], gdal.SetConfigOption
+
+    def record(key: str, value: str):
+
+        process_wide.append(key)
+        set_config_option(key, value)
+
+    monkeypatch.setattr(gdal, 'SetConfigOption', record)
+
+    Downloader(stream_options={'GDAL_HTTP_MAX_RETRY': '7'}).stream(_tif_scene(tif_server.url), ['B04'])
+
+    assert not process_wide
+    assert all(gdal.GetThreadLocalConfigOption(key) is None for key in STREAM_OPTIONS)
@@ -0,0 +1,103 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pytest import fixture
+from shapely.geometry import box
+
+from eopy.cloud.searcher import Searcher
+from eopy.geometry import GeoPolygon
+
+SCENE_COUNT = 5
+
+
+def _feature(index: int) -> dict:
+
+    return {
+        'id': f'scene_{index}',
+        'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]},
+        'properties': {'eo:platform': 'sentinel-2a', 'eo:cloud_cover': 10., 'datetime': '2019-01-01T10:00:00.000Z'},
+        'assets': {}
+    }
+
+
+@fixture
+def server():
+
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            requests.append(body)
+            start = body.get('next', 0)
+            stop = min(start + body['limit'], SCENE_COUNT)
+
+            page = {'features': [_feature(i) for i in range(start, stop)], 'links': []}
+            if stop < SCENE_COUNT:
+                page['links'].append({'rel': 'next', 'href': self.server.url, 'method': 'POST', 'body': {'next': stop}, 'merge': True})
+
+            content = json.dumps(page).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    http_server = HTTPServer(('127.0.0.1', 0), Handler)
+    http_server.url = f'http://127.0.0.1:{http_server.server_port}/search'
+    http_server.requests = requests
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+
+
+@fixture
+def boundary():
+
+    return GeoPolygon(box(0, 0, 1, 1), epsg=4326)
+
+
+def test_search_follows_next_links(server, boundary):
+
+    scenes = list(Searcher(api_url=server.url, page_size=2).search(boundary))
+
+    assert [scene.identity for scene in scenes] == [f'scene_{i}' for i in range(SCENE_COUNT)]
+    assert len(server.requests) == 3
+
+
+def test_search_stops_at_limit(server, boundary):
+
+    scenes = list(Searcher(api_url=server.url, page_size=2).search(boundary, limit=3))
+
+    assert len(scenes) == 3
+    assert len(server.requests) == 2
+
+
+def test_search_reuses_cached_pages(server, boundary, tmpdir):
+
+    searcher = Searcher(api_url=server.url, page_size=2, cache_directory=str(tmpdir))
+    first = [scene.identity for scene in searcher.search(boundary)]
+    second = [scene.identity for scene in searcher.search(boundary)]
+
+    assert first == second
+    assert len(server.requests) == 3
+
+
+def test_search_refreshes_expired_cache(server, boundary, tmpdir):
+
+    searcher = Searcher(api_url=server.url, page_size=5, cache_directory=str(tmpdir), cache_ttl=0)
+    list(searcher.search(boundary))
+    list(searcher.search(boundary))
+
+    assert len(server.requests) == 2
+
+
+def test_area_coverage_is_percentage_of_search_boundary():
+
+    assert Searcher._calculate_area_coverage(box(0, 0, 1, 1), box(0, 0, 2, 2)) == 100.
+    assert Searcher._calculate_area_coverage(box(0, 0, 2, 2), box(0, 0, 1, 1)) == 25.
@@ -0,0 +1,111 @@
+import os
+import numpy as np
+from pytest import fixture
+
+from eopy.image import Geotransform, Image, ImageCache
+
+
+@fixture
+def image():
+
+    pixels = np.arange(300, dtype=np.float32).reshape(10, 10, 3)
+    return Image(pixels, Geotransform(500000, 4000000, 30, 30, 0, 0), 32633, -1.)
+
+
+@fixture
+def cache(tmpdir):
+
+    return ImageCache(str(tmpdir.join('cache')))
+
+
+def test_memoise_returns_cached_image_for_same_inputs(cache, image):
+
+    calls = []
+
+    @cache.memoise
+    def scale(image: Image, factor: float = 2.) -> Image:
+
+        calls.append(factor)
+        return image.apply(lambda pixels: pixels * factor)
+
+    first = scale(image, factor=3.)
+    second = scale(image, factor=3.)
+
+    assert calls == [3.]
+    assert np.array_equal(first.pixels, second.pixels)
+    assert second.geotransform.tuple == image.geotransform.tuple
+    assert second.epsg == 32633 and second.no_data_value == -1.
+
+    scale(image, factor=4.)
+    scale(image.apply(lambda pixels: pixels + 1), factor=3.)
+    assert calls == [3., 4., 3.]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_memoise_keys_files_on_modification_time(cache, tmpdir):
+
+    path = str(tmpdir.join('scene.txt'))
+    with open(path, 'w') as scene_file:
+        scene_file.write('1')
+
+    @cache.memoise
+    def load(file_path: str) -> Image:
+
+        with open(file_path) as scene_file:
+            return Image(np.full((2, 2), float(scene_file.read())))
+
+    assert load(path).pixels[0, 0] == 1
+    with open(path, 'w') as scene_file:
+        scene_file.write('22')
+
+    assert load(path).pixels[0, 0] == 22
+
+
+def test_memoise_keys_directories_on_their_files(cache, tmpdir):
+
+    product = tmpdir.mkdir('S1A.SAFE')
+    product.mkdir('measurement').join('vv.tiff').write('1')
+
+    @cache.memoise
+    def load(directory: str) -> Image:
+
+        with open(os.path.join(directory, 'measurement', 'vv.tiff')) as band_file:
+            return Image(np.full((2, 2), float(band_file.read())))
+
+    assert load(str(product)).pixels[0, 0] == 1
+    product.join('measurement', 'vv.tiff').write('22')
+
+    assert load(str(product)).pixels[0, 0] == 22
+    assert load(str(product)).pixels[0, 0] == 22
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entries_are_evicted(tmpdir, image):
+
+    cache = ImageCache(str(tmpdir.join('cache')), max_bytes=3 * image.pixels.nbytes)
+    for index in range(3):
+        cache.put(str(index), image)
+        os.utime(cache._paths(str(index))[0], (index, index))
+        os.utime(cache._paths(str(index))[1], (index, index))
+
+    cache.put('3', image)
+
+    assert cache.get('0') is None
+    assert cache.get('3') is not None
+
+
+def test_eviction_removes_whole_entries(tmpdir, image):
+
+    cache = ImageCache(str(tmpdir.join('cache')))
+    for index in range(3):
+        cache.put(str(index), image)
+        # get touches the metadata just after the pixels
+        os.utime(cache._paths(str(index))[0], (index, index))
+        os.utime(cache._paths(str(index))[1], (index + .5, index + .5))
+
+    # just over the limit, so deleting the pixels of the oldest entry alone would be enough
+    cache.max_bytes = sum(path.size() for path in tmpdir.join('cache').visit() if path.isfile()) - 10
+    cache.evict()
+
+    remaining = {str(path) for path in tmpdir.join('cache').visit() if path.isfile()}
+    assert remaining == {path for key in '12' for path in cache._paths(key)}
@@ -0,0 +1,84 @@
+import numpy as np
+from pytest import fixture, importorskip
+
+from shapely.geometry import Polygon
+
+from eopy.image import Geotransform, Image, Loader
+from eopy.geometry import GeoPolygon
+from eopy.processing import enhance
+
+da = importorskip('dask.array')
+
+
+@fixture
+def image():
+
+    random = np.random.RandomState(0)
+    return Image(random.uniform(1, 100, (60, 50, 3)).astype(np.float32))
+
+
+def test_chunked_operations_stay_lazy_and_match(image):
+
+    chunked = image.chunk((16, 16))
+    result = enhance.linear_stretch(chunked.smooth(2).add_index(0, 1), std=2)
+    expected = enhance.linear_stretch(image.smooth(2).add_index(0, 1), std=2)
+
+    assert isinstance(result.pixels, da.Array)
+    assert np.allclose(result.compute().pixels, expected.pixels, atol=1e-5)
+
+
+def test_chunked_stack(image):
+
+    chunked = image.chunk((16, 16))
+    stacked = Image.stack([chunked, chunked[:, :, 0]])
+
+    assert isinstance(stacked.pixels, da.Array)
+    assert stacked.band_count == 4
+    assert np.array_equal(stacked.compute().pixels[:, :, 3], image.pixels[:, :, 0])
+
+
+def test_chunked_percentile_stretch_is_close(image):
+
+    result = enhance.linear_stretch(image.chunk((16, 16)), percentile=2).compute()
+    expected = enhance.linear_stretch(image, percentile=2)
+
+    assert np.allclose(result.pixels, expected.pixels, atol=1e-2)
+
+
+def test_chunked_percentile_stretch_of_all_nan_band_is_nan(image):
+
+    pixels = image.pixels.copy()
+    pixels[:, :, 1] = np.nan
+
+    result = enhance.linear_stretch(Image(pixels).chunk((16, 16)), percentile=2).compute()
+
+    assert np.isnan(result.pixels[:, :, 1]).all()
+    assert not np.isnan(result.pixels[:, :, 0]).any()
+
+
+def test_chunked_load_clips_outside_extent_as_eager_load(image, tmpdir):
+
+    file_path = str(tmpdir.join('image.tif'))
+    pixels = (image.pixels * 100).astype(np.uint16)
+    Image(pixels, Geotransform(500000, 4000000, 10, 10, 0, 0), 32630).save(file_path)
+    extent = GeoPolygon(Polygon([(500100, 3999800), (500300, 3999800), (500100, 3999600)]), epsg=32630)
+
+    clipped = Loader().load(file_path, extent=extent, chunks=(16, 16))
+    eager = Loader().load(file_path, extent=extent)
+
+    assert isinstance(clipped.pixels, da.Array)
+    assert clipped.shape == eager.shape == (20, 20, 3)
+    assert clipped.pixels.dtype == np.uint16
+    computed = clipped.compute().pixels
+    assert (computed == 0).any()
+    assert np.array_equal(computed, eager.pixels)
+
+
+def test_chunked_loads_of_one_file_with_different_chunks_combine(image, tmpdir):
+
+    file_path = str(tmpdir.join('image.tif'))
+    image.save(file_path)
+
+    stacked = Image.stack([Loader().load(file_path, chunks=(16, 16)), Loader().load(file_path, chunks=(32, 32))])
+
+    assert np.array_equal(stacked.compute().pixels, np.dstack([image.pixels, image.pixels]))
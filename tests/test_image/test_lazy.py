@@ -0,0 +1,56 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.image import Image, LazyImage
+from eopy.processing import enhance
+
+
+@fixture
+def image():
+
+    random = np.random.RandomState(0)
+    return Image(random.uniform(1, 100, (50, 70, 3)))
+
+
+def test_lazy_chain_matches_eager(image):
+
+    lazy = (image.lazy() * 2 + 1).add_index(0, 1)
+    eager = Image(image.pixels * 2 + 1).add_index(0, 1)
+
+    assert lazy.shape == (50, 70, 4)
+    assert np.allclose(lazy.compute(tile_size=16, workers=2).pixels, eager.pixels)
+
+
+def test_lazy_statistics(image):
+
+    statistics = image.lazy().statistics(tile_size=16)
+
+    assert np.allclose(statistics['min'], image.pixels.min(axis=(0, 1)))
+    assert np.allclose(statistics['std'], image.pixels.std(axis=(0, 1)))
+
+
+def test_lazy_linear_stretch_matches_eager(image):
+
+    lazy = enhance.linear_stretch(image.lazy(), std=1).compute(tile_size=16)
+    eager = enhance.linear_stretch(image, std=1)
+
+    assert np.allclose(lazy.pixels, eager.pixels)
+
+
+def test_lazy_chain_is_not_run_until_needed(image):
+
+    reads = []
+
+    def read(x: int, y: int, width: int, height: int) -> np.ndarray:
+
+        reads.append((x, y, width, height))
+        return image.pixels[y:y + height, x:x + width]
+
+    lazy = LazyImage(read, image.height, image.width, image.geotransform, band_count=3, dtype=image.pixels.dtype)
+    chained = (lazy * 2 + lazy).select([0, 2]).astype(np.float32)
+
+    assert chained.shape == (50, 70, 2) and chained.dtype == np.float32
+    assert not reads
+
+    assert (lazy / 2).map(lambda block: block.astype(np.int16)).dtype == np.int16
+    assert reads == [(0, 0, 1, 1)]
@@ -0,0 +1,52 @@
+import pickle
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pytest import fixture
+
+from eopy.image import Geotransform, Image
+
+
+@fixture
+def image():
+
+    pixels = np.arange(200, dtype=np.float32).reshape(10, 10, 2)
+    return Image(pixels, Geotransform(500000, 4000000, 30, 30, 0, 0), 32633, -1.)
+
+
+def _band_sum(shared, band):
+
+    image = shared.open()
+    total = float(image.pixels[:, :, band].sum())
+    del image
+    shared.close()
+    return total
+
+
+def test_pickle_protocol_5_passes_pixels_out_of_band(image):
+
+    buffers = []
+    data = pickle.dumps(image, protocol=5, buffer_callback=buffers.append)
+    restored = pickle.loads(data, buffers=buffers)
+
+    assert len(buffers) == 1
+    assert len(data) < image.pixels.nbytes
+    assert np.shares_memory(restored.pixels, image.pixels)
+    assert restored.epsg == 32633
+    assert restored.no_data_value == -1.
+    assert restored.geotransform.tuple == image.geotransform.tuple
+
+
+def test_shared_image_is_read_by_workers_without_copies(image):
+
+    shared = image.share()
+    try:
+        assert len(pickle.dumps(shared)) < 1000
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            totals = list(executor.map(_band_sum, [shared, shared], [0, 1]))
+
+        assert totals == [float(image.pixels[:, :, 0].sum()), float(image.pixels[:, :, 1].sum())]
+        opened = shared.open()
+        assert opened.checksum() == image.checksum()
+        del opened
+    finally:
+        shared.unlink()
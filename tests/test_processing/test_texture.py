@@ -0,0 +1,59 @@
+import numpy as np
+from pytest import fixture
+from scipy import ndimage
+
+from eopy.image import Image
+from eopy.processing import texture
+
+
+@fixture
+def image():
+
+    random = np.random.RandomState(0)
+    pixels = ndimage.gaussian_filter(random.normal(size=(90, 70)), 2)
+    return Image(np.dstack([pixels, 2 * pixels]).astype(np.float32))
+
+
+def test_local_statistics_match_uniform_filter(image):
+
+    statistics = texture.local_statistics(image, window=5)
+    band = image.pixels[:, :, 0].astype(np.float64)
+    mean = ndimage.uniform_filter(band, 5)
+    variance = ndimage.uniform_filter(band ** 2, 5) - mean ** 2
+
+    assert statistics.band_count == 6
+    assert np.allclose(statistics.pixels[5:-5, 5:-5, 0], mean[5:-5, 5:-5], atol=1e-5)
+    assert np.allclose(statistics.pixels[5:-5, 5:-5, 1], variance[5:-5, 5:-5], atol=1e-5)
+
+
+def test_tiled_texture_matches_untiled(image):
+
+    assert np.array_equal(texture.local_statistics(image, tile_size=16).pixels, texture.local_statistics(image).pixels)
+    assert np.array_equal(texture.glcm(image, tile_size=16).pixels, texture.glcm(image).pixels)
+
+
+def test_glcm_matches_brute_force(image):
+
+    measures = texture.glcm(image, levels=8, window=5, offset=(1, 1)).pixels[40, 30, :3]
+
+    band = image.pixels[:, :, 0].astype(np.float64)
+    quantised = texture._quantise(band, *np.nanpercentile(band, (1, 99)), 8)
+    pairs = np.array([(quantised[y, x], quantised[y + 1, x + 1]) for y in range(38, 43) for x in range(28, 33)])
+    difference = pairs[:, 0] - pairs[:, 1]
+    _, counts = np.unique(pairs, axis=0, return_counts=True)
+    probability = counts / len(pairs)
+
+    assert np.isclose(measures[0], np.mean(difference ** 2))
+    assert np.isclose(measures[1], np.mean(1 / (1 + difference ** 2)))
+    assert np.isclose(measures[2], -np.sum(probability * np.log2(probability)), atol=1e-5)
+
+
+def test_texture_ignores_nan():
+
+    pixels = np.ones((20, 20), dtype=np.float32)
+    pixels[:5, :5] = np.nan
+
+    statistics = texture.local_statistics(Image(pixels), window=3)
+
+    assert np.isnan(statistics.pixels[1, 1, 0])
+    assert np.allclose(statistics.pixels[10, 10], [1, 0, 0])
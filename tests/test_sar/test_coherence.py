@@ -0,0 +1,56 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.sar.coherence import Coherence, CoherenceStack
+from eopy.sar.reader import SarReader
+
+
+@fixture
+def images():
+
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(40, 30)) + 1j * rng.normal(size=(40, 30))
+
+    return [(base + k * (rng.normal(size=base.shape) + 1j * rng.normal(size=base.shape))).astype(np.complex64) for k in range(4)]
+
+
+def test_pairs_respect_temporal_baseline():
+
+    stack = CoherenceStack(3, 3, max_temporal_baseline=1)
+
+    assert stack.pairs(4) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_pairs_respect_perpendicular_baseline():
+
+    stack = CoherenceStack(3, 3, perpendicular_baselines=[0, 50, 300], max_perpendicular_baseline=100)
+
+    assert stack.pairs(3) == [(0, 1)]
+
+
+def test_estimate_matches_window_coherence(images, tmp_path):
+
+    cube, matrix = CoherenceStack(5, 5).estimate(images, str(tmp_path / 'coherence.npy'), block_size=7)
+
+    master, slave = images[0][18:23, 13:18], images[1][18:23, 13:18]
+    expected = (master * np.conj(slave)).sum() / np.sqrt((np.abs(master) ** 2).sum() * (np.abs(slave) ** 2).sum())
+
+    assert cube.shape == (6, 40, 30)
+    assert np.isclose(cube[0, 20, 15], expected, atol=1e-5)
+    assert matrix.shape == (4, 4)
+    assert matrix[0, 1] > matrix[0, 3]
+
+
+def test_blockwise_coherence_matches_whole_image(images):
+
+    coherence = Coherence(5, 3)
+    model_phase = np.linspace(0, 3, 40 * 30).reshape(40, 30)
+    output = np.zeros((40, 30), dtype=np.complex64)
+
+    coherence.estimate_coherence_blocks(SarReader.from_array(images[0]), SarReader.from_array(images[1]), model_phase,
+                                        output, block_size=7)
+    whole = coherence.estimate_window_coherence(images[0], images[1], model_phase)
+    legacy = coherence.estimate_coherence(images[0], images[1], model_phase)
+
+    assert np.allclose(output, whole, atol=1e-5)
+    assert np.allclose(whole[3:-3, 2:-2], legacy[3:-3, 2:-2], atol=1e-5)
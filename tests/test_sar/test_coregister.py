@@ -0,0 +1,73 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.sar.coregister import Coregister
+
+
+@fixture
+def master():
+
+    return np.random.default_rng(0).random((160, 160)).astype(np.float32) + 1
+
+
+def test_normalised_cross_correlation_peaks_at_one_for_identical_windows(master):
+
+    ncc = Coregister.normalised_cross_correlation(master[20:52, 20:52], master[16:56, 16:56])
+
+    assert ncc.shape == (9, 9)
+    assert np.isclose(ncc[4, 4], 1.)
+
+
+def test_estimate_offsets_recovers_integer_shift(master):
+
+    slave = np.roll(master, shift=(3, -2), axis=(0, 1))
+    coregister = Coregister(window_size=32, search_size=6, spacing=(32, 32))
+
+    offsets = coregister.estimate_offsets(master, slave)
+
+    assert np.allclose(offsets.azimuth, 3, atol=0.1)
+    assert np.allclose(offsets.range, -2, atol=0.1)
+
+
+def test_fit_polynomial_reproduces_constant_offsets(master):
+
+    slave = np.roll(master, shift=(3, -2), axis=(0, 1))
+    coregister = Coregister(window_size=32, search_size=6, spacing=(32, 32))
+
+    polynomial = coregister.estimate_offsets(master, slave).fit_polynomial(degree=1)
+    azimuth, range_ = polynomial.evaluate(80, 80)
+
+    assert np.isclose(azimuth, 3, atol=0.1)
+    assert np.isclose(range_, -2, atol=0.1)
+
+
+def test_coregister_resamples_slave_onto_master(master):
+
+    slave = np.roll(master, shift=(3, -2), axis=(0, 1)).astype(np.complex64)
+    coregister = Coregister(window_size=32, search_size=6, spacing=(32, 32), degree=1)
+
+    resampled = coregister.coregister(master, slave, block_size=50)
+
+    assert resampled.dtype == np.complex64
+    assert np.allclose(resampled[10:-10, 10:-10], master[10:-10, 10:-10], atol=1e-2)
+
+
+def test_dense_offsets_use_coregister_threshold_and_fill_once(master, monkeypatch):
+
+    from scipy import ndimage
+
+    slave = np.roll(master, shift=(3, -2), axis=(0, 1))
+    offsets = Coregister(window_size=32, search_size=6, spacing=(32, 32), threshold=0.5).estimate_offsets(master, slave)
+    offsets.peak[0, 0] = 0.4
+    offsets.azimuth[0, 0] = 100.
+
+    calls = []
+    distance_transform = ndimage.distance_transform_edt
+    monkeypatch.setattr(ndimage, 'distance_transform_edt', lambda *args, **kwargs: calls.append(1) or distance_transform(*args, **kwargs))
+
+    for line in range(0, 160, 40):
+        azimuth, _ = offsets.evaluate(np.arange(line, line + 40)[:, None], np.arange(160)[None, :])
+        assert np.allclose(azimuth, 3, atol=0.1)
+
+    assert offsets.threshold == 0.5
+    assert len(calls) == 1
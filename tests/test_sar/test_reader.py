@@ -0,0 +1,57 @@
+import numpy as np
+from pytest import fixture, raises
+
+from eopy.sar.reader import SarReader
+
+
+@fixture
+def slc():
+
+    return (np.arange(20 * 4).reshape(20, 4) * (1 + 1j)).astype(np.complex64)
+
+
+def test_from_slc_memory_maps_complex_binary(slc, tmp_path):
+
+    file_path = str(tmp_path / 'image.slc')
+    slc.tofile(file_path)
+
+    reader = SarReader.from_slc(file_path, samples=4)
+
+    assert reader.shape == (20, 4)
+    assert np.array_equal(reader.read(5, 10), slc[5:10])
+
+
+def test_from_raw_applies_bias_and_skips_line_headers(tmp_path):
+
+    file_path = str(tmp_path / 'image.raw')
+    records = np.zeros((3, 2 + 4), dtype=np.uint8)
+    records[:, 2:] = [16, 17, 18, 19]
+    records.tofile(file_path)
+
+    reader = SarReader.from_raw(file_path, samples=2, line_header_bytes=2, bias=16)
+
+    assert reader.shape == (3, 2)
+    assert np.array_equal(reader.read(0, 1), [[0 + 1j, 2 + 3j]])
+
+
+def test_blocks_cover_image_with_overlap(slc):
+
+    reader = SarReader.from_array(slc)
+    blocks = list(reader.blocks(block_size=8, overlap=2))
+
+    assert [(block.start, block.stop) for block in blocks] == [(0, 8), (8, 16), (16, 20)]
+    assert blocks[1].pixels.shape[0] == 12
+    assert np.array_equal(np.vstack([block.crop(block.pixels) for block in blocks]), slc)
+
+
+def test_getitem_reads_window(slc):
+
+    reader = SarReader.from_array(slc)
+
+    assert np.array_equal(reader[2:6, 1:3], slc[2:6, 1:3])
+
+
+def test_getitem_raises_for_strided_slice(slc):
+
+    with raises(UserWarning):
+        _ = SarReader.from_array(slc)[::2]
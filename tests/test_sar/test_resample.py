@@ -0,0 +1,49 @@
+import numpy as np
+from pytest import fixture, raises
+
+from eopy.sar.offsets import OffsetPolynomial
+from eopy.sar.resample import Resampler
+
+
+@fixture
+def slave():
+
+    y, x = np.mgrid[0:40, 0:30]
+    return (np.exp(1j * 0.1 * x) * (1 + 0.05 * y)).astype(np.complex64)
+
+
+def constant_offsets(azimuth: float, range_: float, shape) -> OffsetPolynomial:
+
+    return OffsetPolynomial(np.array([azimuth]), np.array([range_]), degree=0, shape=shape)
+
+
+def test_kernel_table_preserves_constant_signal():
+
+    resampler = Resampler(kernel='sinc', kernel_size=8, subsamples=16)
+
+    assert np.allclose(resampler._table.sum(axis=1), 1)
+
+
+def test_resample_with_zero_offset_is_identity(slave):
+
+    output = np.zeros(slave.shape, dtype=np.complex64)
+
+    Resampler(workers=2).resample(slave, constant_offsets(0, 0, slave.shape), output, block_size=7)
+
+    assert np.allclose(output, slave, atol=1e-5)
+
+
+def test_resample_integer_offset_shifts_image(slave):
+
+    output = np.zeros(slave.shape, dtype=np.complex64)
+
+    Resampler(kernel='cubic').resample(slave, constant_offsets(2, 1, slave.shape), output)
+
+    assert np.allclose(output[:-2, :-1], slave[2:, 1:], atol=1e-5)
+    assert np.all(output[-2:] == 0)
+
+
+def test_unrecognised_kernel_raises():
+
+    with raises(UserWarning):
+        _ = Resampler(kernel='lanczos')
@@ -0,0 +1,61 @@
+import numpy as np
+from pytest import fixture
+
+from eopy.sar.unwrap import Unwrapper
+
+
+@fixture
+def phase():
+
+    y, x = np.mgrid[0:60, 0:80]
+    return (0.4 * x + 0.3 * y).astype(np.float32)
+
+
+def test_unwrap_phase_recovers_ramp(phase):
+
+    unwrapped = Unwrapper().unwrap_phase(np.angle(np.exp(1j * phase)))
+
+    assert np.allclose(unwrapped - unwrapped[0, 0], phase - phase[0, 0], atol=1e-4)
+
+
+def test_tiled_unwrap_phase_stitches_tiles(phase):
+
+    unwrapped = Unwrapper(tile_size=32, overlap=8, workers=1).unwrap_phase(np.angle(np.exp(1j * phase)))
+
+    assert np.allclose(unwrapped - unwrapped[0, 0], phase - phase[0, 0], atol=1e-4)
+
+
+def test_unwrap_phase_leaves_nan_pixels(phase):
+
+    wrapped = np.angle(np.exp(1j * phase))
+    wrapped[10:20, 10:20] = np.nan
+
+    unwrapped = Unwrapper().unwrap_phase(wrapped)
+
+    assert np.isnan(unwrapped).sum() == 100
+
+
+def test_residues_detects_vortex():
+
+    y, x = np.mgrid[0:6, 0:6]
+    vortex = np.arctan2(y - 2.5, x - 2.5)
+
+    residual_cycles = Unwrapper.residues(vortex)['residual_cycles']
+
+    assert np.abs(residual_cycles).sum() == 1
+    assert abs(residual_cycles[2, 2]) == 1
+
+
+def test_quality_guided_unwraps_each_disconnected_region(phase):
+
+    wrapped = np.angle(np.exp(1j * phase)).astype(np.float32)
+    wrapped[:, 40] = np.nan
+    quality = np.random.default_rng(0).random(phase.shape).astype(np.float32)
+
+    unwrapped = Unwrapper.quality_guided(wrapped, quality, levels=16)
+
+    assert unwrapped.dtype == np.float32
+    assert np.isnan(unwrapped[:, 40]).all()
+    for region in (np.s_[:, :40], np.s_[:, 41:]):
+        difference = unwrapped[region] - phase[region]
+        assert np.allclose(difference, difference[0, 0], atol=1e-4)
@@ -0,0 +1,87 @@
+import json
+import os
+import time
+
+from eopy.tools.batch import BatchRunner
+
+
+def pipeline(item, stages):
+
+    with stages('load'):
+        time.sleep(0.01)
+    with stages('process'):
+        if item.endswith('bad'):
+            raise ValueError('bad scene')
+        if item == 'crash':
+            os._exit(1)  # as a worker killed for running out of memory
+        value = len(item)
+
+    return value
+
+
+def process_id(item, stages):
+
+    if item == 'crash':
+        os._exit(1)
+    time.sleep(0.01)
+
+    return os.getpid()
+
+
+def test_batch_runner_times_stages_and_records_failures(tmpdir):
+
+    checkpoint = str(tmpdir.join('checkpoint.jsonl'))
+    runner = BatchRunner(pipeline, checkpoint, workers=2, key=str)
+
+    report = runner.run(['a', 'bb', 'bad'])
+
+    assert report.results == {'a': 1, 'bb': 2}
+    assert list(report.failed) == ['bad']
+    assert set(report.timings.columns) == {'load', 'process', 'total'}
+    assert (report.summary().loc['load', 'mean']) >= 0.01
+    with open(checkpoint) as checkpoint_file:
+        records = [json.loads(line) for line in checkpoint_file]
+    assert {record['key']: record['status'] for record in records} == {'a': 'completed', 'bb': 'completed', 'bad': 'failed'}
+    error = [record for record in records if record['key'] == 'bad'][0]['error']
+    assert error.startswith('Traceback') and 'bad scene' in error
+
+
+def test_batch_runner_resumes_from_checkpoint(tmpdir):
+
+    checkpoint = str(tmpdir.join('checkpoint.jsonl'))
+    BatchRunner(pipeline, checkpoint, workers=2, key=str).run(['a', 'bad'])
+    with open(checkpoint, 'a') as checkpoint_file:
+        checkpoint_file.write('{"key": "cc", "sta')  # interrupted mid write
+
+    report = BatchRunner(pipeline, checkpoint, workers=2, key=str).run(['a', 'bad', 'cc'])
+
+    assert report.skipped == ['a']
+    assert report.results == {'cc': 2}
+    assert list(report.failed) == ['bad']
+
+    assert BatchRunner(pipeline, checkpoint, key=str).run(['a', 'cc']).skipped == ['a', 'cc']
+
+
+def test_batch_runner_recovers_from_a_dying_worker(tmpdir):
+
+    checkpoint = str(tmpdir.join('checkpoint.jsonl'))
+    items = ['a', 'bb', 'crash', 'ccc', 'dddd', 'bad']
+
+    report = BatchRunner(pipeline, checkpoint, workers=2, key=str).run(items)
+
+    assert report.results == {'a': 1, 'bb': 2, 'ccc': 3, 'dddd': 4}
+    assert sorted(report.failed) == ['bad', 'crash']
+    assert 'BrokenProcessPool' in report.failed['crash'] and report.failed['crash'].startswith('Traceback')
+    assert sorted(BatchRunner(pipeline, checkpoint, key=str).completed()) == ['a', 'bb', 'ccc', 'dddd']
+
+
+def test_batch_runner_keeps_its_workers_after_a_dying_worker(tmpdir):
+
+    items = ['crash'] + [str(index) for index in range(20)]
+
+    report = BatchRunner(process_id, workers=2, key=str).run(items)
+
+    assert list(report.failed) == ['crash']
+    assert len(report.results) == 20
+    # a few pools of two workers rather than one new process per item
+    assert len(set(report.results.values())) <= 6
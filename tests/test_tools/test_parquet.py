@@ -0,0 +1,37 @@
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import box
+
+from eopy.tools import gis
+
+
+def test_parquet_round_trip_expands_features(tmpdir):
+
+    table = gpd.GeoDataFrame({'segment': [1, 2], 'features': [np.array([0.5, 1.]), np.array([2., 3.])]},
+                             geometry=[box(0, 0, 1, 1), box(1, 1, 2, 2)], crs='epsg:4326')
+    file_path = str(tmpdir.join('segments.parquet'))
+
+    gis.write_parquet(table, file_path)
+    loaded = gis.read_parquet(file_path)
+
+    assert isinstance(loaded, gpd.GeoDataFrame)
+    assert list(gpd.read_parquet(file_path).columns) == ['segment', 'geometry', 'band_0', 'band_1']
+    assert gpd.read_parquet(file_path).band_0.dtype == np.float32
+    assert loaded.geometry.name == 'geometry'
+    assert loaded.crs.to_epsg() == 4326
+    assert np.allclose(np.stack(loaded.features.to_numpy()), [[0.5, 1.], [2., 3.]])
+    assert loaded.geometry.equals(table.geometry)
+
+
+def test_parquet_round_trip_of_plain_table(tmpdir):
+
+    table = pd.DataFrame({'class': ['water', 'forest'], 'features': [np.array([1., 2.]), np.array([3., 4.])]})
+    file_path = str(tmpdir.join('samples.parquet'))
+
+    gis.write_parquet(table, file_path)
+    loaded = gis.read_parquet(file_path)
+
+    assert not isinstance(loaded, gpd.GeoDataFrame)
+    assert loaded['class'].tolist() == ['water', 'forest']
+    assert np.allclose(np.stack(loaded.features.to_numpy()), [[1., 2.], [3., 4.]])
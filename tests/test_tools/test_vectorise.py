@@ -0,0 +1,54 @@
+import numpy as np
+
+from eopy.tools import gis
+
+
+def test_vectorise_image_merges_polygons_across_tiles():
+
+    image = np.zeros((20, 20), dtype=np.int32)
+    image[2:18, 2:18] = 1
+    image[8:12, 8:12] = 2
+
+    whole = gis.vectorise_image(image, tile_size=64)
+    tiled = gis.vectorise_image(image, tile_size=5, workers=1)
+
+    assert len(tiled) == len(whole) == 2
+    assert sorted(tiled.area) == sorted(whole.area)
+    assert set(tiled.value) == {1, 2}
+
+
+def test_vectorise_image_joins_diagonal_neighbours_across_seams_when_8_connected():
+
+    image = np.zeros((10, 10), dtype=np.int32)
+    image[4, 4] = image[5, 5] = 1  # across the corner where four tiles meet
+    image[1, 4] = image[2, 5] = 2  # across a vertical seam
+
+    eight_whole = gis.vectorise_image(image, tile_size=64, connectedness=8)
+    eight_tiled = gis.vectorise_image(image, tile_size=5, connectedness=8, workers=1)
+    four_tiled = gis.vectorise_image(image, tile_size=5, connectedness=4, workers=1)
+
+    assert sorted(eight_tiled.value) == sorted(eight_whole.value) == [1, 2]
+    assert np.allclose(eight_tiled.sort_values('value').area, [2, 2])
+    assert sorted(four_tiled.value) == [1, 1, 2, 2]
+
+
+def test_rasterise_burns_values_in_order():
+
+    from shapely.geometry import box
+
+    raster = gis.rasterise([box(1, 1, 6, 6), box(4, 4, 8, 8)], [1, 2], (10, 10))
+
+    assert raster.dtype == np.int32
+    assert raster[2, 2] == 1 and raster[5, 5] == 2 and raster[9, 9] == 0
+
+
+def test_rasterise_holes_keep_earlier_polygons():
+
+    from shapely.geometry import Polygon, box
+
+    ring = Polygon(box(0, 0, 10, 10).exterior.coords, [box(3, 3, 7, 7).exterior.coords])
+    raster = gis.rasterise([box(4, 4, 6, 6), ring], [1, 2], (12, 12), fill=0)
+
+    assert raster[1, 1] == 2
+    assert raster[5, 5] == 1
+    assert raster[11, 11] == 0